@@ -0,0 +1,65 @@
+'''Compare the run time of the DPSS solvers over a range of window lengths
+'''
+from argparse import ArgumentParser
+from sys import exit
+from timeit import repeat
+
+import numpy as np
+
+from src.spectral.transforms import FIND_TAPERS, dpss_windows
+
+WINDOW_LENGTHS = [30, 75, 150, 375, 750, 3000, 15000, 50000, 100000]
+
+
+def time_dpss_windows(n_time_samples_per_window, time_halfbandwidth_product,
+                      n_tapers, method, n_repeats=3):
+    '''Best time in seconds of `n_repeats` uncached calls to
+    `dpss_windows`.'''
+    def _dpss_windows():
+        return dpss_windows(
+            n_time_samples_per_window, time_halfbandwidth_product,
+            n_tapers, is_low_bias=False, is_cached=False, method=method)
+    return min(repeat(_dpss_windows, number=1, repeat=n_repeats))
+
+
+def max_taper_difference(n_time_samples_per_window,
+                         time_halfbandwidth_product, n_tapers):
+    tapers = [dpss_windows(n_time_samples_per_window,
+                           time_halfbandwidth_product, n_tapers,
+                           is_low_bias=False, is_cached=False,
+                           method=method)[0]
+              for method in FIND_TAPERS]
+    return np.max(np.abs(tapers[0] - tapers[1]))
+
+
+def get_command_line_arguments():
+    parser = ArgumentParser()
+    parser.add_argument('--time_halfbandwidth_product', type=float,
+                        default=3)
+    parser.add_argument('--n_tapers', type=int, default=5)
+    parser.add_argument('--n_repeats', type=int, default=3)
+    return parser.parse_args()
+
+
+def main():
+    args = get_command_line_arguments()
+    header = '{0:>10}'.format('n_samples') + ''.join(
+        '{0:>20}'.format(method) for method in FIND_TAPERS) + (
+        '{0:>10}{1:>12}'.format('speedup', 'max_diff'))
+    print(header)
+    for n_time_samples_per_window in WINDOW_LENGTHS:
+        run_times = [time_dpss_windows(
+            n_time_samples_per_window, args.time_halfbandwidth_product,
+            args.n_tapers, method, n_repeats=args.n_repeats)
+            for method in FIND_TAPERS]
+        difference = max_taper_difference(
+            n_time_samples_per_window, args.time_halfbandwidth_product,
+            args.n_tapers)
+        print('{0:>10}'.format(n_time_samples_per_window) + ''.join(
+            '{0:>19.4f}s'.format(run_time) for run_time in run_times) +
+            '{0:>9.1f}x{1:>12.1e}'.format(
+                run_times[1] / run_times[0], difference))
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -23,9 +23,10 @@ def queue_job(python_cmd, directives=None, log_file='log.log',
 
 
 def main():
-    # Set the maximum number of threads for openBLAS to use.
+    # Set the maximum number of threads for openBLAS and the FFTs to use.
     NUM_THREADS = 16
     environ['OPENBLAS_NUM_THREADS'] = str(NUM_THREADS)
+    environ['SPECTRAL_FFT_WORKERS'] = str(NUM_THREADS)
     log_directory = join(getcwd(), 'logs')
     makedirs(log_directory,  exist_ok=True)
 
@@ -33,7 +34,7 @@ def main():
     directives = ' '.join(
         ['-l h_rt=3:00:00', '-pe omp {0}'.format(NUM_THREADS),
          '-P braincom', '-notify', '-l mem_total=125G',
-         '-v OPENBLAS_NUM_THREADS'])
+         '-v OPENBLAS_NUM_THREADS,SPECTRAL_FFT_WORKERS'])
 
     epoch_info = make_epochs_dataframe(ANIMALS, range(1, N_DAYS + 1))
     epoch_keys = epoch_info[(epoch_info.type == 'run') & (
@@ -151,19 +151,38 @@ def save_power(
 
 def save_coherence(
         c, tetrode_info, epoch_key,
-        multitaper_parameter_name, group_name):
+        multitaper_parameter_name, group_name, is_packed=False):
+    '''If `is_packed`, only the tetrode pairs above the diagonal are saved
+    along a `tetrode_pair` dimension.'''
     logger.info('...saving coherence')
-    dimension_names = ['time', 'frequency', 'tetrode1', 'tetrode2']
-    data_vars = {
-     'coherence_magnitude': (dimension_names, c.coherence_magnitude())}
     coordinates = {
         'time': _center_time(c.time),
         'frequency': c.frequencies + np.diff(c.frequencies)[0] / 2,
-        'tetrode1': tetrode_info.tetrode_id.values,
-        'tetrode2': tetrode_info.tetrode_id.values,
-        'brain_area1': ('tetrode1', tetrode_info.area.tolist()),
-        'brain_area2': ('tetrode2', tetrode_info.area.tolist()),
     }
+    if is_packed:
+        dimension_names = ['time', 'frequency', 'tetrode_pair']
+        tetrode1, tetrode2 = np.triu_indices(len(tetrode_info), k=1)
+        coordinates.update({
+            'tetrode1': ('tetrode_pair',
+                         tetrode_info.tetrode_id.values[tetrode1]),
+            'tetrode2': ('tetrode_pair',
+                         tetrode_info.tetrode_id.values[tetrode2]),
+            'brain_area1': ('tetrode_pair',
+                            tetrode_info.area.values[tetrode1].tolist()),
+            'brain_area2': ('tetrode_pair',
+                            tetrode_info.area.values[tetrode2].tolist()),
+        })
+    else:
+        dimension_names = ['time', 'frequency', 'tetrode1', 'tetrode2']
+        coordinates.update({
+            'tetrode1': tetrode_info.tetrode_id.values,
+            'tetrode2': tetrode_info.tetrode_id.values,
+            'brain_area1': ('tetrode1', tetrode_info.area.tolist()),
+            'brain_area2': ('tetrode2', tetrode_info.area.tolist()),
+        })
+    data_vars = {
+        'coherence_magnitude': (
+            dimension_names, c.coherence_magnitude(is_packed=is_packed))}
     group = '{0}/{1}/coherence_magnitude'.format(
         multitaper_parameter_name, group_name)
     save_xarray(
@@ -215,16 +234,8 @@ def save_canonical_coherence(
 def save_group_delay(c, m, FREQUENCY_BANDS, tetrode_info, epoch_key,
                      multitaper_parameter_name, group_name):
     logger.info('...saving group delay')
-    n_bands = len(FREQUENCY_BANDS)
-    delay, slope, r_value = (
-        np.zeros((c.time.size, n_bands, m.n_signals, m.n_signals)),) * 3
-
-    for band_ind, frequency_band in enumerate(FREQUENCY_BANDS):
-        (delay[:, band_ind, ...],
-         slope[:, band_ind, ...],
-         r_value[:, band_ind, ...]) = c.group_delay(
-            FREQUENCY_BANDS[frequency_band],
-            frequency_resolution=m.frequency_resolution)
+    delay, slope, r_value = c.group_delay_by_band(
+        FREQUENCY_BANDS, frequency_resolution=m.frequency_resolution)
 
     dimension_names = ['time', 'frequency_band', 'tetrode1', 'tetrode2']
     data_vars = {
@@ -53,10 +53,10 @@ def multitaper_Kay_method(lfps, minimum_duration=0.015,
         time_halfbandwidth_product=1,
         time_window_duration=0.020,
         time_window_step=0.020,
-        start_time=0)
+        start_time=0,
+        frequencies_of_interest=[150, 250])
     c = Connectivity.from_multitaper(m)
-    ripple_band_index = (c.frequencies >= 150) & (c.frequencies <= 250)
-    ripple_power = np.mean(c.power()[..., ripple_band_index, :], axis=-2)
+    ripple_power = np.mean(c.power(), axis=-2)
     return _get_candidate_ripples_Kay(
         ripple_power, is_multitaper=True,
         zscore_threshold=zscore_threshold,
@@ -72,10 +72,10 @@ def mulititaper_Karlsson_method(lfps, minimum_duration=0.015,
         time_halfbandwidth_product=1,
         time_window_duration=0.020,
         time_window_step=0.020,
-        start_time=0)
+        start_time=0,
+        frequencies_of_interest=[150, 250])
     c = Connectivity.from_multitaper(m)
-    ripple_band_index = (c.frequencies >= 150) & (c.frequencies <= 250)
-    ripple_power = np.mean(c.power()[..., ripple_band_index, :], axis=-2)
+    ripple_power = np.mean(c.power(), axis=-2)
     return _get_candidate_ripples_Karlsson(
         ripple_power, minimum_duration=minimum_duration,
         zscore_threshold=zscore_threshold)
@@ -0,0 +1,101 @@
+'''Content-addressed storage of arrays on disk.
+
+Arrays are saved as .npy files named by a hash of everything they were
+computed from, so an array computed once can be loaded instead of
+computed again by later runs with the same inputs. A changed input gives
+a new key, so stored arrays never have to be invalidated.
+
+'''
+from hashlib import sha256
+from logging import getLogger
+from os import makedirs, remove, replace
+from os.path import exists, join
+from tempfile import NamedTemporaryFile
+
+import numpy as np
+
+logger = getLogger(__name__)
+
+# Increment when a change in the code changes the stored arrays so that
+# arrays stored by older versions are no longer used.
+STORE_VERSION = 1
+
+
+def hash_array(array):
+    '''Hexadecimal SHA-256 digest of the dtype, shape and values of
+    `array`.
+
+    Large arrays are hashed one block along the first axis at a time, so
+    non-contiguous arrays are not copied whole.
+
+    '''
+    array = np.asarray(array)
+    digest = sha256('{0}{1}'.format(array.dtype.str, array.shape).encode())
+    for block in (array if array.ndim > 1 else [array]):
+        digest.update(np.ascontiguousarray(block).data)
+    return digest.hexdigest()
+
+
+def get_key(**parameters):
+    '''Key of an array computed from `parameters`.
+
+    Parameters
+    ----------
+    parameters : str, int, float, bool or None
+        Everything the array depends on. Pass arrays as `hash_array`
+        digests.
+
+    Returns
+    -------
+    key : str
+
+    '''
+    description = repr((STORE_VERSION, sorted(parameters.items())))
+    return sha256(description.encode()).hexdigest()
+
+
+class ArrayStore(object):
+    '''Stores arrays in `directory` by key.
+
+    Files are written to a temporary name and then renamed, so an
+    interrupted run never leaves a partially written array behind.
+
+    Attributes
+    ----------
+    directory : str
+
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        makedirs(directory, exist_ok=True)
+
+    def _get_path(self, key):
+        return join(self.directory, '{0}.npy'.format(key))
+
+    def __contains__(self, key):
+        return exists(self._get_path(key))
+
+    def load(self, key):
+        return np.load(self._get_path(key), allow_pickle=False)
+
+    def save(self, key, array):
+        with NamedTemporaryFile(dir=self.directory, suffix='.npy',
+                                delete=False) as file:
+            try:
+                np.save(file, array, allow_pickle=False)
+            except BaseException:
+                file.close()
+                remove(file.name)
+                raise
+        replace(file.name, self._get_path(key))
+
+    def load_or_compute(self, key, compute):
+        '''Loads the array stored under `key` or, if there is none, stores
+        and returns the result of `compute()`.'''
+        if key in self:
+            logger.debug('Loading {0} from {1}'.format(key, self.directory))
+            return self.load(key)
+        array = compute()
+        self.save(key, array)
+        return array
@@ -1,17 +1,34 @@
+from collections import OrderedDict
+from collections.abc import Mapping
+from contextlib import contextmanager
 from functools import partial, wraps
 from inspect import signature
 from itertools import combinations
+from logging import getLogger
+from types import MappingProxyType
 
 import numpy as np
-from scipy.ndimage import label
-from scipy.stats.mstats import linregress
-from scipy.fftpack import ifft
+from numba import jit
 
+from .array_store import ArrayStore, get_key, hash_array
+from .fft_backend import fft, get_workers, ifft
 from .minimum_phase_decomposition import minimum_phase_decomposition
 from .statistics import (adjust_for_multiple_comparisons,
                          fisher_z_transform,
                          get_normal_distribution_p_values, coherence_bias)
 
+logger = getLogger(__name__)
+
+MEMORY_BUDGET = 2 ** 28  # bytes
+MAX_CACHED_MEASURES = 16
+MAX_MVAR_ORDER = 30
+
+PHASE_SYNCHRONY_MEASURES = (
+    'phase_locking_value', 'phase_lag_index', 'weighted_phase_lag_index',
+    'debiased_squared_phase_lag_index',
+    'debiased_squared_weighted_phase_lag_index',
+    'pairwise_phase_consistency')
+
 EXPECTATION = {
     'trials': partial(np.mean, axis=1),
     'tapers': partial(np.mean, axis=2),
@@ -33,29 +50,223 @@ class lazyproperty:
     def __get__(self, instance, cls):
         if instance is None:
             return self
-        else:
+        intermediates = vars(instance).get('intermediates')
+        if intermediates is None:
             value = self.func(instance)
             setattr(instance, self.func.__name__, value)
             return value
+        try:
+            return intermediates[self.func.__name__]
+        except KeyError:
+            value = self.func(instance)
+            intermediates[self.func.__name__] = value
+            return value
+
+
+def stored(*parameter_names):
+    '''Decorator that loads an intermediate from `Connectivity.store`
+    instead of computing it, and stores it when it has to be computed.
+
+    The key is the hash of the fourier coefficients, the name of the
+    intermediate and the values of the instance attributes
+    `parameter_names`. Without a store the intermediate is always
+    computed.
+
+    '''
+    def decorator(compute_intermediate):
+        @wraps(compute_intermediate)
+        def wrapper(self):
+            if self.store is None:
+                return compute_intermediate(self)
+            key = get_key(
+                name=compute_intermediate.__name__,
+                fourier_coefficients=self._fourier_coefficients_hash,
+                **{name: getattr(self, name) for name in parameter_names})
+            return self.store.load_or_compute(
+                key, partial(compute_intermediate, self))
+        return wrapper
+    return decorator
+
+
+class IntermediateCache(object):
+    '''Stores the lazily computed intermediates of a `Connectivity`
+    instance (cross spectral matrices, minimum phase factor, transfer
+    function, ...) and the cached results of its measures, keyed by
+    (measure name, arguments), within a memory budget.
+
+    When storing an intermediate brings the total size over
+    `memory_budget`, the least recently used intermediates are evicted
+    and computed again the next time they are needed. Pinned
+    intermediates are never evicted. An intermediate that does not fit
+    in the budget on its own is returned but not stored.
+
+    Attributes
+    ----------
+    memory_budget : int or None
+        Maximum number of bytes to keep. If None, intermediates are kept
+        until they are removed with `clear`.
+
+    '''
+
+    def __init__(self, memory_budget=None):
+        self.memory_budget = memory_budget
+        self._intermediates = OrderedDict()
+        self._pinned = set()
+
+    def __contains__(self, name):
+        return name in self._intermediates
+
+    def __iter__(self):
+        return iter(list(self._intermediates))
+
+    def __getitem__(self, name):
+        value = self._intermediates[name]
+        self._intermediates.move_to_end(name)
+        return value
+
+    def __setitem__(self, name, value):
+        self._intermediates[name] = value
+        self._intermediates.move_to_end(name)
+        self._evict(keep=name)
+
+    def __delitem__(self, name):
+        del self._intermediates[name]
+
+    @property
+    def nbytes(self):
+        '''Total size of the stored intermediates in bytes.'''
+        return sum(self.resident_sizes().values())
+
+    def resident_sizes(self):
+        '''Size in bytes of each stored intermediate, from least to most
+        recently used.'''
+        return OrderedDict(
+            (name, _get_nbytes(value))
+            for name, value in self._intermediates.items())
+
+    def pin(self, *names):
+        '''Keeps the intermediates `names`, computed now or later, until
+        they are unpinned.'''
+        self._pinned.update(names)
+
+    def unpin(self, *names):
+        self._pinned.difference_update(names)
+        self._evict()
+
+    @contextmanager
+    def pinned(self, *names):
+        '''Pins the intermediates `names` that are not already pinned for
+        the duration of a `with` block.'''
+        names = set(names) - self._pinned
+        self.pin(*names)
+        try:
+            yield self
+        finally:
+            self.unpin(*names)
+
+    def clear(self):
+        '''Removes all intermediates that are not pinned.'''
+        for name in list(self._intermediates):
+            if name not in self._pinned:
+                del self._intermediates[name]
+
+    def _evict(self, keep=None):
+        '''Evicts the least recently used intermediates, other than `keep`
+        and the pinned ones, until the total size is within the memory
+        budget.'''
+        if self.memory_budget is None:
+            return
+        sizes = self.resident_sizes()
+        pinned_size = sum(size for name, size in sizes.items()
+                          if name in self._pinned)
+        if (keep is not None and keep not in self._pinned and
+                pinned_size + sizes[keep] > self.memory_budget):
+            logger.debug('Not storing {0} ({1} bytes), it does not fit in '
+                         'the memory budget'.format(keep, sizes[keep]))
+            del self._intermediates[keep]
+            del sizes[keep]
+        total_size = sum(sizes.values())
+        for name, size in sizes.items():
+            if total_size <= self.memory_budget:
+                break
+            if name in self._pinned or name == keep:
+                continue
+            logger.debug('Evicting {0} ({1} bytes)'.format(name, size))
+            del self._intermediates[name]
+            total_size -= size
 
 
 def non_negative_frequencies(axis):
-    '''Decorator that removes the negative frequencies.'''
+    '''Decorator that removes the negative frequencies.
+
+    Keeps the first (n_fft_samples + 1) // 2 frequencies, so measures
+    computed from one-sided (real-input FFT) coefficients have the same
+    frequency axis as those computed from two-sided coefficients.
+    Band-limited coefficients only contain non-negative frequencies and
+    are left as they are. Measures called with `is_packed=True` or
+    `signal_pairs`, by keyword or by position, have one signal pair axis
+    in place of the two signal axes, so the frequency axis is one closer
+    to the end.
+
+    '''
     def decorator(connectivity_measure):
+        measure_signature = signature(connectivity_measure)
+
         @wraps(connectivity_measure)
-        def wrapper(*args, **kwargs):
-            measure = connectivity_measure(*args, **kwargs)
-            if measure is not None:
-                n_frequencies = measure.shape[axis]
-                non_neg_index = np.arange(0, (n_frequencies + 1) // 2)
-                return np.take(measure, indices=non_neg_index, axis=axis)
-            else:
-                return None
+        def wrapper(self, *args, **kwargs):
+            measure = connectivity_measure(self, *args, **kwargs)
+            if measure is None or self.is_band_limited:
+                return measure
+            non_neg_index = np.arange(0, (self.n_fft_samples + 1) // 2)
+            arguments = measure_signature.bind(
+                self, *args, **kwargs).arguments
+            is_pairs = (arguments.get('is_packed', False) or
+                        arguments.get('signal_pairs') is not None)
+            frequency_axis = axis + 1 if is_pairs else axis
+            return np.take(measure, indices=non_neg_index,
+                           axis=frequency_axis)
         return wrapper
-        wrapper.__docstring__ = connectivity_measure.__docstring__
     return decorator
 
 
+def memoized_measure(connectivity_measure):
+    '''Decorator that caches the result of a connectivity measure for each
+    set of arguments.
+
+    Results are kept in the instance's `intermediates`, so they count
+    against the same memory budget as the intermediates and are evicted
+    in least recently used order with them. At most MAX_CACHED_MEASURES
+    results are kept, even without a budget. They are returned as
+    read-only views so a caller cannot change the cached value. Measures
+    that other measures build on (coherency, the phase locking value,
+    power) are then only computed once. Use `Connectivity.clear` to drop
+    the cached results.
+
+    '''
+    measure_signature = signature(connectivity_measure)
+
+    @wraps(connectivity_measure)
+    def wrapper(self, *args, **kwargs):
+        bound_arguments = measure_signature.bind(self, *args, **kwargs)
+        bound_arguments.apply_defaults()
+        key = (connectivity_measure.__name__,) + tuple(
+            (name, _make_hashable(value))
+            for name, value in bound_arguments.arguments.items()
+            if name != 'self')
+        cache = self.intermediates
+        try:
+            return cache[key]
+        except KeyError:
+            pass
+        measure = _read_only(connectivity_measure(self, *args, **kwargs))
+        cache[key] = measure
+        measure_keys = [name for name in cache if isinstance(name, tuple)]
+        for name in measure_keys[:-MAX_CACHED_MEASURES]:
+            del cache[name]
+        return measure
+    return wrapper
+
+
 class Connectivity(object):
     '''Computes brain connectivity measures based on the cross spectral
     matrix.
@@ -70,20 +281,120 @@ class Connectivity(object):
     fourier_coefficients : array, shape (n_time_windows, n_trials,
                                          n_tapers, n_fft_samples,
                                          n_signals)
-        The compex-valued coefficients from a fourier transform. Note that
-        this is expected to be the two-sided fourier coefficients
-        (both the positive and negative lags). This is needed for the
-        Granger-based methods to work.
+        The compex-valued coefficients from a fourier transform. These
+        are either the two-sided fourier coefficients (both the positive
+        and negative lags) or, for real signals, only the
+        n_fft_samples // 2 + 1 non-negative frequencies from a real-input
+        FFT. In the one-sided case, `n_fft_samples` must be given and the
+        Granger-based methods rebuild the negative frequencies from the
+        Hermitian symmetry of the cross spectral matrix. Coefficients can
+        also be band-limited (see `Multitaper.frequencies_of_interest`),
+        in which case `n_fft_samples` and `frequencies` must be given and
+        the Granger-based methods are not available. Whether the
+        coefficients are one-sided or band-limited is inferred from the
+        number of frequencies and `n_fft_samples`, so `n_fft_samples` is
+        required whenever `frequencies` is given.
     expectation_type : ('trials_tapers' | 'trials' | 'tapers')
         How to average the cross spectral matrix. 'trials_tapers' averages
         over the trials and tapers dimensions. 'trials' only averages over
         the trials dimensions (leaving tapers) and 'tapers' only averages
         over tapers (leaving trials).
-    frequencies : array, shape (n_fft_samples,)
+    frequencies : array, shape (n_frequencies,)
+        The frequencies of the fourier coefficients.
     time : array, shape (n_time_windows,)
+    n_fft_samples : int, optional
+        Length of the FFT used to compute `fourier_coefficients`. Needed
+        for one-sided or band-limited fourier coefficients and whenever
+        `frequencies` is given.
+    is_mixed_precision : bool, optional
+        The cross spectra and the coherence and phase synchrony measures
+        are computed in the precision of `fourier_coefficients`. By
+        default, the minimum phase decomposition behind the Granger, DTF
+        and PDC families is still computed in double precision. If True
+        and the coefficients are single precision (np.complex64), it is
+        computed in single precision too. See
+        `minimum_phase_decomposition` for the accuracy of this path.
+    spectral_factorization : ('wilson' | 'mvar'), optional
+        How the transfer function and noise covariance behind the Granger,
+        DTF, PDC and directed coherence measures are estimated. 'wilson'
+        factors the cross spectral matrix non-parametrically with
+        `minimum_phase_decomposition`. 'mvar' fits a multivariate
+        autoregressive model to the autocovariance (the inverse fourier
+        transform of the cross spectral matrix) with the
+        Levinson-Whittle-Robinson recursion. This is much cheaper,
+        particularly for short time windows, but assumes the signals
+        follow a model of finite order.
+    max_MVAR_order : int, optional
+        Highest order of the 'mvar' model considered. Defaults to
+        MAX_MVAR_ORDER, limited to half the fourier transform length.
+    MVAR_order_criterion : ('bic' | 'aic' | None), optional
+        Information criterion used to choose the order of the 'mvar'
+        model in each time window. If None, `max_MVAR_order` is used.
+    n_time_samples_per_window : int, optional
+        Number of time samples in each time window, used as the sample
+        size of the 'mvar' information criterion. Defaults to
+        `n_fft_samples`, which overstates it when the windows were
+        zero-padded.
+    n_workers : int, optional
+        Number of threads that run the minimum phase decomposition on
+        chunks of time windows at the same time. Defaults to the number
+        of FFT workers (`fft_backend.get_workers`), which are then split
+        between the threads so the cores are not oversubscribed.
+    chunk_size : int, optional
+        Number of time windows factored together by the minimum phase
+        decomposition. By default, the time windows are split evenly
+        between the workers.
+    warm_start : bool, optional
+        If True, the minimum phase decomposition starts most time windows
+        from the converged factor of a nearby time window instead of the
+        Cholesky guess (see `minimum_phase_decomposition`). For
+        spectrograms of overlapping time windows this takes fewer
+        iterations, but the factors differ slightly from those of the
+        default cold start.
+    intermediate_memory_budget : int, optional
+        Maximum number of bytes of lazily computed intermediates (cross
+        spectral matrix, minimum phase factor, transfer function, noise
+        covariance, ...) and cached measure results to keep. The least
+        recently used ones are evicted and computed again if needed. By
+        default they are kept for the lifetime of the instance. See
+        `intermediates`.
+    store : ArrayStore or str, optional
+        Store (or directory of a store) to load the expected cross
+        spectral matrix and its minimum phase factor from. They are
+        computed and stored if these fourier coefficients and parameters
+        have not been seen before, so later runs on the same data skip
+        the minimum phase decomposition.
+    intermediates : IntermediateCache
+        The stored intermediates and measure results. Use
+        `intermediates.pin` to keep an intermediate that is still needed
+        regardless of the budget and `intermediates.resident_sizes()` for
+        the memory they use.
+
+    The symmetric measures (coherency, the phase synchrony measures and
+    their magnitudes and phases) take `is_packed`. If True, only the
+    signal pairs above the diagonal are computed and returned, with
+    shape (..., n_fft_samples, n_signal_pairs), in the order of
+    `itertools.combinations(range(n_signals), 2)`. See
+    `unpack_signal_pairs` to get the square matrices back. These measures
+    also take `signal_pairs`, a tuple of two index arrays (signal1,
+    signal2), to compute only those pairs, so memory and time scale with
+    the number of pairs rather than the square of the number of signals
+    (see `get_signal_pairs_between_groups`). The value for a pair is
+    element [signal1, signal2] of the square matrix. So is the value of
+    `pairwise_spectral_granger_prediction` for `signal_pairs`, which
+    still needs the model of all signals;
+    `bivariate_spectral_granger_prediction` instead models each pair on
+    its own.
+
+    The results of the measures that others build on (power, coherency,
+    the phase synchrony measures and spectral granger prediction) are
+    cached for each set of arguments and returned as read-only arrays.
+    Call `clear` to free them.
 
     Methods
     -------
+    clear
+    power
     coherency
     coherence_magnitude
     coherence_phase
@@ -95,14 +406,18 @@ class Connectivity(object):
     debiased_squared_phase_lag_index
     debiased_squared_weighted_phase_lag_index
     pairwise_phase_consistency
+    phase_synchrony
     directed_transfer_function
     directed_coherence
     partial_directed_coherence
     generalized_partial_directed_coherence
     direct_directed_transfer_function
     group_delay
-    phase_lag_index
+    group_delay_by_band
+    phase_slope_index
+    phase_slope_index_by_band
     pairwise_spectral_granger_prediction
+    bivariate_spectral_granger_prediction
     conditional_spectral_granger_prediction (Not implemented)
     blockwise_spectral_granger_prediction (Not implemented)
 
@@ -116,29 +431,116 @@ class Connectivity(object):
 
     def __init__(self, fourier_coefficients,
                  expectation_type='trials_tapers', frequencies=None,
-                 time=None):
+                 time=None, n_fft_samples=None, is_mixed_precision=False,
+                 intermediate_memory_budget=None, store=None,
+                 spectral_factorization='wilson', max_MVAR_order=None,
+                 MVAR_order_criterion='bic', n_workers=None,
+                 chunk_size=None, warm_start=False,
+                 n_time_samples_per_window=None):
+        if frequencies is not None and n_fft_samples is None:
+            raise ValueError(
+                'n_fft_samples must be given with frequencies, otherwise '
+                'one-sided or band-limited fourier coefficients are taken '
+                'to be two-sided.')
+        if n_fft_samples is not None:
+            n_frequencies = fourier_coefficients.shape[-2]
+            if frequencies is not None and len(frequencies) != n_frequencies:
+                raise ValueError(
+                    'There are {0} frequencies for {1} frequencies of '
+                    'fourier coefficients.'.format(
+                        len(frequencies), n_frequencies))
+            if n_frequencies > n_fft_samples:
+                raise ValueError(
+                    'There are more frequencies of fourier coefficients '
+                    '({0}) than n_fft_samples ({1}).'.format(
+                        n_frequencies, n_fft_samples))
         self.fourier_coefficients = fourier_coefficients
         self.expectation_type = expectation_type
         self._frequencies = frequencies
         self.time = time
+        self._n_fft_samples = n_fft_samples
+        self.is_mixed_precision = is_mixed_precision
+        self.intermediates = IntermediateCache(intermediate_memory_budget)
+        if isinstance(store, str):
+            store = ArrayStore(store)
+        self.store = store
+        if spectral_factorization not in ['wilson', 'mvar']:
+            raise ValueError('Unknown spectral factorization: {0}'.format(
+                spectral_factorization))
+        self.spectral_factorization = spectral_factorization
+        self.max_MVAR_order = max_MVAR_order
+        self.MVAR_order_criterion = MVAR_order_criterion
+        self.n_workers = n_workers
+        self.chunk_size = chunk_size
+        self.warm_start = warm_start
+        self._n_time_samples_per_window = n_time_samples_per_window
+
+    def clear(self):
+        '''Removes the cached results of the connectivity measures and the
+        intermediates that are not pinned.'''
+        self.intermediates.clear()
 
     @classmethod
     def from_multitaper(cls, multitaper_instance,
-                        expectation_type='trials_tapers'):
+                        expectation_type='trials_tapers',
+                        is_mixed_precision=False,
+                        intermediate_memory_budget=None, store=None,
+                        spectral_factorization='wilson',
+                        max_MVAR_order=None, MVAR_order_criterion='bic',
+                        n_workers=None, chunk_size=None,
+                        warm_start=False):
         '''Construct connectivity class using a multitaper instance'''
         return cls(
             fourier_coefficients=multitaper_instance.fft(),
             expectation_type=expectation_type,
             time=multitaper_instance.time,
-            frequencies=multitaper_instance.frequencies
+            frequencies=multitaper_instance.frequencies,
+            n_fft_samples=multitaper_instance.n_fft_samples,
+            is_mixed_precision=is_mixed_precision,
+            intermediate_memory_budget=intermediate_memory_budget,
+            store=store,
+            spectral_factorization=spectral_factorization,
+            max_MVAR_order=max_MVAR_order,
+            MVAR_order_criterion=MVAR_order_criterion,
+            n_workers=n_workers,
+            chunk_size=chunk_size,
+            warm_start=warm_start,
+            n_time_samples_per_window=(
+                multitaper_instance.n_time_samples_per_window)
         )
 
+    @property
+    def n_fft_samples(self):
+        if self._n_fft_samples is None:
+            return self.fourier_coefficients.shape[-2]
+        return self._n_fft_samples
+
+    @property
+    def is_one_sided(self):
+        '''True if the fourier coefficients only contain the non-negative
+        frequencies.'''
+        n_frequencies = self.fourier_coefficients.shape[-2]
+        return (n_frequencies != self.n_fft_samples and
+                n_frequencies == self.n_fft_samples // 2 + 1)
+
+    @property
+    def is_band_limited(self):
+        '''True if the fourier coefficients only contain a band of
+        non-negative frequencies.'''
+        n_frequencies = self.fourier_coefficients.shape[-2]
+        return (n_frequencies != self.n_fft_samples and
+                n_frequencies != self.n_fft_samples // 2 + 1)
+
     @property
     @non_negative_frequencies(axis=0)
     def frequencies(self):
         if self._frequencies is not None:
             return self._frequencies
 
+    @lazyproperty
+    def _fourier_coefficients_hash(self):
+        return hash_array(self.fourier_coefficients)
+
     @lazyproperty
     def _power(self):
         return self._expectation(
@@ -168,21 +570,225 @@ class Connectivity(object):
                                       fourier_coefficients)
 
     @lazyproperty
+    @stored('expectation_type')
+    def _expectation_cross_spectral_matrix(self):
+        '''The expectation of the cross spectral matrix over the
+        observations (trials and/or tapers).
+
+        Computed as one matrix product over the observations at each time
+        window and frequency, so the cross spectral matrix of each
+        observation is never stored.
+
+        Returns
+        -------
+        expectation_cross_spectral_matrix : array, shape (...,
+                                                          n_fft_samples,
+                                                          n_signals,
+                                                          n_signals)
+
+        '''
+        expectation_axes = self._expectation_axes
+        n_axes = self.fourier_coefficients.ndim
+        # shape (..., n_fft_samples, n_signals, n_observations)
+        fourier_coefficients = np.moveaxis(
+            self.fourier_coefficients, expectation_axes,
+            np.arange(n_axes - len(expectation_axes), n_axes))
+        fourier_coefficients = fourier_coefficients.reshape(
+            fourier_coefficients.shape[:n_axes - len(expectation_axes)] +
+            (-1,))
+        return _complex_inner_product(
+            fourier_coefficients, fourier_coefficients) / self.n_observations
+
+    def _streaming_expectation(self, *functions, signal_pairs,
+                               memory_budget=MEMORY_BUDGET):
+        '''The expectation of each function of the cross spectra of
+        `signal_pairs` over the observations.
+
+        For measures that are not linear in the cross spectra. The cross
+        spectra are computed for a chunk of observations and a tile of
+        signal pairs at a time, so at most about `memory_budget` bytes of
+        them are held in memory.
+
+        Parameters
+        ----------
+        functions : callables
+            Each takes the cross spectra of a chunk of observations and
+            returns an array of the same shape.
+        signal_pairs : tuple of arrays
+        memory_budget : int, optional
+
+        Returns
+        -------
+        expectations : list of arrays, shape (..., n_fft_samples,
+                                              n_signal_pairs)
+
+        '''
+        n_signals = self.fourier_coefficients.shape[-1]
+        n_bytes_per_pair = self.fourier_coefficients.nbytes // n_signals
+        signal1, signal2 = signal_pairs
+        n_signal_pairs = signal1.size
+        n_pairs_per_tile = min(max(
+            1, int(memory_budget // max(n_bytes_per_pair, 1))),
+            n_signal_pairs)
+        expectations = None
+        for tile_start in range(0, n_signal_pairs, n_pairs_per_tile):
+            tile = slice(tile_start, tile_start + n_pairs_per_tile)
+            tile_expectations = self._chunked_expectation(
+                functions, signal_pairs=(signal1[tile], signal2[tile]),
+                memory_budget=memory_budget)
+            if expectations is None:
+                expectations = [
+                    np.empty(expectation.shape[:-1] + (n_signal_pairs,),
+                             dtype=expectation.dtype)
+                    for expectation in tile_expectations]
+            for expectation, tile_expectation in zip(
+                    expectations, tile_expectations):
+                expectation[..., tile] = tile_expectation
+        return expectations
+
+    def _chunked_expectation(self, functions, signal_pairs,
+                             memory_budget=MEMORY_BUDGET):
+        '''Sums the functions of the cross spectra of `signal_pairs` over
+        chunks of observations. See `_streaming_expectation`.'''
+        expectation_axes = self._expectation_axes
+        chunk_axis = expectation_axes[0]
+        n_chunk_axis = self.fourier_coefficients.shape[chunk_axis]
+        n_signals = self.fourier_coefficients.shape[-1]
+        n_bytes_per_observation = (
+            self.fourier_coefficients.nbytes * signal_pairs[0].size //
+            max(n_chunk_axis * n_signals, 1))
+        chunk_size = max(
+            1, int(memory_budget // max(n_bytes_per_observation, 1)))
+
+        sums = [0] * len(functions)
+        chunk_index = [slice(None)] * self.fourier_coefficients.ndim
+        for chunk_start in range(0, n_chunk_axis, chunk_size):
+            chunk_index[chunk_axis] = slice(
+                chunk_start, chunk_start + chunk_size)
+            fourier_coefficients = self.fourier_coefficients[
+                tuple(chunk_index)]
+            cross_spectra = (
+                fourier_coefficients[..., signal_pairs[0]] *
+                fourier_coefficients[..., signal_pairs[1]].conjugate())
+            for function_ind, function in enumerate(functions):
+                sums[function_ind] = sums[function_ind] + function(
+                    cross_spectra).sum(axis=expectation_axes)
+        return [summed / self.n_observations for summed in sums]
+
+    def _resolve_signal_pairs(self, is_packed=False, signal_pairs=None):
+        '''The signal pairs a measure is computed for, or None for the square
+        matrix of all pairs.'''
+        if signal_pairs is not None:
+            signal1, signal2 = (np.asarray(signal_ind).ravel()
+                                for signal_ind in signal_pairs)
+            if np.any(signal1 == signal2):
+                raise ValueError(
+                    'Each signal pair must contain two different signals')
+            return signal1, signal2
+        if is_packed:
+            return _get_signal_pairs(self.fourier_coefficients.shape[-1])
+        return None
+
+    def _expectation_cross_spectra(self, signal_pairs=None,
+                                   memory_budget=MEMORY_BUDGET):
+        '''The expectation of the cross spectra, either as the square cross
+        spectral matrix or for `signal_pairs`.'''
+        if signal_pairs is None:
+            return self._expectation_cross_spectral_matrix
+        if '_expectation_cross_spectral_matrix' in self.intermediates:
+            return self._expectation_cross_spectral_matrix[
+                ..., signal_pairs[0], signal_pairs[1]]
+        return self._streaming_expectation(
+            lambda cross_spectra: cross_spectra,
+            signal_pairs=signal_pairs, memory_budget=memory_budget)[0]
+
+    def _power_product(self, signal_pairs=None):
+        '''The product of the power of each pair of signals.'''
+        if signal_pairs is not None:
+            return (self._power[..., signal_pairs[0]] *
+                    self._power[..., signal_pairs[1]])
+        return (self._power[..., :, np.newaxis] *
+                self._power[..., np.newaxis, :])
+
+    @property
+    def _two_sided_cross_spectral_matrix(self):
+        '''The expected cross spectral matrix at every frequency, in double
+        precision unless `is_mixed_precision`.'''
+        if self.is_band_limited:
+            raise ValueError(
+                'The spectral factorization needs the cross spectral '
+                'matrix at every frequency. Compute the fourier '
+                'coefficients without frequencies_of_interest.')
+        cross_spectral_matrix = self._expectation_cross_spectral_matrix
+        if self.is_one_sided:
+            cross_spectral_matrix = _get_two_sided_spectrum(
+                cross_spectral_matrix, self.n_fft_samples)
+        if not self.is_mixed_precision:
+            cross_spectral_matrix = cross_spectral_matrix.astype(
+                np.result_type(cross_spectral_matrix, np.complex128),
+                copy=False)
+        return cross_spectral_matrix
+
+    @lazyproperty
+    @stored('expectation_type', 'n_fft_samples',
+            'is_mixed_precision', 'warm_start')
     def _minimum_phase_factor(self):
         return minimum_phase_decomposition(
-            self._expectation(self._cross_spectral_matrix))
+            self._two_sided_cross_spectral_matrix,
+            warm_start=self.warm_start,
+            n_workers=self.n_workers or get_workers(),
+            chunk_size=self.chunk_size)
+
+    @lazyproperty
+    def _autoregressive_model(self):
+        '''The coefficients, noise covariance and order of the
+        multivariate autoregressive model of each time window.'''
+        max_order = min(
+            self.max_MVAR_order or MAX_MVAR_ORDER,
+            (self.n_fft_samples - 1) // 2)
+        autocovariance = ifft(
+            self._two_sided_cross_spectral_matrix, axis=-3)[
+                ..., :max_order + 1, :, :].real
+        return _fit_autoregressive_model(
+            autocovariance, self._n_MVAR_samples,
+            criterion=self.MVAR_order_criterion)
+
+    @property
+    def _n_MVAR_samples(self):
+        '''Effective number of time samples behind the autocovariance of
+        each time window: the window length times the number of trials
+        averaged over.
+
+        The tapers weigh the same time samples differently, so they do not
+        add samples, and zero-padding to `n_fft_samples` does not either.
+
+        '''
+        n_time_samples_per_window = (self._n_time_samples_per_window or
+                                     self.n_fft_samples)
+        n_trials = (self.fourier_coefficients.shape[1]
+                    if 1 in self._expectation_axes else 1)
+        return n_time_samples_per_window * n_trials
 
     @lazyproperty
     @non_negative_frequencies(axis=-3)
     def _transfer_function(self):
+        if self.spectral_factorization == 'mvar':
+            return np.linalg.inv(_get_MVAR_Fourier_coefficients(
+                self._autoregressive_model[0], self.n_fft_samples))
         return _estimate_transfer_function(self._minimum_phase_factor)
 
     @lazyproperty
     def _noise_covariance(self):
+        if self.spectral_factorization == 'mvar':
+            return self._autoregressive_model[1]
         return _estimate_noise_covariance(self._minimum_phase_factor)
 
     @lazyproperty
+    @non_negative_frequencies(axis=-3)
     def _MVAR_Fourier_coefficients(self):
+        if self.spectral_factorization == 'mvar':
+            return _get_MVAR_Fourier_coefficients(
+                self._autoregressive_model[0], self.n_fft_samples)
         return np.linalg.inv(self._transfer_function)
 
     @property
@@ -190,41 +796,55 @@ class Connectivity(object):
         return EXPECTATION[self.expectation_type]
 
     @property
-    def n_observations(self):
+    def _expectation_axes(self):
+        '''The observation axes averaged over by the expectation.'''
         axes = signature(self._expectation).parameters['axis'].default
-        if isinstance(axes, int):
-            return self.fourier_coefficients.shape[axes]
-        else:
-            return np.prod(
-                [self.fourier_coefficients.shape[axis]
-                 for axis in axes])
+        return (axes,) if isinstance(axes, int) else tuple(axes)
+
+    @property
+    def n_observations(self):
+        return int(np.prod(
+            [self.fourier_coefficients.shape[axis]
+             for axis in self._expectation_axes]))
 
+    @memoized_measure
     @non_negative_frequencies(axis=-2)
     def power(self):
         return self._power
 
+    @memoized_measure
     @non_negative_frequencies(axis=-3)
-    def coherency(self):
+    def coherency(self, is_packed=False, signal_pairs=None):
         '''The complex-valued linear association between time series in the
          frequency domain.
 
+         Parameters
+         ----------
+         is_packed : bool, optional
+             Only return the signal pairs above the diagonal.
+         signal_pairs : tuple of arrays, optional
+             Only return these pairs of signals.
+
          Returns
          -------
          complex_coherency : array, shape (..., n_fft_samples, n_signals,
-                                           n_signals)
+                                           n_signals) or
+                                          (..., n_fft_samples,
+                                           n_signal_pairs)
 
          '''
-        norm = np.sqrt(self._power[..., :, np.newaxis] *
-                       self._power[..., np.newaxis, :])
+        signal_pairs = self._resolve_signal_pairs(is_packed, signal_pairs)
+        norm = np.sqrt(self._power_product(signal_pairs))
         norm[norm == 0] = np.nan
         complex_coherencey = (
-            self._expectation(self._cross_spectral_matrix) / norm)
-        n_signals = self.fourier_coefficients.shape[-1]
-        diagonal_ind = np.arange(0, n_signals)
-        complex_coherencey[..., diagonal_ind, diagonal_ind] = np.nan
+            self._expectation_cross_spectra(signal_pairs) / norm)
+        if signal_pairs is None:
+            n_signals = self.fourier_coefficients.shape[-1]
+            diagonal_ind = np.arange(0, n_signals)
+            complex_coherencey[..., diagonal_ind, diagonal_ind] = np.nan
         return complex_coherencey
 
-    def coherence_phase(self):
+    def coherence_phase(self, is_packed=False, signal_pairs=None):
         '''The phase angle of the complex coherency.
 
         Returns
@@ -232,9 +852,10 @@ class Connectivity(object):
         phase : array, shape (..., n_fft_samples, n_signals, n_signals)
 
         '''
-        return np.angle(self.coherency())
+        return np.angle(self.coherency(
+            is_packed=is_packed, signal_pairs=signal_pairs))
 
-    def coherence_magnitude(self):
+    def coherence_magnitude(self, is_packed=False, signal_pairs=None):
         '''The magnitude of the complex coherency.
 
         Note that this is not the magnitude squared coherence.
@@ -244,10 +865,12 @@ class Connectivity(object):
         magnitude : array, shape (..., n_fft_samples, n_signals, n_signals)
 
         '''
-        return _squared_magnitude(self.coherency())
+        return _squared_magnitude(self.coherency(
+            is_packed=is_packed, signal_pairs=signal_pairs))
 
+    @memoized_measure
     @non_negative_frequencies(axis=-3)
-    def imaginary_coherence(self):
+    def imaginary_coherence(self, is_packed=False, signal_pairs=None):
         '''The normalized imaginary component of the cross-spectrum.
 
         Projects the cross-spectrum onto the imaginary axis to mitigate the
@@ -271,22 +894,29 @@ class Connectivity(object):
                Neurophysiology 115, 2292-2307.
 
         '''
+        signal_pairs = self._resolve_signal_pairs(is_packed, signal_pairs)
         return np.abs(
-            self._expectation(self._cross_spectral_matrix).imag /
-            np.sqrt(self._power[..., :, np.newaxis] *
-                    self._power[..., np.newaxis, :]))
+            self._expectation_cross_spectra(signal_pairs).imag /
+            np.sqrt(self._power_product(signal_pairs)))
 
-    def canonical_coherence(self, group_labels):
+    def canonical_coherence(self, group_labels, memory_budget=MEMORY_BUDGET):
         '''Finds the maximal coherence between each combination of groups.
 
         The canonical coherence finds two sets of weights such that the
         coherence between the linear combination of group1 and the linear
         combination of group2 is maximized.
 
+        The cross spectral matrix over trials and tapers is whitened
+        within each group, once per group for all group pairs, and the
+        canonical coherence of a pair is the largest squared singular
+        value of their whitened cross spectra. The time windows are
+        processed in chunks to stay within about `memory_budget` bytes.
+
         Parameters
         ----------
         group_labels : array-like, shape (n_signals,)
             Links each signal to a group.
+        memory_budget : int, optional
 
         Returns
         -------
@@ -304,39 +934,62 @@ class Connectivity(object):
 
         '''
         labels = np.unique(group_labels)
-        n_frequencies = self.fourier_coefficients.shape[-2]
-        non_negative_frequencies = np.arange(0, (n_frequencies + 1) // 2)
-        fourier_coefficients = self.fourier_coefficients[
-            ..., non_negative_frequencies, :]
-        normalized_fourier_coefficients = [
-            _normalize_fourier_coefficients(
-                fourier_coefficients[..., np.in1d(group_labels, label)])
-            for label in labels]
+        group_index = [np.nonzero(np.asarray(group_labels) == label)[0]
+                       for label in labels]
+        if self.is_band_limited:
+            fourier_coefficients = self.fourier_coefficients
+        else:
+            fourier_coefficients = self.fourier_coefficients[
+                ..., :(self.n_fft_samples + 1) // 2, :]
 
         n_groups = len(labels)
-        new_shape = (self.time.size, self.frequencies.size, n_groups,
-                     n_groups)
-        magnitude = _squared_magnitude(np.stack([
-            _estimate_canonical_coherence(
-                fourier_coefficients1, fourier_coefficients2)
-            for fourier_coefficients1, fourier_coefficients2
-            in combinations(normalized_fourier_coefficients, 2)
-        ], axis=-1))
-
-        canonical_coherence_magnitude = np.zeros(new_shape) * np.nan
-        group_combination_ind = np.array(
-            list(combinations(np.arange(n_groups), 2)))
-        canonical_coherence_magnitude[
-            ..., group_combination_ind[:, 0],
-            group_combination_ind[:, 1]] = magnitude
-        canonical_coherence_magnitude[
-            ..., group_combination_ind[:, 1],
-            group_combination_ind[:, 0]] = magnitude
+        (n_time_windows, _, _, n_frequencies,
+         n_signals) = fourier_coefficients.shape
+        canonical_coherence_magnitude = np.full(
+            (n_time_windows, n_frequencies, n_groups, n_groups), np.nan)
+        group_combination_ind = list(combinations(np.arange(n_groups), 2))
+
+        # The trials and tapers of a time window and their cross spectral
+        # matrix
+        n_bytes_per_time_window = (
+            fourier_coefficients.nbytes // max(n_time_windows, 1) +
+            n_frequencies * n_signals ** 2 *
+            fourier_coefficients.dtype.itemsize)
+        chunk_size = max(
+            1, int(memory_budget // max(n_bytes_per_time_window, 1)))
+
+        for chunk_start in range(0, n_time_windows, chunk_size):
+            chunk = slice(chunk_start, chunk_start + chunk_size)
+            chunk_fourier_coefficients = _reshape(fourier_coefficients[chunk])
+            cross_spectral_matrix = _complex_inner_product(
+                chunk_fourier_coefficients, chunk_fourier_coefficients)
+            del chunk_fourier_coefficients
+            whitening = [
+                _inverse_square_root(
+                    cross_spectral_matrix[..., index[:, np.newaxis], index])
+                for index in group_index]
+            for group1, group2 in group_combination_ind:
+                group_cross_spectrum = np.matmul(np.matmul(
+                    whitening[group1],
+                    cross_spectral_matrix[
+                        ..., group_index[group1][:, np.newaxis],
+                        group_index[group2]]),
+                    whitening[group2])
+                if group_cross_spectrum.shape[-1] < (
+                        group_cross_spectrum.shape[-2]):
+                    group_cross_spectrum = _conjugate_transpose(
+                        group_cross_spectrum)
+                magnitude = _largest_eigenvalue(_complex_inner_product(
+                    group_cross_spectrum, group_cross_spectrum))
+                canonical_coherence_magnitude[
+                    chunk, :, group1, group2] = magnitude
+                canonical_coherence_magnitude[
+                    chunk, :, group2, group1] = magnitude
 
         return canonical_coherence_magnitude, labels
 
-    @non_negative_frequencies(axis=-3)
-    def phase_locking_value(self):
+    @memoized_measure
+    def phase_locking_value(self, is_packed=False, signal_pairs=None):
         '''The cross-spectrum with the power for each signal scaled to
         a magnitude of 1.
 
@@ -358,12 +1011,12 @@ class Connectivity(object):
                signals. Human Brain Mapping 8, 194-208.
 
         '''
-        return self._expectation(
-            self._cross_spectral_matrix /
-            np.abs(self._cross_spectral_matrix))
+        return self._phase_synchrony(
+            lambda expectations: expectations['phase'], np.conjugate,
+            is_packed=is_packed, signal_pairs=signal_pairs)
 
-    @non_negative_frequencies(axis=-3)
-    def phase_lag_index(self):
+    @memoized_measure
+    def phase_lag_index(self, is_packed=False, signal_pairs=None):
         '''A non-parametric synchrony measure designed to mitigate power
         differences between realizations (tapers, trials) and
         volume-conduction.
@@ -386,10 +1039,12 @@ class Connectivity(object):
                sources. Human Brain Mapping 28, 1178-1193.
 
         '''
-        return self._expectation(np.sign(self._cross_spectral_matrix.imag))
+        return self._phase_synchrony(
+            lambda expectations: expectations['imaginary_sign'],
+            np.negative, is_packed=is_packed, signal_pairs=signal_pairs)
 
-    @non_negative_frequencies(-3)
-    def weighted_phase_lag_index(self):
+    @memoized_measure
+    def weighted_phase_lag_index(self, is_packed=False, signal_pairs=None):
         '''Weighted average of the phase lag index using the imaginary
         coherency magnitudes as weights.
 
@@ -407,13 +1062,17 @@ class Connectivity(object):
                NeuroImage 55, 1548-1565.
 
         '''
-        weights = self._expectation(
-            np.abs(self._cross_spectral_matrix.imag))
-        weights[weights < np.finfo(float).eps] = 1
-        return self._expectation(
-            self._cross_spectral_matrix.imag) / weights
+        def _weighted_phase_lag_index(expectations):
+            weights = expectations['imaginary_magnitude'].copy()
+            weights[weights < np.finfo(float).eps] = 1
+            return expectations['imaginary'] / weights
+
+        return self._phase_synchrony(
+            _weighted_phase_lag_index, np.negative, is_packed=is_packed,
+            signal_pairs=signal_pairs)
 
-    def debiased_squared_phase_lag_index(self):
+    def debiased_squared_phase_lag_index(self, is_packed=False,
+                                         signal_pairs=None):
         '''The square of the phase lag index corrected for the positive
         bias induced by using the magnitude of the complex cross-spectrum.
 
@@ -432,11 +1091,14 @@ class Connectivity(object):
 
         '''
         n_observations = self.n_observations
-        return ((n_observations * self.phase_lag_index() ** 2 - 1.0) /
+        return ((n_observations *
+                 self.phase_lag_index(is_packed=is_packed,
+                                      signal_pairs=signal_pairs) ** 2 -
+                 1.0) /
                 (n_observations - 1.0))
 
-    @non_negative_frequencies(-3)
-    def debiased_squared_weighted_phase_lag_index(self):
+    def debiased_squared_weighted_phase_lag_index(self, is_packed=False,
+                                                  signal_pairs=None):
         '''The square of the weighted phase lag index corrected for the
         positive bias induced by using the magnitude of the complex
         cross-spectrum.
@@ -456,19 +1118,25 @@ class Connectivity(object):
 
         '''
         n_observations = self.n_observations
-        imaginary_cross_spectral_matrix_sum = self._expectation(
-            self._cross_spectral_matrix.imag) * n_observations
-        squared_imaginary_cross_spectral_matrix_sum = self._expectation(
-            self._cross_spectral_matrix.imag ** 2) * n_observations
-        imaginary_cross_spectral_matrix_magnitude_sum = self._expectation(
-            np.abs(self._cross_spectral_matrix.imag)) * n_observations
-        weights = (imaginary_cross_spectral_matrix_magnitude_sum ** 2 -
-                   squared_imaginary_cross_spectral_matrix_sum)
-        weights[weights == 0] = np.nan
-        return (imaginary_cross_spectral_matrix_sum ** 2 -
-                squared_imaginary_cross_spectral_matrix_sum) / weights
-
-    def pairwise_phase_consistency(self):
+
+        def _debiased_squared_weighted_phase_lag_index(expectations):
+            imaginary_cross_spectral_matrix_sum = (
+                expectations['imaginary'] * n_observations)
+            squared_imaginary_cross_spectral_matrix_sum = (
+                expectations['squared_imaginary'] * n_observations)
+            imaginary_cross_spectral_matrix_magnitude_sum = (
+                expectations['imaginary_magnitude'] * n_observations)
+            weights = (imaginary_cross_spectral_matrix_magnitude_sum ** 2 -
+                       squared_imaginary_cross_spectral_matrix_sum)
+            weights[weights == 0] = np.nan
+            return (imaginary_cross_spectral_matrix_sum ** 2 -
+                    squared_imaginary_cross_spectral_matrix_sum) / weights
+
+        return self._phase_synchrony(
+            _debiased_squared_weighted_phase_lag_index, np.positive,
+            is_packed=is_packed, signal_pairs=signal_pairs)
+
+    def pairwise_phase_consistency(self, is_packed=False, signal_pairs=None):
         '''The square of the phase locking value corrected for the
         positive bias induced by using the magnitude of the complex
         cross-spectrum.
@@ -487,17 +1155,139 @@ class Connectivity(object):
 
         '''
         n_observations = self.n_observations
-        plv_sum = self.phase_locking_value() * n_observations
+        plv_sum = self.phase_locking_value(
+            is_packed=is_packed, signal_pairs=signal_pairs) * n_observations
         ppc = ((plv_sum * plv_sum.conjugate() - n_observations) /
                (n_observations ** 2 - n_observations))
         return ppc.real
 
-    def pairwise_spectral_granger_prediction(self):
+    def phase_synchrony(self, measures=PHASE_SYNCHRONY_MEASURES,
+                        is_packed=False, signal_pairs=None):
+        '''Several of the phase synchrony measures for the cost of one of
+        them.
+
+        The phase locking value, the phase lag indices and the pairwise
+        phase consistency are all computed from the same expectations over
+        the trials and tapers, which are accumulated in one pass over the
+        fourier coefficients.
+
+        Parameters
+        ----------
+        measures : sequence of str, optional
+            Names of the measures in PHASE_SYNCHRONY_MEASURES. All of them
+            by default.
+        is_packed : bool, optional
+        signal_pairs : tuple of arrays, optional
+
+        Returns
+        -------
+        phase_synchrony : dict
+            Each measure by name.
+
+        '''
+        unknown_measures = set(measures) - set(PHASE_SYNCHRONY_MEASURES)
+        if unknown_measures:
+            raise ValueError('Unknown phase synchrony measures: {0}'.format(
+                sorted(unknown_measures)))
+        return {measure: getattr(self, measure)(
+                    is_packed=is_packed, signal_pairs=signal_pairs)
+                for measure in measures}
+
+    def _phase_synchrony(self, measure, transpose, is_packed=False,
+                         signal_pairs=None):
+        '''Computes `measure` from the phase synchrony expectations.
+
+        Without signal pairs, the measure is computed for the pairs on and
+        above the diagonal and `transpose` gives the value of each reversed
+        pair to fill the square matrix.
+
+        '''
+        signal_pairs = self._resolve_signal_pairs(is_packed, signal_pairs)
+        if signal_pairs is not None:
+            return measure(self._phase_synchrony_expectations(signal_pairs))
+        n_signals = self.fourier_coefficients.shape[-1]
+        signal1, signal2 = np.triu_indices(n_signals)
+        pair_measure = measure(
+            self._phase_synchrony_expectations((signal1, signal2)))
+        square_measure = np.empty(
+            pair_measure.shape[:-1] + (n_signals, n_signals),
+            dtype=pair_measure.dtype)
+        square_measure[..., signal2, signal1] = transpose(pair_measure)
+        square_measure[..., signal1, signal2] = pair_measure
+        return square_measure
+
+    @memoized_measure
+    def _phase_synchrony_expectations(self, signal_pairs):
+        '''The expectations over the observations of the functions of the
+        cross spectra of `signal_pairs` that the phase synchrony measures
+        need, at the non-negative frequencies.
+
+        The compiled kernel accumulates them all while streaming over the
+        trials and tapers, so the cross spectra of each observation are
+        never stored.
+
+        Returns
+        -------
+        expectations : dict of arrays, shape (..., n_frequencies,
+                                              n_signal_pairs)
+            The cross spectra normalized to unit magnitude ('phase') and
+            the sign ('imaginary_sign'), value ('imaginary'), magnitude
+            ('imaginary_magnitude') and square ('squared_imaginary') of
+            their imaginary part.
+
+        '''
+        if self.is_band_limited:
+            fourier_coefficients = self.fourier_coefficients
+        else:
+            fourier_coefficients = self.fourier_coefficients[
+                ..., :(self.n_fft_samples + 1) // 2, :]
+        expectation_axes = self._expectation_axes
+        signal1, signal2 = signal_pairs
+        shape = list(fourier_coefficients.shape[:-1]) + [signal1.size]
+        for axis in expectation_axes:
+            shape[axis] = 1
+
+        phase = np.zeros(shape, dtype=np.complex128)
+        sums = [np.zeros(shape) for _ in range(4)]
+        _accumulate_phase_synchrony(
+            fourier_coefficients, signal1.astype(np.int64),
+            signal2.astype(np.int64), 1 in expectation_axes,
+            2 in expectation_axes, phase, *sums)
+
+        # Summed in double precision, returned in that of the coefficients
+        complex_dtype = np.result_type(fourier_coefficients.dtype,
+                                       np.complex64)
+        names = ['phase', 'imaginary_sign', 'imaginary',
+                 'imaginary_magnitude', 'squared_imaginary']
+        return {name: (np.squeeze(summed, axis=expectation_axes) /
+                       self.n_observations).astype(
+                    complex_dtype if name == 'phase' else
+                    np.finfo(complex_dtype).dtype, copy=False)
+                for name, summed in zip(names, [phase] + sums)}
+
+    @memoized_measure
+    def pairwise_spectral_granger_prediction(self, signal_pairs=None):
         '''The amount of power at a node in a frequency explained by (is
         predictive of) the power at other nodes.
 
         Also known as spectral granger causality.
 
+        Parameters
+        ----------
+        signal_pairs : tuple of arrays, optional
+            Only return the prediction of signal1 by signal2 for these
+            pairs of signals. The values are elements [signal1, signal2]
+            of the square matrix, so the model of all signals is still
+            estimated. See `bivariate_spectral_granger_prediction` for
+            pairs estimated from models of just the two signals.
+
+        Returns
+        -------
+        predictive_power : array, shape (..., n_fft_samples, n_signals,
+                                         n_signals) or (...,
+                                                        n_fft_samples,
+                                                        n_signal_pairs)
+
         References
         ----------
         .. [1] Geweke, J. (1982). Measurement of Linear Dependence and
@@ -505,17 +1295,133 @@ class Connectivity(object):
                American Statistical Association 77, 304.
 
         '''
-        rotated_covariance = _remove_instantaneous_causality(
-            self._noise_covariance)
+        if signal_pairs is not None:
+            signal1, signal2 = self._resolve_signal_pairs(
+                signal_pairs=signal_pairs)
+            return self.pairwise_spectral_granger_prediction()[
+                ..., signal1, signal2]
+        with self.intermediates.pinned('_minimum_phase_factor'):
+            rotated_covariance = _remove_instantaneous_causality(
+                self._noise_covariance)
+            transfer_function = self._transfer_function
         total_power = self.power()[..., np.newaxis]
         intrinsic_power = (total_power -
                            rotated_covariance[..., np.newaxis, :, :] *
-                           _squared_magnitude(self._transfer_function))
+                           _squared_magnitude(transfer_function))
         intrinsic_power[intrinsic_power == 0] = np.finfo(float).eps
         predictive_power = total_power / intrinsic_power
         predictive_power[predictive_power <= 0] = np.nan
         return np.log(predictive_power)
 
+    @memoized_measure
+    @non_negative_frequencies(axis=-3)
+    def bivariate_spectral_granger_prediction(
+            self, signal_pairs, memory_budget=MEMORY_BUDGET):
+        '''The amount of power at signal1 explained by (is predictive of)
+        the power at signal2, from a bivariate model of each pair.
+
+        Each pair gets its own minimum phase decomposition of its 2 x 2
+        cross spectral matrix instead of taking elements of the model of
+        all signals, as `pairwise_spectral_granger_prediction` does. The
+        values then differ from the square matrix when other signals
+        carry shared information, but memory and time scale with the
+        number of pairs rather than the square of the number of signals.
+
+        Parameters
+        ----------
+        signal_pairs : tuple of arrays
+            The pairs of signals (signal1, signal2) to compute.
+        memory_budget : int, optional
+            Approximate number of bytes of working memory. Each unordered
+            pair is factored once and gives both directions, and the pairs
+            are factored a tile at a time to stay within the budget.
+
+        Returns
+        -------
+        predictive_power : array, shape (..., n_fft_samples,
+                                         n_signal_pairs)
+
+        '''
+        if self.is_band_limited:
+            raise ValueError(
+                'The minimum phase decomposition needs the cross spectral '
+                'matrix at every frequency. Compute the fourier '
+                'coefficients without frequencies_of_interest.')
+        signal1, signal2 = self._resolve_signal_pairs(
+            signal_pairs=signal_pairs)
+        unordered_pairs, pair_index = np.unique(
+            np.stack((np.minimum(signal1, signal2),
+                      np.maximum(signal1, signal2)), axis=1),
+            axis=0, return_inverse=True)
+        pair_index = pair_index.ravel()
+
+        # Rough size of the Wilson algorithm's working arrays for one pair
+        n_bytes_per_pair = 40 * (self._power.nbytes //
+                                 self._power.shape[-1]) * (
+            self.n_fft_samples // self._power.shape[-2])
+        n_pairs_per_tile = max(1, int(memory_budget // n_bytes_per_pair))
+        predictive_power = np.concatenate([
+            self._bivariate_granger_tile(
+                unordered_pairs[tile_start:tile_start + n_pairs_per_tile])
+            for tile_start in range(0, len(unordered_pairs),
+                                    n_pairs_per_tile)], axis=-3)
+
+        predictive_power = predictive_power[..., pair_index, :, :]
+        is_reversed = signal1 > signal2
+        return np.where(is_reversed, predictive_power[..., 1, 0],
+                        predictive_power[..., 0, 1])
+
+    def _bivariate_granger_tile(self, signal_pairs):
+        '''Spectral granger prediction of each pair of signals (shape
+        (n_pairs, 2), with the first signal lower) from their 2 x 2 cross
+        spectral matrices.
+
+        Returns
+        -------
+        predictive_power : array, shape (..., n_fft_samples, n_pairs, 2, 2)
+
+        '''
+        signal1, signal2 = signal_pairs[:, 0], signal_pairs[:, 1]
+        cross_spectra = self._expectation_cross_spectra((signal1, signal2))
+        cross_spectral_matrix = np.empty(cross_spectra.shape + (2, 2),
+                                         dtype=cross_spectra.dtype)
+        cross_spectral_matrix[..., 0, 0] = self._power[..., signal1]
+        cross_spectral_matrix[..., 1, 1] = self._power[..., signal2]
+        cross_spectral_matrix[..., 0, 1] = cross_spectra
+        cross_spectral_matrix[..., 1, 0] = cross_spectra.conjugate()
+        if self.is_one_sided:
+            cross_spectral_matrix = _get_two_sided_spectrum(
+                cross_spectral_matrix, self.n_fft_samples, axis=-4)
+        if not self.is_mixed_precision:
+            cross_spectral_matrix = cross_spectral_matrix.astype(
+                np.result_type(cross_spectral_matrix, np.complex128),
+                copy=False)
+
+        # Put the pairs next to the time windows so that each time window
+        # and pair converges separately. A warm start follows the time
+        # windows, so the pairs of a time window then converge together.
+        cross_spectral_matrix = np.moveaxis(cross_spectral_matrix, -3, 1)
+        shape = cross_spectral_matrix.shape
+        factored_shape = shape if self.warm_start else (-1,) + shape[2:]
+        minimum_phase_factor = minimum_phase_decomposition(
+            cross_spectral_matrix.reshape(factored_shape),
+            warm_start=self.warm_start,
+            n_workers=self.n_workers or get_workers(),
+            chunk_size=self.chunk_size).reshape(shape)
+
+        rotated_covariance = _remove_instantaneous_causality(
+            _estimate_noise_covariance(minimum_phase_factor))
+        total_power = np.diagonal(cross_spectral_matrix, axis1=-2,
+                                  axis2=-1).real[..., np.newaxis]
+        intrinsic_power = (
+            total_power - rotated_covariance[..., np.newaxis, :, :] *
+            _squared_magnitude(
+                _estimate_transfer_function(minimum_phase_factor)))
+        intrinsic_power[intrinsic_power == 0] = np.finfo(float).eps
+        predictive_power = total_power / intrinsic_power
+        predictive_power[predictive_power <= 0] = np.nan
+        return np.moveaxis(np.log(predictive_power), 1, -3)
+
     def conditional_spectral_granger_prediction():
         raise NotImplementedError
 
@@ -564,10 +1470,12 @@ class Connectivity(object):
                causality. Applied Signal Processing 5, 40.
 
         '''
-        noise_variance = _get_noise_variance(self._noise_covariance)
+        with self.intermediates.pinned('_minimum_phase_factor'):
+            noise_variance = _get_noise_variance(self._noise_covariance)
+            transfer_function = self._transfer_function
         return (np.sqrt(noise_variance) *
-                _squared_magnitude(self._transfer_function) /
-                _total_inflow(self._transfer_function, noise_variance))
+                _squared_magnitude(transfer_function) /
+                _total_inflow(transfer_function, noise_variance))
 
     def partial_directed_coherence(self):
         '''The transfer function coupling strength normalized by its
@@ -619,11 +1527,13 @@ class Connectivity(object):
                pp. 163-166.
 
         '''
-        noise_variance = _get_noise_variance(self._noise_covariance)
+        with self.intermediates.pinned('_minimum_phase_factor'):
+            noise_variance = _get_noise_variance(self._noise_covariance)
+            MVAR_Fourier_coefficients = self._MVAR_Fourier_coefficients
         return _squared_magnitude(
-            self._MVAR_Fourier_coefficients /
+            MVAR_Fourier_coefficients /
             np.sqrt(noise_variance) / _total_outflow(
-                    self._MVAR_Fourier_coefficients, noise_variance))
+                    MVAR_Fourier_coefficients, noise_variance))
 
     def direct_directed_transfer_function(self):
         '''A combination of the directed transfer function estimate of
@@ -675,53 +1585,92 @@ class Connectivity(object):
                seizure propagation. Electroencephalography and Clinical
                Neurophysiology 56, 501-514.
 
+        '''
+        return tuple(
+            measure[..., 0, :, :] for measure in self.group_delay_by_band(
+                [frequencies_of_interest],
+                frequency_resolution=frequency_resolution,
+                significance_threshold=significance_threshold))
+
+    def group_delay_by_band(self, frequency_bands,
+                            frequency_resolution=None,
+                            significance_threshold=0.05):
+        '''The group delay of each of several frequency bands.
+
+        The coherency, its p-values and its phase are computed once and
+        shared by all the bands. Significance is still corrected for
+        multiple comparisons within each band, so each band gives the
+        same result as `group_delay`.
+
+        Parameters
+        ----------
+        frequency_bands : dict or sequence of array-like, shape (2,)
+            The frequencies of interest of each band. If a dict, the
+            bands are its values.
+        frequency_resolution : float
+        significance_threshold : float, optional
+
+        Returns
+        -------
+        delay : array, shape (..., n_bands, n_signals, n_signals)
+        slope : array, shape (..., n_bands, n_signals, n_signals)
+        r_value : array, shape (..., n_bands, n_signals, n_signals)
+
         '''
         frequencies = self.frequencies
         frequency_difference = frequencies[1] - frequencies[0]
         independent_frequency_step = _get_independent_frequency_step(
             frequency_difference, frequency_resolution)
-        bandpassed_coherency, bandpassed_frequencies = _bandpass(
-            self.coherency(), frequencies, frequencies_of_interest)
+        band_edges = _get_band_edges(frequency_bands)
+        coherency, frequencies = _bandpass(
+            self.coherency(), frequencies,
+            (min(band[0] for band in band_edges),
+             max(band[1] for band in band_edges)))
         bias = coherence_bias(self.n_observations)
 
-        n_signals = bandpassed_coherency.shape[-1]
+        n_signals = coherency.shape[-1]
         signal_combination_ind = np.array(
             list(combinations(np.arange(n_signals), 2)))
-        bandpassed_coherency = bandpassed_coherency[
-            ..., signal_combination_ind[:, 0],
-            signal_combination_ind[:, 1]]
-
-        is_significant = _find_significant_frequencies(
-            bandpassed_coherency, bias, independent_frequency_step,
-            significance_threshold=significance_threshold)
-        coherence_phase = np.ma.masked_array(
-            np.unwrap(np.angle(bandpassed_coherency), axis=-2),
-            mask=~is_significant)
-
-        def _linear_regression(response):
-            return linregress(bandpassed_frequencies, y=response)
-
-        regression_results = np.ma.apply_along_axis(
-            _linear_regression, -2, coherence_phase)
-        new_shape = (
-            *bandpassed_coherency.shape[:-2], n_signals, n_signals)
+        coherency = coherency[
+            ..., signal_combination_ind[:, 0], signal_combination_ind[:, 1]]
+        p_values = get_normal_distribution_p_values(
+            fisher_z_transform(coherency, bias))
+        # Unwrapping over a band only differs by a multiple of 2 pi, which
+        # changes neither the slope nor the r-value.
+        coherence_phase = np.unwrap(np.angle(coherency), axis=-2)
+        del coherency
+
+        pair_slope, pair_r_value = [], []
+        for frequencies_of_interest in band_edges:
+            bandpassed_p_values, bandpassed_frequencies = _bandpass(
+                p_values, frequencies, frequencies_of_interest, axis=-2)
+            is_significant = _find_significant_groups(
+                bandpassed_p_values, independent_frequency_step,
+                significance_threshold=significance_threshold)
+            band_slope, _, band_r_value = _masked_linear_regression(
+                bandpassed_frequencies[:, np.newaxis],
+                _bandpass(coherence_phase, frequencies,
+                          frequencies_of_interest, axis=-2)[0],
+                is_significant)
+            pair_slope.append(band_slope)
+            pair_r_value.append(band_r_value)
+        pair_slope = np.stack(pair_slope, axis=-2)
+        pair_r_value = np.stack(pair_r_value, axis=-2)
+
+        new_shape = (*pair_slope.shape[:-1], n_signals, n_signals)
         slope = np.zeros(new_shape)
         slope[..., signal_combination_ind[:, 0],
-              signal_combination_ind[:, 1]] = np.array(
-              regression_results[..., 0, :], dtype=np.float)
+              signal_combination_ind[:, 1]] = pair_slope
         slope[..., signal_combination_ind[:, 1],
-              signal_combination_ind[:, 0]] = -1 * np.array(
-              regression_results[..., 0, :], dtype=np.float)
+              signal_combination_ind[:, 0]] = -1 * pair_slope
 
         delay = slope / (2 * np.pi)
 
         r_value = np.ones(new_shape)
         r_value[..., signal_combination_ind[:, 0],
-                signal_combination_ind[:, 1]] = np.array(
-                regression_results[..., 2, :], dtype=np.float)
+                signal_combination_ind[:, 1]] = pair_r_value
         r_value[..., signal_combination_ind[:, 1],
-                signal_combination_ind[:, 0]] = np.array(
-                regression_results[..., 2, :], dtype=np.float)
+                signal_combination_ind[:, 0]] = pair_r_value
         return delay, slope, r_value
 
     def phase_slope_index(self, frequencies_of_interest=None,
@@ -751,31 +1700,276 @@ class Connectivity(object):
                Estimating the Flow Direction of Information in Complex
                Physical Systems. Physical Review Letters 100.
 
+        '''
+        return self.phase_slope_index_by_band(
+            [frequencies_of_interest],
+            frequency_resolution=frequency_resolution)[..., 0, :, :]
+
+    def phase_slope_index_by_band(self, frequency_bands,
+                                  frequency_resolution=None):
+        '''The phase slope index of each of several frequency bands.
+
+        Parameters
+        ----------
+        frequency_bands : dict or sequence of array-like, shape (2,)
+            The frequencies of interest of each band. If a dict, the
+            bands are its values.
+        frequency_resolution : float
+
+        Returns
+        -------
+        phase_slope_index : array, shape (..., n_bands, n_signals,
+                                          n_signals)
+
         '''
         frequencies = self.frequencies
-        bandpassed_coherency, bandpassed_frequencies = _bandpass(
-            self.coherency(), frequencies, frequencies_of_interest)
+        coherency = self.coherency()
 
         frequency_difference = frequencies[1] - frequencies[0]
         independent_frequency_step = _get_independent_frequency_step(
             frequency_difference, frequency_resolution)
-        frequency_index = np.arange(0, bandpassed_frequencies.shape[0],
-                                    independent_frequency_step)
-        bandpassed_coherency = bandpassed_coherency[
-            ..., frequency_index, :, :]
 
-        return _inner_combination(bandpassed_coherency).imag
+        phase_slope_index = []
+        for frequencies_of_interest in _get_band_edges(frequency_bands):
+            bandpassed_coherency, bandpassed_frequencies = _bandpass(
+                coherency, frequencies, frequencies_of_interest)
+            frequency_index = np.arange(0, bandpassed_frequencies.shape[0],
+                                        independent_frequency_step)
+            phase_slope_index.append(_inner_combination(
+                bandpassed_coherency[..., frequency_index, :, :]).imag)
+
+        return np.stack(phase_slope_index, axis=-3)
+
+
+def _get_band_edges(frequency_bands):
+    '''The frequencies of interest of each band of a dict or sequence of
+    bands.'''
+    try:
+        return list(frequency_bands.values())
+    except AttributeError:
+        return list(frequency_bands)
 
 
 def _inner_combination(data, axis=-3):
     '''Takes the inner product of all possible pairs of a
     dimension without regard to order (combinations)'''
-    combination_index = np.array(
-        list(combinations(range(data.shape[axis]), 2)))
-    combination_slice1 = np.take(data, combination_index[:, 0], axis)
-    combination_slice2 = np.take(data, combination_index[:, 1], axis)
-    return (combination_slice1.conjugate() * combination_slice2).sum(
-        axis=axis)
+    # Each element pairs with the sum of the elements before it, so this
+    # does not need an array of every combination.
+    preceding_sum = np.cumsum(data, axis=axis) - data
+    return (preceding_sum.conjugate() * data).sum(axis=axis)
+
+
+@jit(nopython=True)
+def _accumulate_phase_synchrony(
+        fourier_coefficients, signal1, signal2, is_trials_expectation,
+        is_tapers_expectation, phase_sum, imaginary_sign_sum,
+        imaginary_sum, imaginary_magnitude_sum, squared_imaginary_sum):
+    '''Sums the functions of the cross spectra that the phase synchrony
+    measures need over the trials and/or tapers, in place.
+
+    Parameters
+    ----------
+    fourier_coefficients : array, shape (n_time_windows, n_trials,
+                                         n_tapers, n_fft_samples,
+                                         n_signals)
+    signal1, signal2 : int arrays, shape (n_signal_pairs,)
+    is_trials_expectation, is_tapers_expectation : bool
+        Whether to sum over the trials and the tapers.
+    phase_sum, imaginary_sign_sum, imaginary_sum, imaginary_magnitude_sum,
+    squared_imaginary_sum : arrays, shape (n_time_windows, n_trials or 1,
+                                           n_tapers or 1, n_fft_samples,
+                                           n_signal_pairs)
+
+    '''
+    (n_time_windows, n_trials, n_tapers,
+     n_fft_samples, _) = fourier_coefficients.shape
+    n_signal_pairs = signal1.shape[0]
+    for time_ind in range(n_time_windows):
+        for trial_ind in range(n_trials):
+            sum_trial_ind = 0 if is_trials_expectation else trial_ind
+            for taper_ind in range(n_tapers):
+                sum_taper_ind = 0 if is_tapers_expectation else taper_ind
+                for fft_ind in range(n_fft_samples):
+                    coefficients = fourier_coefficients[
+                        time_ind, trial_ind, taper_ind, fft_ind]
+                    index = (time_ind, sum_trial_ind, sum_taper_ind, fft_ind)
+                    phase = phase_sum[index]
+                    imaginary_sign = imaginary_sign_sum[index]
+                    imaginary_total = imaginary_sum[index]
+                    imaginary_magnitude = imaginary_magnitude_sum[index]
+                    squared_imaginary = squared_imaginary_sum[index]
+                    for pair_ind in range(n_signal_pairs):
+                        coefficient1 = coefficients[signal1[pair_ind]]
+                        coefficient2 = coefficients[signal2[pair_ind]]
+                        real = (coefficient1.real * coefficient2.real +
+                                coefficient1.imag * coefficient2.imag)
+                        imaginary = (coefficient1.imag * coefficient2.real -
+                                     coefficient1.real * coefficient2.imag)
+                        magnitude = np.sqrt(real ** 2 + imaginary ** 2)
+                        if magnitude == 0:
+                            phase[pair_ind] += complex(np.nan, np.nan)
+                        else:
+                            phase[pair_ind] += complex(
+                                real, imaginary) * (1.0 / magnitude)
+                        if imaginary != imaginary:
+                            imaginary_sign[pair_ind] += np.nan
+                        else:
+                            imaginary_sign[pair_ind] += np.sign(imaginary)
+                        imaginary_total[pair_ind] += imaginary
+                        imaginary_magnitude[pair_ind] += abs(imaginary)
+                        squared_imaginary[pair_ind] += imaginary ** 2
+
+
+def _make_hashable(value):
+    '''Converts a measure argument to a hashable cache key.'''
+    if isinstance(value, np.ndarray):
+        return (value.dtype.str, value.shape, value.tobytes())
+    if isinstance(value, (list, tuple)):
+        return tuple(_make_hashable(item) for item in value)
+    return value
+
+
+def _read_only(measure):
+    '''A read-only view of `measure` that leaves `measure` writeable.
+
+    The arrays in a tuple or dict are also made read-only and a dict is
+    returned as a read-only mapping.
+
+    '''
+    if isinstance(measure, np.ndarray):
+        measure = measure.view()
+        measure.flags.writeable = False
+    elif isinstance(measure, tuple):
+        measure = tuple(_read_only(item) for item in measure)
+    elif isinstance(measure, dict):
+        measure = MappingProxyType(
+            {key: _read_only(value) for key, value in measure.items()})
+    return measure
+
+
+def _get_nbytes(value):
+    '''Size in bytes of an array or a tuple or mapping of arrays.'''
+    if isinstance(value, (list, tuple)):
+        return sum(_get_nbytes(item) for item in value)
+    if isinstance(value, Mapping):
+        return sum(_get_nbytes(item) for item in value.values())
+    return getattr(value, 'nbytes', 0)
+
+
+def _get_signal_pairs(n_signals):
+    '''Indices of the signals in each pair above the diagonal, in the order
+    of `itertools.combinations(range(n_signals), 2)`.'''
+    return np.triu_indices(n_signals, k=1)
+
+
+def get_signal_pairs_between_groups(group_labels, group1, group2):
+    '''All pairs of signals with one signal in each group, e.g. all pairs
+    of tetrodes between two brain areas from `tetrode_info.area`.
+
+    Parameters
+    ----------
+    group_labels : array-like, shape (n_signals,)
+        Links each signal to a group.
+    group1, group2 : object
+        Group labels. If they are the same, each pair within the group is
+        returned once.
+
+    Returns
+    -------
+    signal_pairs : tuple of arrays, shape (n_signal_pairs,)
+        The indices of the signal in `group1` and of the signal in
+        `group2`.
+
+    '''
+    group_labels = np.asarray(group_labels)
+    signal1, signal2 = np.meshgrid(
+        np.flatnonzero(group_labels == group1),
+        np.flatnonzero(group_labels == group2), indexing='ij')
+    signal1, signal2 = signal1.ravel(), signal2.ravel()
+    if group1 == group2:
+        is_upper = signal1 < signal2
+        signal1, signal2 = signal1[is_upper], signal2[is_upper]
+    return signal1, signal2
+
+
+def pack_signal_pairs(data):
+    '''Keeps the signal pairs above the diagonal of a symmetric,
+    antisymmetric or Hermitian measure.
+
+    Parameters
+    ----------
+    data : array, shape (..., n_signals, n_signals)
+
+    Returns
+    -------
+    packed_data : array, shape (..., n_signal_pairs)
+
+    '''
+    signal1, signal2 = _get_signal_pairs(data.shape[-1])
+    return data[..., signal1, signal2]
+
+
+def unpack_signal_pairs(packed_data, diagonal=np.nan,
+                        is_antisymmetric=False):
+    '''Rebuilds the square matrices from the signal pairs above the
+    diagonal.
+
+    The pairs below the diagonal are the complex conjugate of those above
+    it, which is the transpose for real measures.
+
+    Parameters
+    ----------
+    packed_data : array, shape (..., n_signal_pairs)
+    diagonal : float or array, shape (..., n_signals), optional
+    is_antisymmetric : bool, optional
+        If True, the pairs below the diagonal are negated, as for the
+        phase lag indices and the coherence phase.
+
+    Returns
+    -------
+    data : array, shape (..., n_signals, n_signals)
+
+    '''
+    n_signal_pairs = packed_data.shape[-1]
+    n_signals = int(np.round((1 + np.sqrt(1 + 8 * n_signal_pairs)) / 2))
+    signal1, signal2 = _get_signal_pairs(n_signals)
+    data = np.empty(packed_data.shape[:-1] + (n_signals, n_signals),
+                    dtype=np.result_type(packed_data, diagonal))
+    data[..., signal1, signal2] = packed_data
+    lower_triangle = packed_data.conjugate()
+    data[..., signal2, signal1] = (
+        -lower_triangle if is_antisymmetric else lower_triangle)
+    diagonal_ind = np.arange(n_signals)
+    data[..., diagonal_ind, diagonal_ind] = diagonal
+    return data
+
+
+def _get_two_sided_spectrum(one_sided_spectrum, n_fft_samples, axis=-3):
+    '''Rebuilds the negative frequencies of a cross spectral matrix of
+    real signals from its non-negative frequencies.
+
+    For real signals, X(-f) = X(f)*, so each element of the cross
+    spectral matrix satisfies S(-f) = S(f)*.
+
+    Parameters
+    ----------
+    one_sided_spectrum : array, shape (..., n_fft_samples // 2 + 1, ...)
+    n_fft_samples : int
+    axis : int, optional
+        The frequency axis.
+
+    Returns
+    -------
+    two_sided_spectrum : array, shape (..., n_fft_samples, ...)
+
+    '''
+    n_negative_frequencies = (
+        n_fft_samples - one_sided_spectrum.shape[axis])
+    negative_frequency_index = np.arange(n_negative_frequencies, 0, -1)
+    return np.concatenate(
+        (one_sided_spectrum,
+         np.take(one_sided_spectrum, negative_frequency_index,
+                 axis=axis).conjugate()), axis=axis)
 
 
 def _estimate_noise_covariance(minimum_phase):
@@ -837,6 +2031,126 @@ def _estimate_transfer_function(minimum_phase):
         np.linalg.inv(inverse_fourier_coefficients[..., 0:1, :, :]))
 
 
+def _fit_autoregressive_model(autocovariance, n_samples, criterion='bic'):
+    '''Fits a multivariate autoregressive (MVAR) model to the
+    autocovariance with the Levinson-Whittle-Robinson recursion.
+
+    The recursion solves the Yule-Walker equations for every order up to
+    the number of lags, from the forward and backward prediction errors
+    of the previous order. For each time window, the order that
+    minimizes the information criterion is kept.
+
+    Parameters
+    ----------
+    autocovariance : array, shape (..., n_lags, n_signals, n_signals)
+        Element [..., k, :, :] is E[x(t) x(t - k)^T].
+    n_samples : int
+        Number of samples the autocovariance was estimated from. Only
+        used by the information criterion.
+    criterion : ('bic' | 'aic' | None), optional
+        If None, the highest order (n_lags - 1) is used.
+
+    Returns
+    -------
+    coefficients : array, shape (..., n_lags - 1, n_signals, n_signals)
+        Coefficient [..., k - 1, :, :] weighs lag k. Coefficients above
+        the chosen order are zero.
+    noise_covariance : array, shape (..., n_signals, n_signals)
+    order : array, shape (...)
+
+    References
+    ----------
+    .. [1] Whittle, P. (1963). On the fitting of multivariate
+           autoregressions, and the approximate canonical factorization
+           of a spectral density matrix. Biometrika 50, 129-134.
+
+    '''
+    max_order = autocovariance.shape[-3] - 1
+    n_signals = autocovariance.shape[-1]
+    forward_coefficients = np.zeros(
+        autocovariance.shape[:-3] + (max_order, n_signals, n_signals),
+        dtype=autocovariance.dtype)
+    backward_coefficients = np.zeros_like(forward_coefficients)
+    forward_error = autocovariance[..., 0, :, :]
+    backward_error = autocovariance[..., 0, :, :]
+
+    penalty = {
+        'aic': lambda order: 2 * order * n_signals ** 2,
+        'bic': lambda order: order * n_signals ** 2 * np.log(n_samples),
+    }
+    best_coefficients = forward_coefficients.copy()
+    best_noise_covariance = forward_error.copy()
+    best_order = np.zeros(autocovariance.shape[:-3], dtype=int)
+    if criterion is not None:
+        best_criterion = np.asarray(
+            n_samples * np.linalg.slogdet(forward_error)[1])
+
+    for order in range(1, max_order + 1):
+        previous_forward = forward_coefficients[..., :order - 1, :, :]
+        previous_backward = backward_coefficients[..., :order - 1, :, :]
+        prediction_error = autocovariance[..., order, :, :] - np.sum(
+            np.matmul(previous_forward,
+                      autocovariance[..., 1:order, :, :][..., ::-1, :, :]),
+            axis=-3)
+        forward_reflection = np.linalg.solve(
+            backward_error, prediction_error.swapaxes(-1, -2)
+        ).swapaxes(-1, -2)
+        backward_reflection = np.linalg.solve(
+            forward_error, prediction_error).swapaxes(-1, -2)
+        (forward_coefficients[..., :order - 1, :, :],
+         backward_coefficients[..., :order - 1, :, :]) = (
+            previous_forward - np.matmul(
+                forward_reflection[..., np.newaxis, :, :],
+                previous_backward[..., ::-1, :, :]),
+            previous_backward - np.matmul(
+                backward_reflection[..., np.newaxis, :, :],
+                previous_forward[..., ::-1, :, :]))
+        forward_coefficients[..., order - 1, :, :] = forward_reflection
+        backward_coefficients[..., order - 1, :, :] = backward_reflection
+        forward_error = forward_error - np.matmul(
+            forward_reflection, prediction_error.swapaxes(-1, -2))
+        backward_error = backward_error - np.matmul(
+            backward_reflection, prediction_error)
+
+        if criterion is None:
+            is_better = np.ones(best_order.shape, dtype=bool)
+        else:
+            order_criterion = (
+                n_samples * np.linalg.slogdet(forward_error)[1] +
+                penalty[criterion](order))
+            is_better = order_criterion < best_criterion
+            best_criterion[is_better] = order_criterion[is_better]
+        best_coefficients[is_better] = forward_coefficients[is_better]
+        best_noise_covariance[is_better] = forward_error[is_better]
+        best_order[is_better] = order
+
+    return best_coefficients, best_noise_covariance, best_order
+
+
+def _get_MVAR_Fourier_coefficients(coefficients, n_fft_samples):
+    '''Fourier transform of the MVAR model polynomial
+    I - sum_k A_k exp(-2 pi i f k / n_fft_samples).
+
+    Parameters
+    ----------
+    coefficients : array, shape (..., order, n_signals, n_signals)
+    n_fft_samples : int
+
+    Returns
+    -------
+    MVAR_Fourier_coefficients : array, shape (..., n_fft_samples,
+                                              n_signals, n_signals)
+
+    '''
+    n_signals = coefficients.shape[-1]
+    lagged_coefficients = np.zeros(
+        coefficients.shape[:-3] + (n_fft_samples, n_signals, n_signals),
+        dtype=coefficients.dtype)
+    lagged_coefficients[..., 1:coefficients.shape[-3] + 1, :, :] = (
+        coefficients)
+    return np.eye(n_signals) - fft(lagged_coefficients, axis=-3)
+
+
 def _squared_magnitude(x):
     return np.abs(x) ** 2
 
@@ -921,52 +2235,84 @@ def _reshape(fourier_coefficients):
     return np.moveaxis(fourier_coefficients.reshape(new_shape), 1, -1)
 
 
-def _normalize_fourier_coefficients(fourier_coefficients):
-    '''Normalizes a group of fourier coefficients by power within group
+def _inverse_square_root(matrix):
+    '''Inverse square root of Hermitian positive semi-definite matrices.
+
+    Eigenvalues that cannot be told apart from zero stay zero, as in a
+    pseudo-inverse, so that groups with more signals than trials and
+    tapers are whitened within the space their signals span.
 
     Parameters
     ----------
-    fourier_coefficients : array, shape (n_time_windows, n_trials,
-                                         n_tapers, n_fft_samples,
-                                         n_signals)
+    matrix : array, shape (..., n_signals, n_signals)
 
     Returns
     -------
-    normalized_fourier_coefficients : array, shape (n_time_windows,
-                                                    n_fft_samples,
-                                                    n_signals,
-                                                    n_trials * n_tapers)
+    inverse_square_root : array, shape (..., n_signals, n_signals)
+
     '''
-    U, _, V_transpose = np.linalg.svd(
-        _reshape(fourier_coefficients), full_matrices=False)
-    return np.matmul(U, V_transpose)
+    eigenvalues, eigenvectors = np.linalg.eigh(matrix)
+    is_nonzero = eigenvalues > (
+        eigenvalues[..., -1:] * matrix.shape[-1] *
+        np.finfo(eigenvalues.dtype).eps)
+    inverse_square_root_eigenvalues = np.zeros_like(eigenvalues)
+    inverse_square_root_eigenvalues[is_nonzero] = 1 / np.sqrt(
+        eigenvalues[is_nonzero])
+    return np.matmul(
+        eigenvectors * inverse_square_root_eigenvalues[..., np.newaxis, :],
+        _conjugate_transpose(eigenvectors))
 
 
-def _estimate_canonical_coherence(normalized_fourier_coefficients1,
-                                  normalized_fourier_coefficients2):
-    '''Finds the maximum complex correlation between groups of signals
-    at each time and frequency.
+def _largest_eigenvalue(matrix, tolerance=1E-10, max_iterations=100):
+    '''Largest eigenvalue of Hermitian positive semi-definite matrices by
+    power iteration.
+
+    Only the matrices that have not converged are iterated. Matrices that
+    have not converged after `max_iterations` (because their two largest
+    eigenvalues are too close) are decomposed instead.
 
     Parameters
     ----------
-    normalized_fourier_coefficients1 : array, shape (n_time_windows,
-                                                     n_fft_samples,
-                                                     n_signals,
-                                                     n_trials * n_tapers)
-    normalized_fourier_coefficients2 : array, shape (n_time_windows,
-                                                     n_fft_samples,
-                                                     n_signals,
-                                                     n_trials * n_tapers)
+    matrix : array, shape (..., n, n)
+    tolerance : float, optional
+        Relative change in the eigenvalue at convergence.
+    max_iterations : int, optional
 
     Returns
     -------
-    canonical_coherence : array, shape (n_time_windows, n_fft_samples)
+    eigenvalue : array, shape (...,)
 
     '''
-    group_cross_spectrum = _complex_inner_product(
-        normalized_fourier_coefficients1, normalized_fourier_coefficients2)
-    return np.linalg.svd(group_cross_spectrum,
-                         full_matrices=False, compute_uv=False)[..., 0]
+    batch_shape, n = matrix.shape[:-2], matrix.shape[-1]
+    matrix = matrix.reshape((-1, n, n))
+    # A fixed random start is almost surely not orthogonal to the
+    # leading eigenvector.
+    random_state = np.random.RandomState(0)
+    start = random_state.randn(n) + 1j * random_state.randn(n)
+    vector = np.tile(start / np.linalg.norm(start), (matrix.shape[0], 1))
+    eigenvalue = np.zeros(matrix.shape[0])
+    is_active = np.arange(matrix.shape[0])
+
+    for _ in range(max_iterations):
+        product = np.matmul(
+            matrix[is_active], vector[is_active, :, np.newaxis])[..., 0]
+        # Rayleigh quotient of the current vector
+        new_eigenvalue = np.sum(
+            vector[is_active].conjugate() * product, axis=-1).real
+        is_converged = (np.abs(new_eigenvalue - eigenvalue[is_active]) <=
+                        tolerance * np.abs(new_eigenvalue))
+        eigenvalue[is_active] = new_eigenvalue
+        norm = np.linalg.norm(product, axis=-1)
+        norm[norm == 0] = 1
+        vector[is_active] = product / norm[:, np.newaxis]
+        is_active = is_active[~is_converged]
+        if is_active.size == 0:
+            break
+    else:
+        eigenvalue[is_active] = np.linalg.eigvalsh(
+            matrix[is_active])[..., -1]
+
+    return eigenvalue.reshape(batch_shape)
 
 
 def _bandpass(data, frequencies, frequencies_of_interest, axis=-3):
@@ -991,6 +2337,54 @@ def _bandpass(data, frequencies, frequencies_of_interest, axis=-3):
             frequencies[frequency_index])
 
 
+def _masked_linear_regression(x, y, is_included, axis=-2):
+    '''Least squares fit of a line to `y` over the points `is_included`,
+    for every other axis at once.
+
+    Matches `scipy.stats.mstats.linregress` applied along `axis` with the
+    points that are not included masked. Where no points are included
+    (or they all have the same `x`), the results are NaN.
+
+    Parameters
+    ----------
+    x : array, broadcastable to `y`
+    y : array
+    is_included : bool array, same shape as `y`
+    axis : int, optional
+
+    Returns
+    -------
+    slope : array
+    intercept : array
+    r_value : array
+        `y` with `axis` removed.
+
+    '''
+    x, y = np.broadcast_arrays(x, y)
+    weights = is_included.astype(float)
+    n_points = weights.sum(axis=axis)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_mean = np.sum(weights * x, axis=axis) / n_points
+        y_mean = np.sum(weights * y, axis=axis) / n_points
+        x_deviation = np.where(
+            is_included, x - np.expand_dims(x_mean, axis), 0.0)
+        y_deviation = np.where(
+            is_included, y - np.expand_dims(y_mean, axis), 0.0)
+        x_sum_of_squares = np.sum(x_deviation ** 2, axis=axis)
+        y_sum_of_squares = np.sum(y_deviation ** 2, axis=axis)
+        cross_sum_of_squares = np.sum(x_deviation * y_deviation, axis=axis)
+
+        slope = cross_sum_of_squares / x_sum_of_squares
+        r_value = np.clip(cross_sum_of_squares / np.sqrt(
+            x_sum_of_squares * y_sum_of_squares), -1.0, 1.0)
+    # linregress sets r to 0 for a constant response
+    r_value[(y_sum_of_squares == 0) & (x_sum_of_squares > 0)] = 0.0
+    slope[x_sum_of_squares == 0] = np.nan
+    r_value[x_sum_of_squares == 0] = np.nan
+    intercept = y_mean - slope * x_mean
+    return slope, intercept, r_value
+
+
 def _get_independent_frequency_step(frequency_difference,
                                     frequency_resolution):
     '''Find the number of points of a frequency axis such that they
@@ -1014,7 +2408,19 @@ def _get_independent_frequency_step(frequency_difference,
     return int(np.ceil(frequency_resolution / frequency_difference))
 
 
-def _find_largest_significant_group(is_significant):
+def _get_run_lengths(is_significant, axis=-1):
+    '''Position of each significant value within its run of consecutive
+    significant values along `axis`, counting from 1. Values that are not
+    significant are 0.'''
+    is_significant = np.moveaxis(np.asarray(is_significant, dtype=bool),
+                                 axis, -1)
+    index = np.arange(1, is_significant.shape[-1] + 1)
+    last_not_significant = np.maximum.accumulate(
+        np.where(is_significant, 0, index), axis=-1)
+    return np.moveaxis(index - last_not_significant, -1, axis)
+
+
+def _find_largest_significant_group(is_significant, axis=-1):
     '''Finds the largest cluster of significant values over frequencies.
 
     If frequency value is signficant and its neighbor in the next frequency
@@ -1027,43 +2433,47 @@ def _find_largest_significant_group(is_significant):
     Parameters
     ----------
     is_significant : bool array
+    axis : int, optional
+        The frequency axis. Clusters are found along every other axis at
+        once.
 
     Returns
     -------
     is_significant_largest : bool array
 
     '''
-    labeled, _ = label(is_significant)
-    label_groups, label_counts = np.unique(labeled, return_counts=True)
-
-    if not np.all(label_groups == 0):
-        label_counts[0] = 0
-        max_group = label_groups[np.argmax(label_counts)]
-        return labeled == max_group
-    else:
-        return np.zeros(is_significant.shape, dtype=bool)
+    run_lengths = _get_run_lengths(is_significant, axis=axis)
+    largest_length = np.max(run_lengths, axis=axis, keepdims=True)
+    # argmax returns the first run to reach the largest length
+    largest_end = np.argmax(run_lengths == largest_length, axis=axis)
+    index = np.arange(run_lengths.shape[axis]).reshape(
+        (-1,) + (1,) * (run_lengths.ndim - axis % run_lengths.ndim - 1))
+    largest_end = np.expand_dims(largest_end, axis)
+    return (index > largest_end - largest_length) & (index <= largest_end)
 
 
-def _get_independent_frequencies(is_significant, frequency_step):
+def _get_independent_frequencies(is_significant, frequency_step, axis=-1):
     '''Given a `frequency_step` that determines the distance to the next
     signficant point, sets non-distinguishable points to false.
 
     Parameters
     ----------
     is_significant : bool array
+    frequency_step : int
+    axis : int, optional
 
     Returns
     -------
     is_significant_independent : bool array
 
     '''
-    index = is_significant.nonzero()[0]
-    independent_index = index[0:len(index):frequency_step]
-    return np.in1d(np.arange(0, len(is_significant)), independent_index)
+    is_significant = np.asarray(is_significant, dtype=bool)
+    significant_rank = np.cumsum(is_significant, axis=axis) - 1
+    return is_significant & (significant_rank % frequency_step == 0)
 
 
 def _find_largest_independent_group(is_significant, frequency_step,
-                                    min_group_size=3):
+                                    min_group_size=3, axis=-1):
     '''Finds the largest signficant cluster of frequency points and
     returns the indpendent frequency points of that cluster
 
@@ -1074,18 +2484,20 @@ def _find_largest_independent_group(is_significant, frequency_step,
         The number of points between each independent frequency step
     min_group_size : int
         The minimum number of points for a group to be considered
+    axis : int, optional
+        The frequency axis.
 
     Returns
     -------
     is_significant : bool array
 
     '''
-    is_significant = _find_largest_significant_group(is_significant)
+    is_significant = _find_largest_significant_group(
+        is_significant, axis=axis)
     is_significant = _get_independent_frequencies(
-        is_significant, frequency_step)
-    if sum(is_significant) < min_group_size:
-        is_significant[:] = False
-    return is_significant
+        is_significant, frequency_step, axis=axis)
+    return is_significant & (
+        np.sum(is_significant, axis=axis, keepdims=True) >= min_group_size)
 
 
 def _find_significant_frequencies(
@@ -1126,11 +2538,39 @@ def _find_significant_frequencies(
     '''
     z_coherence = fisher_z_transform(coherency, bias)
     p_values = get_normal_distribution_p_values(z_coherence)
+    return _find_significant_groups(
+        p_values, frequency_step, significance_threshold, min_group_size,
+        multiple_comparisons_method)
+
+
+def _find_significant_groups(
+    p_values, frequency_step=1, significance_threshold=0.05,
+    min_group_size=3,
+        multiple_comparisons_method='Benjamini_Hochberg_procedure'):
+    '''Determines the largest significant cluster of `p_values` along the
+    frequency axis after correcting for multiple comparisons over all of
+    `p_values`.
+
+    Parameters
+    ----------
+    p_values : array, shape (..., n_frequencies, n_signal_combinations)
+    frequency_step : int
+    significance_threshold : float
+    min_group_size : int
+    multiple_comparisons_method : 'Benjamini_Hochberg_procedure' |
+                                  'Bonferroni_correction'
+
+    Returns
+    -------
+    is_significant : bool array, shape (..., n_frequencies,
+                                        n_signal_combintaions)
+
+    '''
     is_significant = adjust_for_multiple_comparisons(
-        p_values, alpha=significance_threshold)
-    return np.apply_along_axis(_find_largest_independent_group, -2,
-                               is_significant, frequency_step,
-                               min_group_size)
+        p_values, alpha=significance_threshold,
+        method=multiple_comparisons_method)
+    return _find_largest_independent_group(
+        is_significant, frequency_step, min_group_size, axis=-2)
 
 
 def _conjugate_transpose(x):
@@ -0,0 +1,181 @@
+'''Discrete Fourier transforms used by the spectral code.
+
+Every transform is routed through this module so that the implementation
+can be switched without changing the callers. Two backends are
+available:
+
+- 'scipy' (default) uses `scipy.fft` and splits batched transforms over
+  `workers` threads. With scipy < 1.4, which has no `scipy.fft`, it falls
+  back to `scipy.fftpack` (and `numpy.fft.rfft`) on a single thread.
+- 'pyfftw' uses FFTW through pyFFTW and caches the FFTW plans so that
+  repeated transforms of the same shape do not have to be planned again.
+  This requires the optional pyFFTW package.
+
+The backend and number of workers are chosen, in order of precedence, by
+the `backend` and `workers` arguments of each call, by `set_backend`, or
+by the SPECTRAL_FFT_BACKEND and SPECTRAL_FFT_WORKERS environment
+variables. By default one worker is used for each core the process is
+allowed to run on, which on a shared cluster node is the job's
+allocation rather than every core of the node.
+
+'''
+from collections import OrderedDict
+from logging import getLogger
+import os
+from os import environ
+from threading import Lock, get_ident
+
+import numpy as np
+import scipy.fftpack
+
+try:
+    import scipy.fft as scipy_fft
+except ImportError:
+    scipy_fft = None
+
+try:
+    import pyfftw
+    import pyfftw.builders
+except ImportError:
+    pyfftw = None
+
+logger = getLogger(__name__)
+
+BACKEND_ENVIRONMENT_VARIABLE = 'SPECTRAL_FFT_BACKEND'
+WORKERS_ENVIRONMENT_VARIABLE = 'SPECTRAL_FFT_WORKERS'
+MAX_CACHED_PLANS = 64
+
+_DEFAULTS = dict(backend=None, workers=None)
+_PLANS = OrderedDict()
+_PLANS_LOCK = Lock()
+
+
+def set_backend(backend=None, workers=None):
+    '''Sets the process-wide default backend and number of workers.
+
+    Parameters
+    ----------
+    backend : ('scipy' | 'pyfftw'), optional
+        If None, fall back to the SPECTRAL_FFT_BACKEND environment
+        variable.
+    workers : int, optional
+        If None, fall back to the SPECTRAL_FFT_WORKERS environment
+        variable.
+
+    '''
+    if backend is not None and backend not in BACKENDS:
+        raise ValueError('Unknown FFT backend: {0}'.format(backend))
+    _DEFAULTS['backend'] = backend
+    _DEFAULTS['workers'] = workers
+
+
+def get_backend(backend=None):
+    if backend is None:
+        backend = (_DEFAULTS['backend'] or
+                   environ.get(BACKEND_ENVIRONMENT_VARIABLE, 'scipy'))
+    if backend == 'pyfftw' and pyfftw is None:
+        logger.warning('pyFFTW is not installed, using scipy.fft')
+        backend = 'scipy'
+    return backend
+
+
+def get_workers(workers=None):
+    if workers is None:
+        workers = (_DEFAULTS['workers'] or
+                   environ.get(WORKERS_ENVIRONMENT_VARIABLE) or
+                   get_available_cores())
+    return int(workers)
+
+
+def get_available_cores():
+    '''Number of cores this process may run on. This respects the CPU
+    affinity set by cluster schedulers where the platform exposes it,
+    and is otherwise 1.'''
+    try:
+        return len(os.sched_getaffinity(0)) or 1
+    except AttributeError:
+        return 1
+
+
+def fft(x, n=None, axis=-1, backend=None, workers=None):
+    '''Discrete Fourier transform of `x` along `axis`, zero-padded or
+    truncated to `n` samples.'''
+    return _transform('fft', x, n, axis, backend, workers)
+
+
+def ifft(x, n=None, axis=-1, backend=None, workers=None):
+    '''Inverse discrete Fourier transform of `x` along `axis`.'''
+    return _transform('ifft', x, n, axis, backend, workers)
+
+
+def rfft(x, n=None, axis=-1, backend=None, workers=None):
+    '''Discrete Fourier transform of real `x` along `axis`. Only the
+    n // 2 + 1 non-negative frequencies are returned.'''
+    return _transform('rfft', x, n, axis, backend, workers)
+
+
+def next_fast_len(target):
+    '''Smallest 5-smooth length >= `target`. This matches
+    `scipy.fftpack.next_fast_len` so the default FFT lengths do not
+    depend on the backend.'''
+    return scipy.fftpack.next_fast_len(target)
+
+
+def clear_plans():
+    '''Removes all cached pyFFTW plans.'''
+    with _PLANS_LOCK:
+        _PLANS.clear()
+
+
+def _transform(kind, x, n, axis, backend, workers):
+    return BACKENDS[get_backend(backend)](
+        kind, x, n, axis, get_workers(workers))
+
+
+def _scipy_transform(kind, x, n, axis, workers):
+    if scipy_fft is None:
+        return _fftpack_transform(kind, x, n, axis)
+    return getattr(scipy_fft, kind)(x, n=n, axis=axis, workers=workers)
+
+
+def _fftpack_transform(kind, x, n, axis):
+    '''Transform for scipy < 1.4. `scipy.fftpack.rfft` packs the real and
+    imaginary parts into a real array, so the real-input transform is
+    numpy's, cast back to the precision of `x`.'''
+    if kind == 'rfft':
+        return np.fft.rfft(x, n=n, axis=axis).astype(
+            np.result_type(x, np.complex64), copy=False)
+    return getattr(scipy.fftpack, kind)(x, n=n, axis=axis)
+
+
+def _pyfftw_transform(kind, x, n, axis, workers):
+    '''Executes a cached FFTW plan for the shape and type of `x`.
+
+    Plans hold their own input and output arrays, so each thread gets its
+    own plans.
+
+    '''
+    x = np.asarray(x)
+    key = (kind, x.shape, x.dtype.str, n, axis % x.ndim, workers,
+           get_ident())
+    with _PLANS_LOCK:
+        plan = _PLANS.get(key)
+        if plan is None:
+            plan = getattr(pyfftw.builders, kind)(
+                pyfftw.empty_aligned(x.shape, dtype=x.dtype), n=n,
+                axis=axis, threads=workers, planner_effort='FFTW_ESTIMATE',
+                overwrite_input=False)
+            _PLANS[key] = plan
+            while len(_PLANS) > MAX_CACHED_PLANS:
+                _PLANS.popitem(last=False)
+        else:
+            _PLANS.move_to_end(key)
+    # The plan owns its output array, so copy it before the next call
+    # reuses the plan.
+    return plan(x).copy()
+
+
+BACKENDS = {
+    'scipy': _scipy_transform,
+    'pyfftw': _pyfftw_transform,
+}
@@ -1,10 +1,20 @@
+from concurrent.futures import ThreadPoolExecutor
 from logging import getLogger
 
 import numpy as np
-from scipy.fftpack import fft, ifft
+
+from .fft_backend import fft, get_workers, ifft
 
 logger = getLogger(__name__)
 
+# Convergence is checked relative to the size of the factor in single
+# precision because an absolute tolerance of 1E-8 is usually below the
+# rounding error of np.complex64.
+SINGLE_PRECISION_RELATIVE_TOLERANCE = 1E-5
+
+# Spacing of the time points factored first with the warm start.
+WARM_START_BLOCK_SIZE = 8
+
 
 def _conjugate_transpose(x):
     '''Conjugate transpose of the last two dimensions of array x'''
@@ -31,7 +41,7 @@ def _get_intial_conditions(cross_spectral_matrix):
     ).swapaxes(-1, -2)
 
 
-def _get_causal_signal(linear_predictor):
+def _get_causal_signal(linear_predictor, workers=None):
     '''Takes half the roots on the unit circle (zero lag) and all the roots
     inside the unit circle (positive lags).
 
@@ -42,6 +52,8 @@ def _get_causal_signal(linear_predictor):
     ----------
     linear_predictor : array, shape (..., n_fft_samples, n_signals,
                                      n_signals)
+    workers : int, optional
+        Number of threads of the FFTs. See `fft_backend.get_workers`.
 
     Returns
     -------
@@ -51,7 +63,8 @@ def _get_causal_signal(linear_predictor):
     '''
     n_signals = linear_predictor.shape[-1]
     n_fft_samples = linear_predictor.shape[-3]
-    linear_predictor_coefficients = ifft(linear_predictor, axis=-3)
+    linear_predictor_coefficients = ifft(linear_predictor, axis=-3,
+                                         workers=workers)
 
     # Take half of the roots on the unit circle
     linear_predictor_coefficients[..., 0, :, :] *= 0.5
@@ -63,7 +76,7 @@ def _get_causal_signal(linear_predictor):
 
     # Take only the roots inside the unit circle (positive lags)
     linear_predictor_coefficients[..., (n_fft_samples + 1) // 2:, :, :] = 0
-    return fft(linear_predictor_coefficients, axis=-3)
+    return fft(linear_predictor_coefficients, axis=-3, workers=workers)
 
 
 def _check_convergence(current, old, tolerance=1E-8):
@@ -91,10 +104,39 @@ def _check_convergence(current, old, tolerance=1E-8):
     return error < tolerance
 
 
+def _get_tolerance(minimum_phase_factor, tolerance):
+    '''Convergence tolerance for each time point.
+
+    In double precision this is just `tolerance`. In single precision, the
+    tolerance is raised to at least `SINGLE_PRECISION_RELATIVE_TOLERANCE`
+    times the largest magnitude of the factor at each time point.
+
+    Parameters
+    ----------
+    minimum_phase_factor : array, shape (n_time_points, ...)
+    tolerance : float
+
+    Returns
+    -------
+    tolerance : float or array, shape (n_time_points,)
+
+    '''
+    if minimum_phase_factor.dtype != np.complex64:
+        return tolerance
+    n_time_points = minimum_phase_factor.shape[0]
+    factor_magnitude = np.abs(
+        minimum_phase_factor.reshape((n_time_points, -1))).max(axis=1)
+    return np.maximum(
+        tolerance, SINGLE_PRECISION_RELATIVE_TOLERANCE * factor_magnitude)
+
+
 def _get_linear_predictor(minimum_phase_factor, cross_spectral_matrix, I):
     '''Measure how close the minimum phase factor is to the original
     cross spectral matrix.
 
+    Both sides of the sandwich use the same inverse, so the factor is
+    only factorized once.
+
     Parameters
     ----------
     minimum_phase_factor : array, shape (n_time_samples, ...,
@@ -115,16 +157,18 @@ def _get_linear_predictor(minimum_phase_factor, cross_spectral_matrix, I):
         How much to adjust for the next guess for minimum phase factor.
 
     '''
-    covariance_sandwich_estimator = np.linalg.solve(
-        minimum_phase_factor, cross_spectral_matrix)
-    covariance_sandwich_estimator = np.linalg.solve(
-        minimum_phase_factor,
-        _conjugate_transpose(covariance_sandwich_estimator))
+    inverse_minimum_phase_factor = np.linalg.inv(minimum_phase_factor)
+    covariance_sandwich_estimator = np.matmul(
+        np.matmul(inverse_minimum_phase_factor, cross_spectral_matrix),
+        _conjugate_transpose(inverse_minimum_phase_factor))
     return covariance_sandwich_estimator + I
 
 
 def minimum_phase_decomposition(cross_spectral_matrix, tolerance=1E-8,
-                                max_iterations=30):
+                                max_iterations=30,
+                                return_n_iterations=False, warm_start=False,
+                                block_size=WARM_START_BLOCK_SIZE,
+                                n_workers=1, chunk_size=None):
     '''Find a minimum phase matrix square root of the cross spectral
     density using the Wilson algorithm.
 
@@ -137,6 +181,30 @@ def minimum_phase_decomposition(cross_spectral_matrix, tolerance=1E-8,
         The maximum difference between guesses.
     max_iterations : int
         The maximum number of iterations for the algorithm to converge.
+    return_n_iterations : bool, optional
+        Also return the number of iterations run for each time sample.
+    warm_start : bool, optional
+        If False, every time sample starts from the Cholesky factor of
+        its lag 0 covariance. If True, every `block_size`-th time sample
+        is factored this way first, and all the other time samples then
+        start from the converged factor of the nearest of these. For the
+        slowly changing cross spectra of overlapping time windows this
+        takes fewer iterations. A time sample starts from (or falls back
+        to) the Cholesky guess if its neighbor or its warm start did not
+        converge.
+    block_size : int, optional
+        Spacing of the time samples factored first when `warm_start` is
+        True.
+    n_workers : int, optional
+        Number of threads that factor chunks of time samples at the same
+        time. NumPy and the FFTs release the GIL, so chunks run in
+        parallel. The factors are the same as with one worker. The FFT
+        workers (`fft_backend.get_workers`) are split between the
+        threads so the cores are not oversubscribed.
+    chunk_size : int, optional
+        Number of time samples factored together. Smaller chunks use less
+        temporary memory and balance the work between workers better. By
+        default, the time samples are split evenly between the workers.
 
     Returns
     -------
@@ -145,33 +213,213 @@ def minimum_phase_decomposition(cross_spectral_matrix, tolerance=1E-8,
                                          n_signals)
         The square root of the `cross_spectral_matrix` where all the poles
         are inside the unit circle (minimum phase).
+    n_iterations : array, shape (n_time_samples,)
+        Only if `return_n_iterations` is True.
+
+    Notes
+    -----
+    Each iteration only updates the time samples that have not converged
+    yet, so later iterations get cheaper as time samples converge.
+
+    The warm start does not chain time samples one after the other. For
+    estimated cross spectra the factor at the Nyquist lag is not fully
+    determined, so where the iterations end depends on the initial guess
+    and chained warm starts drift away from the Cholesky-started factor.
+    Starting only from Cholesky-started neighbors keeps the difference
+    small: on a spectrogram of a simulated 4 signal autoregressive process
+    the median change in pairwise spectral Granger prediction was 2E-3.
+
+    The factorization is computed in the precision of
+    `cross_spectral_matrix`. For single precision (np.complex64) inputs,
+    the iterations stop once the factor changes by less than
+    `SINGLE_PRECISION_RELATIVE_TOLERANCE` (1E-5) of its largest magnitude
+    at each time point. The factor then agrees with the double precision
+    factor to a relative error of roughly 1E-4 for well-conditioned
+    cross spectral matrices. The error grows with the condition number
+    of the cross spectral matrix.
+
+    '''
+    n_time_points = cross_spectral_matrix.shape[0]
+    dtype = np.result_type(cross_spectral_matrix, np.complex64)
+    minimum_phase_factor = np.zeros(cross_spectral_matrix.shape,
+                                    dtype=dtype)
+    n_iterations = np.zeros(n_time_points, dtype=int)
+    is_converged = np.zeros(n_time_points, dtype=bool)
+
+    if warm_start:
+        anchor_ind = np.arange(0, n_time_points, block_size)
+        time_ind = np.setdiff1d(np.arange(n_time_points), anchor_ind)
+        nearest_anchor_ind = np.clip(
+            np.round(time_ind / block_size).astype(int) * block_size,
+            0, anchor_ind[-1])
+        rounds = [(anchor_ind, None), (time_ind, nearest_anchor_ind)]
+    else:
+        rounds = [(np.arange(n_time_points), None)]
+
+    for time_ind, neighbor_ind in rounds:
+        if time_ind.size == 0:
+            continue
+        if neighbor_ind is None:
+            is_cold = np.ones(time_ind.size, dtype=bool)
+        else:
+            is_cold = ~is_converged[neighbor_ind]
+            minimum_phase_factor[time_ind] = minimum_phase_factor[
+                neighbor_ind]
+        cold_ind = time_ind[is_cold]
+        if time_ind.size == n_time_points:
+            # Slices do not copy the arrays, so the factor is updated in
+            # place.
+            time_ind = slice(None)
+            if cold_ind.size == n_time_points:
+                cold_ind = time_ind
+        minimum_phase_factor[cold_ind] = _get_intial_conditions(
+            cross_spectral_matrix[cold_ind])
+        (factor, n_iterations[time_ind],
+         is_converged[time_ind]) = _wilson_iterations_in_chunks(
+            cross_spectral_matrix[time_ind], minimum_phase_factor[time_ind],
+            tolerance, max_iterations, n_workers, chunk_size)
+        if not isinstance(time_ind, slice):
+            minimum_phase_factor[time_ind] = factor
+
+        # Start again from the Cholesky guess if a warm start did not
+        # converge.
+        retry_ind = np.arange(n_time_points)[time_ind][
+            ~is_cold & ~is_converged[time_ind]]
+        if retry_ind.size > 0:
+            logger.debug('Warm start did not converge for {0} time points'
+                         .format(retry_ind.size))
+            minimum_phase_factor[retry_ind] = _get_intial_conditions(
+                cross_spectral_matrix[retry_ind])
+            (minimum_phase_factor[retry_ind], n_retry_iterations,
+             is_converged[retry_ind]) = _wilson_iterations_in_chunks(
+                cross_spectral_matrix[retry_ind],
+                minimum_phase_factor[retry_ind], tolerance, max_iterations,
+                n_workers, chunk_size)
+            n_iterations[retry_ind] += n_retry_iterations
+
+    if not np.all(is_converged):
+        logger.warning(
+            'Maximum iterations reached. {} of {} converged'.format(
+                is_converged.sum(), n_time_points))
+    logger.debug('Wilson iterations per time point: min {0}, median {1}, '
+                 'max {2}, total {3}'.format(
+                     n_iterations.min(), np.median(n_iterations),
+                     n_iterations.max(), n_iterations.sum()))
+    if return_n_iterations:
+        return minimum_phase_factor, n_iterations
+    return minimum_phase_factor
+
+
+def _wilson_iterations_in_chunks(cross_spectral_matrix,
+                                 minimum_phase_factor, tolerance,
+                                 max_iterations, n_workers=1,
+                                 chunk_size=None):
+    '''Runs `_wilson_iterations` on chunks of time points, in parallel if
+    `n_workers` is more than one.
+
+    Time points are factored independently, so the result does not
+    depend on the chunks. Each of the parallel chunks gets an equal share
+    of the FFT workers.
+
+    '''
+    n_time_points = cross_spectral_matrix.shape[0]
+    if chunk_size is None:
+        chunk_size = -(-n_time_points // n_workers)
+    if chunk_size >= n_time_points:
+        return _wilson_iterations(cross_spectral_matrix,
+                                  minimum_phase_factor, tolerance,
+                                  max_iterations)
+
+    n_iterations = np.zeros(n_time_points, dtype=int)
+    is_converged = np.zeros(n_time_points, dtype=bool)
+    chunks = [slice(start, start + chunk_size)
+              for start in range(0, n_time_points, chunk_size)]
+    fft_workers = max(1, get_workers() // min(n_workers, len(chunks)))
+
+    def _factor_chunk(chunk):
+        # The factor of the chunk is a view that is updated in place.
+        _, n_iterations[chunk], is_converged[chunk] = _wilson_iterations(
+            cross_spectral_matrix[chunk], minimum_phase_factor[chunk],
+            tolerance, max_iterations, fft_workers)
+
+    if n_workers > 1:
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            list(executor.map(_factor_chunk, chunks))
+    else:
+        for chunk in chunks:
+            _factor_chunk(chunk)
+    return minimum_phase_factor, n_iterations, is_converged
+
+
+def _wilson_iterations(cross_spectral_matrix, minimum_phase_factor,
+                       tolerance, max_iterations, fft_workers=None):
+    '''Refines the guess `minimum_phase_factor` of the minimum phase
+    factor of each time point until it converges.
+
+    Parameters
+    ----------
+    cross_spectral_matrix : array, shape (n_time_samples, ...,
+                                          n_fft_samples, n_signals,
+                                          n_signals)
+    minimum_phase_factor : array, shape (n_time_samples, ...,
+                                         n_fft_samples, n_signals,
+                                         n_signals)
+        The initial guess. It is overwritten.
+    tolerance : float
+    max_iterations : int
+    fft_workers : int, optional
+        Number of threads of each FFT.
+
+    Returns
+    -------
+    minimum_phase_factor : array, shape (n_time_samples, ...,
+                                         n_fft_samples, n_signals,
+                                         n_signals)
+    n_iterations : array, shape (n_time_samples,)
+    is_converged : array, shape (n_time_samples,)
 
     '''
     n_time_points = cross_spectral_matrix.shape[0]
     n_signals = cross_spectral_matrix.shape[-1]
-    I = np.eye(n_signals)
+    I = np.eye(n_signals, dtype=minimum_phase_factor.dtype)
+    tolerance = np.broadcast_to(
+        _get_tolerance(minimum_phase_factor, tolerance), (n_time_points,))
+    n_iterations = np.zeros(n_time_points, dtype=int)
     is_converged = np.zeros(n_time_points, dtype=bool)
-    minimum_phase_factor = np.zeros(cross_spectral_matrix.shape)
-    minimum_phase_factor[..., :, :, :] = _get_intial_conditions(
-        cross_spectral_matrix)
+
+    # The working set of time points that have not converged. It only
+    # shrinks (and is copied) when time points converge.
+    active_ind = np.arange(n_time_points)
+    active_factor = minimum_phase_factor
+    active_cross_spectral_matrix = cross_spectral_matrix
+    active_tolerance = tolerance
 
     for iteration in range(max_iterations):
-        logger.debug('iteration: {0}'.format(iteration))
-        old_minimum_phase_factor = minimum_phase_factor.copy()
+        logger.debug('iteration: {0}, {1} time points not converged'.format(
+            iteration, active_ind.size))
         linear_predictor = _get_linear_predictor(
-            minimum_phase_factor, cross_spectral_matrix, I)
-        minimum_phase_factor = np.matmul(
-            minimum_phase_factor, _get_causal_signal(linear_predictor))
-
-        # If already converged at a time point, don't change.
-        minimum_phase_factor[is_converged, ...] = old_minimum_phase_factor[
-            is_converged, ...]
-        is_converged = _check_convergence(
-            minimum_phase_factor, old_minimum_phase_factor, tolerance)
-        if np.all(is_converged):
-            return minimum_phase_factor
+            active_factor, active_cross_spectral_matrix, I)
+        old_active_factor = active_factor
+        active_factor = np.matmul(
+            active_factor, _get_causal_signal(linear_predictor,
+                                              fft_workers))
+        n_iterations[active_ind] += 1
+
+        is_active_converged = _check_convergence(
+            active_factor, old_active_factor, active_tolerance)
+        if np.any(is_active_converged):
+            minimum_phase_factor[active_ind[is_active_converged]] = (
+                active_factor[is_active_converged])
+            is_converged[active_ind[is_active_converged]] = True
+            is_active = ~is_active_converged
+            active_ind = active_ind[is_active]
+            active_factor = active_factor[is_active]
+            active_cross_spectral_matrix = active_cross_spectral_matrix[
+                is_active]
+            active_tolerance = active_tolerance[is_active]
+        if active_ind.size == 0:
+            break
     else:
-        logger.warning(
-            'Maximum iterations reached. {} of {} converged'.format(
-                is_converged.sum(), len(is_converged)))
-        return minimum_phase_factor
+        minimum_phase_factor[active_ind] = active_factor
+
+    return minimum_phase_factor, n_iterations, is_converged
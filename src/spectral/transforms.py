@@ -1,14 +1,29 @@
+from collections import OrderedDict, namedtuple
+from functools import lru_cache, partial
 from logging import getLogger
+from os import environ, makedirs, remove, replace
+from os.path import isfile, join
+from tempfile import NamedTemporaryFile
 
 import numpy as np
-from numpy.fft import fftfreq
+from numpy.fft import fftfreq, rfftfreq
 from scipy import interpolate
-from scipy.fftpack import fft, ifft, next_fast_len
-from scipy.linalg import eigvals_banded
-from scipy.signal import detrend
+from scipy.linalg import eigh_tridiagonal, eigvals_banded
+from scipy.signal import firwin, resample_poly
+
+from .fft_backend import fft, ifft, next_fast_len, rfft
 
 logger = getLogger(__name__)
 
+MEMORY_BUDGET = 2 ** 30  # bytes
+TILE_SIZE = 2 ** 18  # bytes
+# Fraction of the decimated Nyquist frequency kept free of aliasing
+DECIMATION_PASSBAND = 0.8
+
+CacheInfo = namedtuple('CacheInfo',
+                       ['hits', 'disk_hits', 'misses', 'maxsize',
+                        'currsize'])
+
 
 class Multitaper(object):
     '''Transform time-domain signal(s) to the frequency domain by using
@@ -29,6 +44,27 @@ class Multitaper(object):
     n_tapers : int, optional
     n_time_samples_per_window : int, optional
     n_time_samples_per_step : int, optional
+    is_one_sided : bool, optional
+        Use the real-input FFT and only compute the non-negative
+        frequencies. The time series must be real.
+    dtype : np.complex128 | np.complex64, optional
+        Data type of the Fourier coefficients. With np.complex64, the
+        time series and tapers are cast to np.float32 and the tapering and
+        FFT are done in single precision, halving memory use.
+    frequencies_of_interest : array-like, shape (2,), optional
+        Lower and upper frequency (inclusive) of a band. If given, only
+        the non-negative, below-Nyquist frequencies of the FFT grid that
+        fall in the band are evaluated, by a direct DFT, a chirp-z
+        transform or an FFT, whichever is cheapest for the band.
+    max_frequency_of_interest : float, optional
+        If given, the time series is low-pass filtered and decimated by
+        the largest integer factor that keeps this frequency below
+        `DECIMATION_PASSBAND` times the new Nyquist frequency.
+        `sampling_frequency` becomes the decimated sampling frequency, so
+        `time` and `frequencies` stay correct. Parameters given in
+        samples rather than seconds (`n_time_samples_per_window`,
+        `n_time_samples_per_step`, `n_fft_samples` and `tapers`) refer to
+        the decimated time series.
 
     '''
 
@@ -38,10 +74,19 @@ class Multitaper(object):
                  time_window_step=None, n_tapers=None,  tapers=None,
                  start_time=0, n_fft_samples=None,
                  n_time_samples_per_window=None,
-                 n_time_samples_per_step=None, is_low_bias=True):
-
-        self.time_series = time_series
-        self.sampling_frequency = sampling_frequency
+                 n_time_samples_per_step=None, is_low_bias=True,
+                 is_one_sided=False, dtype=np.complex128,
+                 frequencies_of_interest=None,
+                 max_frequency_of_interest=None):
+
+        self.decimation_factor = (
+            1 if max_frequency_of_interest is None else
+            _get_decimation_factor(sampling_frequency,
+                                   max_frequency_of_interest))
+        self.time_series = _decimate(time_series, self.decimation_factor)
+        self.sampling_frequency = (
+            sampling_frequency / self.decimation_factor
+            if self.decimation_factor > 1 else sampling_frequency)
         self.time_halfbandwidth_product = time_halfbandwidth_product
         self.detrend_type = detrend_type
         self._time_window_duration = time_window_duration
@@ -53,6 +98,9 @@ class Multitaper(object):
         self._n_tapers = n_tapers
         self._n_time_samples_per_window = n_time_samples_per_window
         self._n_samples_per_time_step = n_time_samples_per_step
+        self.is_one_sided = is_one_sided
+        self.dtype = np.dtype(dtype)
+        self.frequencies_of_interest = frequencies_of_interest
 
     def __repr__(self):
         return (
@@ -73,6 +121,7 @@ class Multitaper(object):
                 self.n_time_samples_per_window, self.sampling_frequency,
                 self.time_halfbandwidth_product, self.n_tapers,
                 is_low_bias=self.is_low_bias)
+            logger.debug(TAPER_CACHE.cache_info())
         return self._tapers
 
     @property
@@ -121,8 +170,27 @@ class Multitaper(object):
 
     @property
     def frequencies(self):
+        '''Frequencies of the Fourier coefficients. If `is_one_sided`,
+        only the non-negative frequencies (n_fft_samples // 2 + 1) are
+        returned. If `frequencies_of_interest` is set, only the
+        frequencies in the band are returned.'''
+        if self.frequencies_of_interest is not None:
+            return fftfreq(self.n_fft_samples, 1.0 / self.sampling_frequency)[
+                self._frequency_index]
+        if self.is_one_sided:
+            return rfftfreq(self.n_fft_samples,
+                            1.0 / self.sampling_frequency)
         return fftfreq(self.n_fft_samples, 1.0 / self.sampling_frequency)
 
+    @property
+    def _frequency_index(self):
+        '''Index of the FFT frequencies in `frequencies_of_interest`.'''
+        if self.frequencies_of_interest is None:
+            return None
+        return _get_frequency_index(
+            self.n_fft_samples, self.sampling_frequency,
+            self.frequencies_of_interest)
+
     @property
     def n_time_samples_per_step(self):
         '''If `time_window_step` is set, then calculate the
@@ -176,17 +244,178 @@ class Multitaper(object):
                                              n_signals)
 
         '''
-        time_series = _add_axes(self.time_series)
-        time_series = _sliding_window(
-            time_series, window_size=self.n_time_samples_per_window,
-            step_size=self.n_time_samples_per_step, axis=0)
-        time_series = detrend(time_series, type=self.detrend_type)
+        logger.info(self)
+        return self._fft_block(self._time_windows())
+
+    def iter_fft(self, memory_budget=MEMORY_BUDGET,
+                 n_windows_per_block=None):
+        '''Compute the multitaper Fourier coefficients a block of time
+        windows at a time.
+
+        Only one block of windows is copied, detrended and transformed
+        at once, so peak memory is bounded by `memory_budget` rather than
+        the length of the time series. Concatenating the blocks along the
+        first axis gives the same result as `fft`.
+
+        Parameters
+        ----------
+        memory_budget : int, optional
+            Approximate maximum number of bytes used to compute one block.
+        n_windows_per_block : int, optional
+            Number of time windows per block. Overrides `memory_budget`.
+
+        Yields
+        ------
+        fourier_coefficients : array, shape (n_windows_in_block, n_trials,
+                                             n_tapers, n_fft_samples,
+                                             n_signals)
 
+        '''
+        time_windows = self._time_windows()
+        n_time_windows = time_windows.shape[0]
+        if n_windows_per_block is None:
+            n_windows_per_block = self._get_n_windows_per_block(
+                memory_budget)
         logger.info(self)
+        logger.debug('{0} time windows per block'.format(
+            n_windows_per_block))
+
+        # Every block is tapered into the same buffer
+        tapered_buffer = self._empty_tapered_buffer(
+            min(n_windows_per_block, n_time_windows))
+        for block_start in range(0, n_time_windows, n_windows_per_block):
+            block = time_windows[
+                block_start:block_start + n_windows_per_block]
+            yield self._fft_block(
+                block, tapered_buffer=tapered_buffer[:block.shape[0]])
+
+    def _time_windows(self):
+        '''Strided view of the time series split into time windows.
+
+        Returns
+        -------
+        time_windows : array, shape (n_time_windows, n_trials, n_signals,
+                                     n_time_samples_per_window)
+
+        '''
+        return _sliding_window(
+            _add_axes(self.time_series),
+            window_size=self.n_time_samples_per_window,
+            step_size=self.n_time_samples_per_step, axis=0, is_copy=False)
+
+    def _fft_block(self, time_windows, tapered_buffer=None):
+        return _fused_multitaper_fft(
+            time_windows, self.tapers, self.n_fft_samples,
+            self.sampling_frequency, detrend_type=self.detrend_type,
+            is_one_sided=self.is_one_sided, dtype=self.dtype,
+            tapered_buffer=tapered_buffer,
+            frequency_index=self._frequency_index)
+
+    def _empty_tapered_buffer(self, n_time_windows):
+        return np.empty(
+            (n_time_windows, self.n_trials, self.tapers.shape[1],
+             self.n_time_samples_per_window, self.n_signals),
+            dtype=np.finfo(self.dtype).dtype)
+
+    def _get_n_windows_per_block(self, memory_budget):
+        '''Number of time windows whose tapered copies and Fourier
+        coefficients fit within `memory_budget` bytes.'''
+        n_tapers = self.tapers.shape[1]
+        n_samples_per_window = self.n_trials * self.n_signals * n_tapers
+        n_bytes_per_window = n_samples_per_window * (
+            np.finfo(self.dtype).dtype.itemsize *
+            self.n_time_samples_per_window +
+            2 * self.dtype.itemsize * self.frequencies.size)
+        return max(1, int(memory_budget // n_bytes_per_window))
+
+
+def _get_decimation_factor(sampling_frequency, max_frequency_of_interest):
+    '''Largest integer factor the sampling frequency can be divided by
+    while keeping `max_frequency_of_interest` in the passband of the
+    anti-aliasing filter.'''
+    return max(1, int(np.floor(
+        DECIMATION_PASSBAND * sampling_frequency /
+        (2 * max_frequency_of_interest))))
+
+
+@lru_cache(maxsize=None)
+def _get_decimation_filter(decimation_factor):
+    '''Low-pass FIR filter with a cutoff at the decimated Nyquist
+    frequency. This is the same Kaiser window design that
+    `scipy.signal.resample_poly` uses by default.'''
+    half_length = 10 * decimation_factor
+    filter_coefficients = firwin(2 * half_length + 1,
+                                 1.0 / decimation_factor,
+                                 window=('kaiser', 5.0))
+    filter_coefficients.flags.writeable = False
+    return filter_coefficients
+
+
+def _decimate(time_series, decimation_factor, axis=0):
+    '''Anti-alias filters and downsamples the time series with a polyphase
+    filter. Sample i of the result is aligned with sample
+    i * decimation_factor of the original.'''
+    if decimation_factor == 1:
+        return time_series
+    return resample_poly(time_series, 1, decimation_factor, axis=axis,
+                         window=_get_decimation_filter(decimation_factor))
+
+
+def ragged_multitaper_fft(time_series, segment_offsets,
+                          **multitaper_params):
+    '''Multitaper Fourier coefficients of segments of different lengths.
+
+    The segments are concatenated in one buffer, so no padding is needed.
+    Segments with the same length are stacked as trials and transformed
+    together, so each length uses one set of tapers and one batched FFT.
+
+    Parameters
+    ----------
+    time_series : array, shape (n_time_samples, n_signals) or
+                               (n_time_samples,)
+        The segments, one after the other.
+    segment_offsets : array of int, shape (n_segments + 1,)
+        Start of each segment in `time_series`, followed by the end of
+        the last segment.
+    multitaper_params : dict
+        Arguments passed on to `Multitaper`. By default, each segment is a
+        single time window.
+
+    Returns
+    -------
+    fourier_coefficients : list of arrays, length n_segments
+        The coefficients of each segment, each with shape
+        (n_time_windows, 1, n_tapers, n_fft_samples, n_signals).
+    frequencies : list of arrays, length n_segments
+        The frequencies of each segment's coefficients.
 
-        return _multitaper_fft(
-            self.tapers, time_series, self.n_fft_samples,
-            self.sampling_frequency).swapaxes(2, -1)
+    '''
+    segment_offsets = np.asarray(segment_offsets)
+    segment_starts = segment_offsets[:-1]
+    segment_lengths = np.diff(segment_offsets)
+    if np.any(segment_lengths < 1):
+        raise ValueError('Segments must contain at least one sample')
+    time_series = np.asarray(time_series)
+    if time_series.ndim == 1:
+        time_series = time_series[:, np.newaxis]
+
+    n_segments = segment_lengths.size
+    fourier_coefficients = [None] * n_segments
+    frequencies = [None] * n_segments
+    for segment_length in np.unique(segment_lengths):
+        segment_index = np.flatnonzero(segment_lengths == segment_length)
+        # shape (n_time_samples, n_segments_in_group, n_signals)
+        time_index = (segment_starts[segment_index] +
+                      np.arange(segment_length)[:, np.newaxis])
+        m = Multitaper(time_series[time_index], **multitaper_params)
+        logger.debug('{0} segments of {1} samples'.format(
+            segment_index.size, segment_length))
+        group_coefficients = m.fft()
+        for trial_ind, segment_ind in enumerate(segment_index):
+            fourier_coefficients[segment_ind] = group_coefficients[
+                :, trial_ind:trial_ind + 1]
+            frequencies[segment_ind] = m.frequencies
+    return fourier_coefficients, frequencies
 
 
 def _add_axes(time_series):
@@ -265,7 +494,7 @@ def _sliding_window(data, window_size, step_size=1,
 
 
 def _multitaper_fft(tapers, time_series, n_fft_samples,
-                    sampling_frequency, axis=-2):
+                    sampling_frequency, axis=-2, is_one_sided=False):
     '''Projects the data on the tapers and returns the discrete Fourier
     transform
 
@@ -276,6 +505,9 @@ def _multitaper_fft(tapers, time_series, n_fft_samples,
                                      n_time_samples_per_window)
     n_fft_samples : int
     sampling_frequency : int
+    is_one_sided : bool
+        Only compute the n_fft_samples // 2 + 1 non-negative frequencies
+        with the real-input FFT.
 
     Returns
     -------
@@ -285,8 +517,250 @@ def _multitaper_fft(tapers, time_series, n_fft_samples,
     '''
     projected_time_series = (time_series[..., np.newaxis] *
                              tapers[np.newaxis, np.newaxis, ...])
-    return (fft(projected_time_series, n=n_fft_samples, axis=axis) /
-            sampling_frequency)
+    transform = rfft if is_one_sided else fft
+    fourier_coefficients = transform(
+        projected_time_series, n=n_fft_samples, axis=axis)
+    fourier_coefficients /= sampling_frequency
+    return fourier_coefficients
+
+
+def _fused_multitaper_fft(time_windows, tapers, n_fft_samples,
+                          sampling_frequency, detrend_type='constant',
+                          is_one_sided=False, dtype=np.complex128,
+                          tapered_buffer=None, tile_size=TILE_SIZE,
+                          frequency_index=None, band_transform=None):
+    '''Detrends, tapers and transforms the time windows in one pass.
+
+    The windows are read straight from the strided view. Each tile of
+    `tile_size` bytes is detrended and multiplied by the tapers into
+    `tapered_buffer`, so the only full size intermediate is the tapered
+    data. The transform is taken along the time axis of the buffer, which
+    gives the Fourier coefficients in their final layout without a copy.
+
+    If `frequency_index` is given, only those FFT frequencies are
+    evaluated (see `_get_band_transform`).
+
+    Parameters
+    ----------
+    time_windows : array_like, shape (n_windows, n_trials, n_signals,
+                                      n_time_samples_per_window)
+    tapers : array_like, shape (n_time_samples_per_window, n_tapers)
+    n_fft_samples : int
+    sampling_frequency : int
+    detrend_type : ('constant' | 'linear'), optional
+    is_one_sided : bool, optional
+    dtype : complex dtype, optional
+    tapered_buffer : array, optional
+        Real array of shape (n_windows, n_trials, n_tapers,
+        n_time_samples_per_window, n_signals) to reuse.
+    tile_size : int, optional
+        Approximate number of bytes tapered at once.
+    frequency_index : array of int, optional
+        Contiguous, non-negative and below-Nyquist indices of the FFT
+        frequencies to evaluate.
+    band_transform : ('dft' | 'czt' | 'fft'), optional
+        How to evaluate `frequency_index`. By default, the cheapest.
+
+    Returns
+    -------
+    fourier_coefficients : array, shape (n_windows, n_trials, n_tapers,
+                                         n_fft_samples, n_signals)
+
+    '''
+    real_dtype = np.finfo(dtype).dtype
+    n_windows, n_trials, n_signals, n_time_samples = time_windows.shape
+    n_tapers = tapers.shape[1]
+    if frequency_index is not None and band_transform is None:
+        band_transform = _get_band_transform(
+            n_time_samples, n_fft_samples, frequency_index.size)
+    if band_transform == 'dft':
+        return _multitaper_dft(
+            time_windows, tapers, n_fft_samples, sampling_frequency,
+            frequency_index, detrend_type=detrend_type, dtype=dtype,
+            tile_size=tile_size)
+    if tapered_buffer is None:
+        tapered_buffer = np.empty(
+            (n_windows, n_trials, n_tapers, n_time_samples, n_signals),
+            dtype=real_dtype)
+
+    # Scaling the tapers saves a pass over the Fourier coefficients
+    taper_weights = (tapers.T[:, :, np.newaxis] /
+                     sampling_frequency).astype(real_dtype)
+    trend_basis = _get_trend_basis(n_time_samples, detrend_type,
+                                   real_dtype)
+    time_windows = time_windows.swapaxes(-1, -2)
+
+    n_bytes_per_window = max(tapered_buffer[:1].nbytes, 1)
+    n_windows_per_tile = max(1, int(tile_size // n_bytes_per_window))
+    for tile_start in range(0, n_windows, n_windows_per_tile):
+        tile = slice(tile_start, tile_start + n_windows_per_tile)
+        detrended = time_windows[tile].astype(real_dtype)
+        detrended -= trend_basis @ (trend_basis.T @ detrended)
+        np.multiply(detrended[:, :, np.newaxis], taper_weights,
+                    out=tapered_buffer[tile])
+
+    if band_transform == 'czt':
+        return _chirp_z_transform(tapered_buffer, n_fft_samples,
+                                  frequency_index, axis=-2, dtype=dtype)
+    elif band_transform == 'fft':
+        return rfft(tapered_buffer, n=n_fft_samples, axis=-2)[
+            ..., frequency_index, :]
+    transform = rfft if is_one_sided else fft
+    return transform(tapered_buffer, n=n_fft_samples, axis=-2)
+
+
+def _get_frequency_index(n_fft_samples, sampling_frequency,
+                         frequencies_of_interest):
+    '''Index of the non-negative FFT frequencies between the lower and upper
+    (inclusive) frequencies of interest. The Nyquist frequency is left
+    out, as it is for the non-negative frequencies of a two-sided
+    transform.'''
+    frequency_index = np.arange((n_fft_samples + 1) // 2)
+    frequencies = fftfreq(n_fft_samples, 1.0 / sampling_frequency)[
+        frequency_index]
+    frequency_index = frequency_index[
+        (frequencies >= frequencies_of_interest[0]) &
+        (frequencies <= frequencies_of_interest[1])]
+    if frequency_index.size == 0:
+        raise ValueError('No FFT frequencies between {0} and {1}'.format(
+            *frequencies_of_interest))
+    return frequency_index
+
+
+def _get_band_transform(n_time_samples, n_fft_samples, n_frequencies):
+    '''Cheapest way to evaluate `n_frequencies` contiguous FFT frequencies,
+    by a rough count of the floating point operations per taper.
+
+    Returns
+    -------
+    band_transform : ('dft' | 'czt' | 'fft')
+        'dft' multiplies each window by a precomputed DFT matrix, 'czt'
+        uses a chirp-z transform and 'fft' selects the frequencies from a
+        full real-input FFT.
+
+    '''
+    n_chirp_samples = next_fast_len(n_time_samples + n_frequencies - 1)
+    n_operations = {
+        'dft': 2 * n_time_samples * n_frequencies,
+        'czt': 15 * n_chirp_samples * np.log2(max(n_chirp_samples, 2)),
+        'fft': 2.5 * n_fft_samples * np.log2(max(n_fft_samples, 2)),
+    }
+    return min(n_operations, key=n_operations.get)
+
+
+def _multitaper_dft(time_windows, tapers, n_fft_samples,
+                    sampling_frequency, frequency_index,
+                    detrend_type='constant', dtype=np.complex128,
+                    tile_size=TILE_SIZE):
+    '''Evaluates a few frequencies of the multitaper transform by matrix
+    multiplication.
+
+    Detrending, tapering and the DFT are all linear, so they are combined
+    into one (n_time_samples_per_window, n_tapers * n_frequencies) matrix
+    that is applied to a tile of windows at a time.
+
+    Returns
+    -------
+    fourier_coefficients : array, shape (n_windows, n_trials, n_tapers,
+                                         n_frequencies, n_signals)
+
+    '''
+    real_dtype = np.finfo(dtype).dtype
+    n_windows, n_trials, n_signals, n_time_samples = time_windows.shape
+    n_tapers, n_frequencies = tapers.shape[1], frequency_index.size
+
+    time_index = np.arange(n_time_samples)[:, np.newaxis]
+    dft_matrix = np.exp(-2j * np.pi * (
+        (time_index * frequency_index) % n_fft_samples) / n_fft_samples)
+    kernel = (tapers[..., np.newaxis] *
+              dft_matrix[:, np.newaxis, :]).reshape(
+        (n_time_samples, -1)) / sampling_frequency
+    trend_basis = _get_trend_basis(n_time_samples, detrend_type)
+    kernel -= trend_basis @ (trend_basis.T @ kernel)
+    real_kernel = kernel.real.astype(real_dtype)
+    imag_kernel = kernel.imag.astype(real_dtype)
+
+    fourier_coefficients = np.empty(
+        (n_windows, n_trials, n_tapers, n_frequencies, n_signals),
+        dtype=dtype)
+    n_bytes_per_window = max(
+        n_trials * n_signals * n_time_samples * real_dtype.itemsize, 1)
+    n_windows_per_tile = max(1, int(tile_size // n_bytes_per_window))
+    for tile_start in range(0, n_windows, n_windows_per_tile):
+        tile = slice(tile_start, tile_start + n_windows_per_tile)
+        windows = time_windows[tile].astype(real_dtype).reshape(
+            (-1, n_time_samples))
+        tile_shape = (-1, n_trials, n_signals, n_tapers, n_frequencies)
+        coefficients = fourier_coefficients[tile]
+        coefficients.real = (windows @ real_kernel).reshape(
+            tile_shape).transpose((0, 1, 3, 4, 2))
+        coefficients.imag = (windows @ imag_kernel).reshape(
+            tile_shape).transpose((0, 1, 3, 4, 2))
+    return fourier_coefficients
+
+
+def _chirp_z_transform(data, n_fft_samples, frequency_index, axis=-1,
+                       dtype=np.complex128):
+    '''Evaluates the DFT of `data`, zero-padded to `n_fft_samples`, at the
+    contiguous `frequency_index` with Bluestein's algorithm.
+
+    The transform is written as a convolution with a chirp, which is
+    computed with FFTs of a length that only depends on the number of
+    samples and frequencies.
+
+    '''
+    n_time_samples, n_frequencies = data.shape[axis], frequency_index.size
+    n_chirp_samples = next_fast_len(n_time_samples + n_frequencies - 1)
+
+    def _chirp(index):
+        # exp(-i pi m^2 / n_fft_samples), with m^2 reduced so the phase
+        # is exact for long transforms
+        return np.exp(-1j * np.pi * (
+            (index ** 2) % (2 * n_fft_samples)) / n_fft_samples)
+
+    time_index = np.arange(n_time_samples)
+    modulation = _chirp(time_index) * np.exp(-2j * np.pi * (
+        (frequency_index[0] * time_index) % n_fft_samples) /
+        n_fft_samples)
+    chirp_filter = np.zeros((n_chirp_samples,), dtype=np.complex128)
+    chirp_filter[:n_frequencies] = _chirp(
+        np.arange(n_frequencies)).conjugate()
+    chirp_filter[n_chirp_samples - n_time_samples + 1:] = _chirp(
+        np.arange(n_time_samples - 1, 0, -1)).conjugate()
+
+    shape = [1] * data.ndim
+    shape[axis] = -1
+    modulation = modulation.astype(dtype).reshape(shape)
+    chirp_filter = fft(chirp_filter.astype(dtype)).reshape(shape)
+    demodulation = _chirp(np.arange(n_frequencies)).astype(dtype).reshape(
+        shape)
+
+    convolution = ifft(fft(data * modulation, n=n_chirp_samples, axis=axis) *
+                       chirp_filter, axis=axis)
+    return np.take(convolution, np.arange(n_frequencies),
+                   axis=axis) * demodulation
+
+
+def _get_trend_basis(n_time_samples, detrend_type='constant',
+                     dtype=np.float64):
+    '''Orthonormal basis of the trend removed by `detrend_type`.
+
+    Subtracting the projection onto the basis gives the same result as
+    `scipy.signal.detrend`.
+
+    Returns
+    -------
+    trend_basis : array, shape (n_time_samples, n_trend_components)
+
+    '''
+    if detrend_type in ['constant', 'c']:
+        trend = np.ones((n_time_samples, 1))
+    elif detrend_type in ['linear', 'l']:
+        trend = np.stack((np.ones(n_time_samples),
+                          np.arange(n_time_samples)), axis=1)
+    else:
+        raise ValueError("Trend type must be 'linear' or 'constant'.")
+    return np.linalg.qr(trend)[0].astype(dtype)
 
 
 def _make_tapers(n_time_samples_per_window, sampling_frequency,
@@ -393,9 +867,127 @@ def tridi_inverse_iteration(d, e, w, x0=None, rtol=1e-8):
     return x0
 
 
+class TaperCache(object):
+    '''Least-recently-used cache of DPSS tapers and their eigenvalues.
+
+    Tapers are keyed by (n_time_samples_per_window,
+    time_halfbandwidth_product, n_tapers, is_low_bias). If `directory` is
+    set, the tapers are also written to and read from .npz files in that
+    directory so that they persist between processes.
+
+    Attributes
+    ----------
+    maxsize : int, optional
+        Maximum number of taper sets held in memory.
+    directory : str, optional
+        Directory of the on-disk cache. If None, tapers are only cached in
+        memory.
+    hits : int
+        Number of lookups answered from memory.
+    disk_hits : int
+        Number of lookups answered from the on-disk cache.
+    misses : int
+        Number of lookups that required computing the tapers.
+
+    '''
+
+    def __init__(self, maxsize=32, directory=None):
+        self.maxsize = maxsize
+        self.directory = directory
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return ('TaperCache(maxsize={0.maxsize!r}, '
+                'directory={0.directory!r})'.format(self))
+
+    def get(self, key, compute_tapers):
+        '''Returns the tapers and eigenvalues for `key`, calling
+        `compute_tapers` only if they are not already cached.
+
+        Parameters
+        ----------
+        key : tuple
+        compute_tapers : function
+            Takes no arguments and returns (tapers, eigenvalues).
+
+        Returns
+        -------
+        tapers, eigenvalues : tuple of arrays
+            Copies of the cached arrays so they can be safely modified.
+
+        '''
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            logger.debug('DPSS cache hit: {0}'.format(key))
+        else:
+            tapers_eigenvalues = self._load(key)
+            if tapers_eigenvalues is not None:
+                self.disk_hits += 1
+                logger.debug('DPSS disk cache hit: {0}'.format(key))
+            else:
+                self.misses += 1
+                logger.debug('DPSS cache miss: {0}'.format(key))
+                tapers_eigenvalues = compute_tapers()
+                self._save(key, tapers_eigenvalues)
+            self._cache[key] = tapers_eigenvalues
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        tapers, eigenvalues = self._cache[key]
+        return tapers.copy(), eigenvalues.copy()
+
+    def clear(self):
+        '''Empties the in-memory cache and resets the counts. Files in
+        the on-disk cache are left in place.'''
+        self._cache.clear()
+        self.hits = self.disk_hits = self.misses = 0
+
+    def cache_info(self):
+        return CacheInfo(self.hits, self.disk_hits, self.misses,
+                         self.maxsize, len(self._cache))
+
+    def _get_filename(self, key):
+        return join(self.directory, 'dpss_{0}_{1!r}_{2}_{3}.npz'.format(
+            *key))
+
+    def _load(self, key):
+        if self.directory is None:
+            return None
+        filename = self._get_filename(key)
+        if not isfile(filename):
+            return None
+        with np.load(filename) as saved:
+            return saved['tapers'], saved['eigenvalues']
+
+    def _save(self, key, tapers_eigenvalues):
+        if self.directory is None:
+            return
+        makedirs(self.directory, exist_ok=True)
+        filename = self._get_filename(key)
+        # Write to a uniquely named temporary file first so that
+        # concurrent jobs never read or publish a partially written file.
+        tapers, eigenvalues = tapers_eigenvalues
+        with NamedTemporaryFile(dir=self.directory, suffix='.tmp.npz',
+                                delete=False) as file:
+            try:
+                np.savez(file, tapers=tapers, eigenvalues=eigenvalues)
+            except BaseException:
+                file.close()
+                remove(file.name)
+                raise
+        replace(file.name, filename)
+
+
+TAPER_CACHE = TaperCache(directory=environ.get('SPECTRAL_TAPER_CACHE_DIR'))
+
+
 def dpss_windows(n_time_samples_per_window, time_halfbandwidth_product,
                  n_tapers, is_low_bias=True, interp_from=None,
-                 interp_kind='linear'):
+                 interp_kind='linear', is_cached=True,
+                 method='eigh_tridiagonal'):
     '''Compute Discrete Prolate Spheroidal Sequences.
 
     Will give of orders [0, n_tapers-1] for a given frequency-spacing
@@ -424,6 +1016,16 @@ def dpss_windows(n_time_samples_per_window, time_halfbandwidth_product,
         specifies the kind of interpolation as a string ('linear',
         'nearest', 'zero', 'slinear', 'quadratic, 'cubic') or as an integer
         specifying the order of the spline interpolator to use.
+    is_cached : bool (optional)
+        Look up the tapers in `TAPER_CACHE` before computing them. Tapers
+        computed by interpolation are never cached.
+    method : ('eigh_tridiagonal' | 'inverse_iteration') (optional)
+        How to solve the tridiagonal eigenvalue problem.
+        'eigh_tridiagonal' finds all the tapers with one LAPACK call.
+        'inverse_iteration' finds the eigenvalues with LAPACK and then
+        each taper separately by inverse iteration. This is slow but is
+        kept as the reference implementation. Both methods give the same
+        tapers to numerical precision, so they share cache entries.
 
     Returns
     -------
@@ -439,6 +1041,15 @@ def dpss_windows(n_time_samples_per_window, time_halfbandwidth_product,
 
     '''
     n_tapers = int(n_tapers)
+    if is_cached and interp_from is None:
+        key = (int(n_time_samples_per_window),
+               float(time_halfbandwidth_product), n_tapers,
+               bool(is_low_bias))
+        return TAPER_CACHE.get(key, partial(
+            dpss_windows, n_time_samples_per_window,
+            time_halfbandwidth_product, n_tapers, is_low_bias=is_low_bias,
+            is_cached=False, method=method))
+
     half_bandwidth = (float(time_halfbandwidth_product) /
                       n_time_samples_per_window)
     time_index = np.arange(n_time_samples_per_window, dtype='d')
@@ -448,7 +1059,7 @@ def dpss_windows(n_time_samples_per_window, time_halfbandwidth_product,
             interp_from, time_halfbandwidth_product, n_tapers,
             n_time_samples_per_window, interp_kind)
     else:
-        tapers = _find_tapers_from_optimization(
+        tapers = FIND_TAPERS[method](
             n_time_samples_per_window, time_index, half_bandwidth,
             n_tapers)
 
@@ -532,6 +1143,45 @@ def _find_tapers_from_optimization(n_time_samples_per_window, time_index,
     return tapers
 
 
+def _find_tapers_from_tridiagonal_eigensolver(
+        n_time_samples_per_window, time_index, half_bandwidth, n_tapers):
+    '''Solves the same tridiagonal eigenvalue problem as
+    `_find_tapers_from_optimization` but finds the eigenvectors of the
+    highest `n_tapers` eigenvalues together in one LAPACK call (bisection
+    followed by batched inverse iteration) instead of one Python-level
+    inverse iteration per taper.
+
+    Parameters
+    ----------
+    n_time_samples_per_window : int
+    time_index : array, shape (n_time_samples_per_window,)
+    half_bandwidth : float
+    n_tapers : int
+
+    Returns
+    -------
+    tapers : array, shape (n_tapers, n_time_samples_per_window)
+
+    '''
+    diagonal = (
+        ((n_time_samples_per_window - 1 - 2 * time_index) / 2.) ** 2
+        * np.cos(2 * np.pi * half_bandwidth))
+    off_diag = (
+        time_index[1:] * (n_time_samples_per_window - time_index[1:]) / 2.)
+    _, tapers = eigh_tridiagonal(
+        diagonal, off_diag, select='i',
+        select_range=(n_time_samples_per_window - n_tapers,
+                      n_time_samples_per_window - 1))
+    # Eigenvalues are returned in ascending order
+    return np.ascontiguousarray(tapers[:, ::-1].T)
+
+
+FIND_TAPERS = {
+    'eigh_tridiagonal': _find_tapers_from_tridiagonal_eigensolver,
+    'inverse_iteration': _find_tapers_from_optimization,
+}
+
+
 def _fix_taper_sign(tapers, n_time_samples_per_window):
     '''By convention (Percival and Walden, 1993 pg 379)
     symmetric tapers (k=0,2,4,...) should have a positive average and
@@ -0,0 +1,34 @@
+import numpy as np
+
+from src.spectral.array_store import ArrayStore, get_key, hash_array
+
+
+def test_hash_array():
+    array = np.arange(24.0).reshape((2, 3, 4))
+    assert hash_array(array) == hash_array(array.copy())
+    assert hash_array(array.T) == hash_array(np.ascontiguousarray(array.T))
+    assert hash_array(array) != hash_array(array.reshape((4, 3, 2)))
+    assert hash_array(array) != hash_array(array.astype(np.float32))
+    changed = array.copy()
+    changed[1, 2, 3] += 1
+    assert hash_array(array) != hash_array(changed)
+
+
+def test_get_key():
+    assert get_key(a=1, b='c') == get_key(b='c', a=1)
+    assert get_key(a=1, b='c') != get_key(a=2, b='c')
+
+
+def test_array_store(tmp_path):
+    store = ArrayStore(str(tmp_path / 'store'))
+    array = np.arange(5) + 1j
+    key = get_key(name='array')
+    assert key not in store
+    assert np.all(store.load_or_compute(key, lambda: array) == array)
+    assert key in store
+
+    def compute():
+        raise AssertionError('Stored array was computed again')
+    assert np.all(store.load_or_compute(key, compute) == array)
+    assert [path.suffix for path in (tmp_path / 'store').iterdir()] == [
+        '.npy']
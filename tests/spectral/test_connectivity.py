@@ -1,8 +1,18 @@
-import numpy as np
-from pytest import mark
-from unittest.mock import PropertyMock
+from itertools import combinations
 
-from src.spectral.connectivity import (Connectivity, _bandpass,
+import numpy as np
+from pytest import mark, raises
+from unittest.mock import PropertyMock, patch
+
+from src.spectral.minimum_phase_decomposition import (
+    minimum_phase_decomposition)
+from src.spectral.transforms import Multitaper
+
+from src.spectral.connectivity import (MAX_CACHED_MEASURES,
+                                       PHASE_SYNCHRONY_MEASURES, Connectivity,
+                                       IntermediateCache, _bandpass,
+                                       _fit_autoregressive_model,
+                                       _get_two_sided_spectrum,
                                        _complex_inner_product,
                                        _conjugate_transpose,
                                        _find_largest_independent_group,
@@ -10,10 +20,16 @@ from src.spectral.connectivity import (Connectivity, _bandpass,
                                        _get_independent_frequencies,
                                        _get_independent_frequency_step,
                                        _inner_combination,
+                                       _accumulate_phase_synchrony,
+                                       _largest_eigenvalue,
+                                       _masked_linear_regression,
                                        _remove_instantaneous_causality,
                                        _reshape, _set_diagonal_to_zero,
                                        _squared_magnitude, _total_inflow,
-                                       _total_outflow)
+                                       _total_outflow,
+                                       get_signal_pairs_between_groups,
+                                       pack_signal_pairs,
+                                       unpack_signal_pairs)
 
 
 @mark.parametrize('axis', [(0), (1), (2), (3)])
@@ -107,6 +123,31 @@ def test_n_observations(expectation_type, expected_n_observations):
     assert this_Conn.n_observations == expected_n_observations
 
 
+@mark.parametrize('expectation_type', ['trials_tapers', 'trials', 'tapers'])
+def test_expectation_cross_spectral_matrix(expectation_type):
+    np.random.seed(0)
+    shape = (2, 7, 3, 4, 5)
+    fourier_coefficients = (np.random.randn(*shape) +
+                            1j * np.random.randn(*shape))
+    this_Conn = Connectivity(
+        fourier_coefficients=fourier_coefficients,
+        expectation_type=expectation_type,
+    )
+    cross_spectral_matrix = this_Conn._cross_spectral_matrix
+    expectation = this_Conn._expectation
+
+    assert np.allclose(this_Conn._expectation_cross_spectral_matrix,
+                       expectation(cross_spectral_matrix))
+    # A budget of one byte computes one observation of one signal pair at
+    # a time
+    signal1, signal2 = np.triu_indices(shape[-1], k=1)
+    this_Conn.intermediates.clear()
+    assert np.allclose(
+        this_Conn._expectation_cross_spectra((signal1, signal2),
+                                             memory_budget=1),
+        expectation(cross_spectral_matrix)[..., signal1, signal2])
+
+
 def test_coherency():
     n_time_samples, n_trials, n_tapers, n_fft_samples, n_signals = (
         1, 30, 1, 1, 2)
@@ -531,17 +572,743 @@ def test__inner_combination():
 
 def test_directed_transfer_function():
     c = Connectivity(fourier_coefficients=np.empty((1,)))
-    type(c)._transfer_function = PropertyMock(
-        return_value=np.arange(1, 5).reshape((2, 2)))
-    dtf = c.directed_transfer_function()
+    with patch.object(Connectivity, '_transfer_function',
+                      new_callable=PropertyMock,
+                      return_value=np.arange(1, 5).reshape((2, 2))):
+        dtf = c.directed_transfer_function()
     assert np.allclose(dtf.sum(axis=-1), 1.0)
     assert np.all((dtf >= 0.0) & (dtf <= 1.0))
 
 
 def test_partial_directed_coherence():
     c = Connectivity(fourier_coefficients=np.empty((1,)))
-    type(c)._MVAR_Fourier_coefficients = PropertyMock(
-        return_value=np.arange(1, 5).reshape((2, 2)))
-    pdc = c.partial_directed_coherence()
+    with patch.object(Connectivity, '_MVAR_Fourier_coefficients',
+                      new_callable=PropertyMock,
+                      return_value=np.arange(1, 5).reshape((2, 2))):
+        pdc = c.partial_directed_coherence()
     assert np.allclose(pdc.sum(axis=-2), 1.0)
     assert np.all((pdc >= 0.0) & (pdc <= 1.0))
+
+
+@mark.parametrize('n_fft_samples', [(9), (10)])
+def test__get_two_sided_spectrum(n_fft_samples):
+    np.random.seed(0)
+    n_time_samples, n_signals = 2, 3
+    time_series = np.random.randn(n_time_samples, n_fft_samples, n_signals)
+    fourier_coefficients = np.fft.fft(time_series, axis=-2)[..., np.newaxis]
+    cross_spectral_matrix = _complex_inner_product(
+        fourier_coefficients, fourier_coefficients)
+    one_sided_spectrum = cross_spectral_matrix[
+        ..., :n_fft_samples // 2 + 1, :, :]
+
+    assert np.allclose(
+        _get_two_sided_spectrum(one_sided_spectrum, n_fft_samples),
+        cross_spectral_matrix)
+
+
+@mark.parametrize('n_time_samples', [(200), (201)])
+def test_one_sided_matches_two_sided(n_time_samples):
+    np.random.seed(0)
+    n_trials, n_signals = 10, 3
+    time_series = np.random.randn(n_time_samples, n_trials, n_signals)
+    time_series[1:, :, 1] += 0.5 * time_series[:-1, :, 0]
+    multitaper_params = dict(
+        sampling_frequency=1000, time_halfbandwidth_product=3,
+        n_time_samples_per_window=n_time_samples // 2)
+
+    two_sided = Connectivity.from_multitaper(
+        Multitaper(time_series, **multitaper_params))
+    one_sided = Connectivity.from_multitaper(
+        Multitaper(time_series, is_one_sided=True, **multitaper_params))
+
+    assert one_sided.is_one_sided and not two_sided.is_one_sided
+    assert (one_sided.fourier_coefficients.shape[-2] ==
+            two_sided.n_fft_samples // 2 + 1)
+    assert np.allclose(one_sided.frequencies, two_sided.frequencies)
+    for measure in ['power', 'coherency', 'imaginary_coherence',
+                    'phase_lag_index', 'pairwise_phase_consistency',
+                    'pairwise_spectral_granger_prediction',
+                    'directed_transfer_function',
+                    'partial_directed_coherence']:
+        assert np.allclose(getattr(one_sided, measure)(),
+                           getattr(two_sided, measure)(), equal_nan=True)
+    assert np.allclose(
+        one_sided.canonical_coherence([0, 0, 1])[0],
+        two_sided.canonical_coherence([0, 0, 1])[0], equal_nan=True)
+
+
+def test_frequencies_need_n_fft_samples():
+    fourier_coefficients = np.ones((1, 2, 1, 5, 2), dtype=complex)
+    with raises(ValueError):
+        Connectivity(fourier_coefficients, frequencies=np.arange(5))
+    with raises(ValueError):
+        Connectivity(fourier_coefficients, frequencies=np.arange(4),
+                     n_fft_samples=8)
+    with raises(ValueError):
+        Connectivity(fourier_coefficients, n_fft_samples=4)
+    assert Connectivity(fourier_coefficients, frequencies=np.arange(5),
+                        n_fft_samples=8).is_one_sided
+
+
+def test_band_limited_matches_full_spectrum():
+    np.random.seed(0)
+    n_time_samples, n_trials, n_signals = 600, 10, 3
+    time_series = np.random.randn(n_time_samples, n_trials, n_signals)
+    multitaper_params = dict(
+        sampling_frequency=1500, time_halfbandwidth_product=3,
+        n_time_samples_per_window=75)
+    frequencies_of_interest = [150, 250]
+
+    full = Connectivity.from_multitaper(
+        Multitaper(time_series, **multitaper_params))
+    band = Connectivity.from_multitaper(
+        Multitaper(time_series,
+                   frequencies_of_interest=frequencies_of_interest,
+                   **multitaper_params))
+    band_index = ((full.frequencies >= frequencies_of_interest[0]) &
+                  (full.frequencies <= frequencies_of_interest[1]))
+
+    assert band.is_band_limited and not band.is_one_sided
+    assert not full.is_band_limited
+    assert np.allclose(band.frequencies, full.frequencies[band_index])
+    assert np.allclose(band.power(), full.power()[..., band_index, :])
+    for measure in ['coherency', 'imaginary_coherence',
+                    'phase_lag_index', 'pairwise_phase_consistency']:
+        assert np.allclose(
+            getattr(band, measure)(),
+            getattr(full, measure)()[..., band_index, :, :],
+            equal_nan=True)
+    assert np.allclose(
+        band.canonical_coherence([0, 0, 1])[0],
+        full.canonical_coherence([0, 0, 1])[0][:, band_index],
+        equal_nan=True)
+    with raises(ValueError):
+        band.pairwise_spectral_granger_prediction()
+
+
+@mark.parametrize('measure', ['coherency', 'imaginary_coherence'])
+def test_positional_is_packed(measure):
+    np.random.seed(0)
+    n_time_samples, n_trials, n_signals = 400, 10, 3
+    time_series = np.random.randn(n_time_samples, n_trials, n_signals)
+    c = Connectivity.from_multitaper(
+        Multitaper(time_series, sampling_frequency=1000,
+                   n_time_samples_per_window=50))
+
+    assert np.allclose(getattr(c, measure)(True),
+                       getattr(c, measure)(is_packed=True), equal_nan=True)
+    assert getattr(c, measure)(True).shape[-2:] == (
+        c.frequencies.size, n_signals * (n_signals - 1) // 2)
+
+
+def test_single_precision():
+    np.random.seed(0)
+    n_time_samples, n_trials, n_signals = 400, 10, 3
+    time_series = np.random.randn(n_time_samples, n_trials, n_signals)
+    time_series[1:, :, 1] += 0.8 * time_series[:-1, :, 0]
+    multitaper_params = dict(
+        sampling_frequency=1000, time_halfbandwidth_product=3,
+        n_time_samples_per_window=200)
+    double = Connectivity.from_multitaper(
+        Multitaper(time_series, **multitaper_params))
+    single = Connectivity.from_multitaper(
+        Multitaper(time_series, dtype=np.complex64, **multitaper_params))
+    mixed = Connectivity.from_multitaper(
+        Multitaper(time_series, dtype=np.complex64, **multitaper_params),
+        is_mixed_precision=True)
+
+    assert single.coherency().dtype == np.complex64
+    assert single.power().dtype == np.float32
+    assert single.phase_lag_index().dtype == np.float32
+    assert np.allclose(single.coherency(), double.coherency(),
+                       atol=1e-5, equal_nan=True)
+
+    assert single._minimum_phase_factor.dtype == np.complex128
+    assert mixed._minimum_phase_factor.dtype == np.complex64
+    for c in [single, mixed]:
+        assert np.allclose(c.pairwise_spectral_granger_prediction(),
+                           double.pairwise_spectral_granger_prediction(),
+                           atol=1e-4, equal_nan=True)
+
+
+@mark.parametrize('measure, is_antisymmetric', [
+    ('coherency', False),
+    ('coherence_magnitude', False),
+    ('coherence_phase', True),
+    ('imaginary_coherence', False),
+    ('phase_locking_value', False),
+    ('phase_lag_index', True),
+    ('weighted_phase_lag_index', True),
+    ('debiased_squared_phase_lag_index', False),
+    ('debiased_squared_weighted_phase_lag_index', False),
+    ('pairwise_phase_consistency', False),
+])
+def test_packed_measures(measure, is_antisymmetric):
+    np.random.seed(0)
+    n_time_windows, n_trials, n_tapers, n_fft_samples, n_signals = (
+        2, 5, 3, 8, 4)
+    shape = (n_time_windows, n_trials, n_tapers, n_fft_samples, n_signals)
+    fourier_coefficients = (np.random.randn(*shape) +
+                            1j * np.random.randn(*shape))
+    full = getattr(Connectivity(fourier_coefficients), measure)()
+    packed = getattr(Connectivity(fourier_coefficients), measure)(
+        is_packed=True)
+    n_signal_pairs = n_signals * (n_signals - 1) // 2
+
+    assert packed.shape == full.shape[:-2] + (n_signal_pairs,)
+    assert np.allclose(packed, pack_signal_pairs(full))
+    diagonal_ind = np.arange(n_signals)
+    assert np.allclose(
+        unpack_signal_pairs(packed, is_antisymmetric=is_antisymmetric,
+                            diagonal=full[..., diagonal_ind, diagonal_ind]),
+        full, equal_nan=True)
+
+
+def test_pack_signal_pairs_order():
+    n_signals = 4
+    data = np.arange(n_signals ** 2).reshape((n_signals, n_signals))
+    expected = [data[signal1, signal2] for signal1, signal2
+                in combinations(range(n_signals), 2)]
+    assert np.allclose(pack_signal_pairs(data), expected)
+
+
+def _get_granger_test_connectivity(is_one_sided=False, n_signals=4):
+    np.random.seed(0)
+    time_series = np.random.randn(400, 10, n_signals)
+    time_series[1:, :, 1] += 0.6 * time_series[:-1, :, 0]
+    time_series[2:, :, 3] += 0.4 * time_series[:-2, :, 2]
+    m = Multitaper(time_series, sampling_frequency=500,
+                   time_halfbandwidth_product=3, time_window_duration=0.4,
+                   time_window_step=0.2, is_one_sided=is_one_sided)
+    return m.fft(), dict(frequencies=m.frequencies, time=m.time,
+                         n_fft_samples=m.n_fft_samples)
+
+
+@mark.parametrize('measure', [
+    'coherency', 'coherence_magnitude', 'imaginary_coherence',
+    'phase_locking_value', 'phase_lag_index', 'weighted_phase_lag_index',
+    'debiased_squared_phase_lag_index',
+    'debiased_squared_weighted_phase_lag_index',
+    'pairwise_phase_consistency'])
+def test_signal_pairs(measure):
+    fourier_coefficients, params = _get_granger_test_connectivity()
+    signal_pairs = (np.array([0, 1, 2, 3, 1]), np.array([1, 0, 3, 2, 3]))
+    full = getattr(Connectivity(fourier_coefficients, **params), measure)()
+    pairs = getattr(Connectivity(fourier_coefficients, **params), measure)(
+        signal_pairs=signal_pairs)
+    assert np.allclose(pairs, full[..., signal_pairs[0], signal_pairs[1]],
+                       equal_nan=True)
+
+
+def test_signal_pairs_must_be_different_signals():
+    fourier_coefficients, params = _get_granger_test_connectivity()
+    with raises(ValueError):
+        Connectivity(fourier_coefficients, **params).coherency(
+            signal_pairs=([0, 1], [0, 2]))
+
+
+def test_streaming_expectation_tiles_signal_pairs():
+    fourier_coefficients, params = _get_granger_test_connectivity()
+    c = Connectivity(fourier_coefficients, **params)
+    signal1, signal2 = np.triu_indices(fourier_coefficients.shape[-1], k=1)
+    expected = c._expectation(c._cross_spectral_matrix.imag)[
+        ..., signal1, signal2]
+    # A budget of one byte computes one signal pair at a time
+    tiled = c._streaming_expectation(
+        lambda cross_spectra: cross_spectra.imag,
+        signal_pairs=(signal1, signal2), memory_budget=1)[0]
+    assert np.allclose(tiled, expected)
+
+
+@mark.parametrize('is_one_sided', [False, True])
+def test_bivariate_spectral_granger_prediction(is_one_sided):
+    fourier_coefficients, params = _get_granger_test_connectivity(
+        is_one_sided)
+    for signal1, signal2 in [(0, 1), (2, 3)]:
+        bivariate = Connectivity(
+            fourier_coefficients[..., [signal1, signal2]],
+            **params).pairwise_spectral_granger_prediction()
+        pairs = Connectivity(
+            fourier_coefficients,
+            **params).bivariate_spectral_granger_prediction(
+            signal_pairs=([signal1, signal2], [signal2, signal1]))
+        assert np.allclose(pairs[..., 0], bivariate[..., 0, 1])
+        assert np.allclose(pairs[..., 1], bivariate[..., 1, 0])
+
+
+def test_pairwise_spectral_granger_prediction_signal_pairs():
+    fourier_coefficients, params = _get_granger_test_connectivity()
+    c = Connectivity(fourier_coefficients, **params)
+    signal1, signal2 = np.array([0, 2, 3]), np.array([1, 0, 2])
+
+    # Elements of the model of all signals, not bivariate models
+    expected = c.pairwise_spectral_granger_prediction()[
+        ..., signal1, signal2]
+    pairs = c.pairwise_spectral_granger_prediction(
+        signal_pairs=(signal1, signal2))
+    assert np.allclose(pairs, expected)
+    assert not np.allclose(
+        c.bivariate_spectral_granger_prediction(
+            signal_pairs=(signal1, signal2)), expected)
+
+
+def test_get_signal_pairs_between_groups():
+    group_labels = ['CA1', 'CA1', 'PFC', 'PFC', 'iCA1']
+    signal1, signal2 = get_signal_pairs_between_groups(
+        group_labels, 'CA1', 'PFC')
+    assert np.allclose(signal1, [0, 0, 1, 1])
+    assert np.allclose(signal2, [2, 3, 2, 3])
+    signal1, signal2 = get_signal_pairs_between_groups(
+        group_labels, 'PFC', 'PFC')
+    assert np.allclose(signal1, [2])
+    assert np.allclose(signal2, [3])
+
+
+def test_memoized_measure():
+    fourier_coefficients, params = _get_granger_test_connectivity()
+    c = Connectivity(fourier_coefficients, **params)
+    coherency = c.coherency()
+    assert c.coherency() is coherency
+    assert c.coherency(is_packed=False) is coherency
+    assert not coherency.flags.writeable
+    with raises(ValueError):
+        coherency[0] = 0
+
+    signal_pairs = (np.array([0, 1]), np.array([2, 3]))
+    pairs = c.coherency(signal_pairs=signal_pairs)
+    assert pairs is not coherency
+    assert c.coherency(signal_pairs=([0, 1], [2, 3])) is not pairs
+    assert c.coherency(
+        signal_pairs=(np.array([0, 1]), np.array([2, 3]))) is pairs
+
+    for n_pairs in range(1, MAX_CACHED_MEASURES + 1):
+        c.coherency(signal_pairs=([0] * n_pairs, [1] * n_pairs))
+    assert c.coherency() is not coherency
+    assert np.allclose(c.coherency(), coherency, equal_nan=True)
+
+    coherency = c.coherency()
+    c.clear()
+    assert c.coherency() is not coherency
+    assert c.power().flags.writeable is False
+    assert c._power.flags.writeable
+
+
+def test_phase_synchrony_expectations_are_read_only():
+    fourier_coefficients, params = _get_granger_test_connectivity()
+    c = Connectivity(fourier_coefficients, **params)
+    signal_pairs = (np.array([0, 1]), np.array([2, 3]))
+    expectations = c._phase_synchrony_expectations(signal_pairs)
+    with raises(TypeError):
+        expectations['phase'] = None
+    with raises(ValueError):
+        expectations['imaginary'][0] = 0
+    assert c._phase_synchrony_expectations(signal_pairs) is expectations
+
+
+def test_intermediate_cache():
+    cache = IntermediateCache(memory_budget=2 * 80)
+    cache['a'] = np.zeros(10)
+    cache['b'] = np.zeros(10)
+    cache['a']
+    cache['c'] = np.zeros(10)
+    assert list(cache.resident_sizes().items()) == [('a', 80), ('c', 80)]
+
+    cache.pin('a')
+    cache['d'] = np.zeros(10)
+    assert 'a' in cache and 'd' in cache and 'c' not in cache
+    assert cache.nbytes == 160
+
+    cache['e'] = np.zeros(20)
+    assert 'e' not in cache and 'd' in cache
+
+    with cache.pinned('d'):
+        cache['f'] = np.zeros(5)
+        assert 'd' in cache and 'f' not in cache
+    cache.clear()
+    assert list(cache.resident_sizes()) == ['a']
+
+
+def test_intermediate_memory_budget():
+    fourier_coefficients, params = _get_granger_test_connectivity()
+    c = Connectivity(fourier_coefficients, **params)
+    expected = c.pairwise_spectral_granger_prediction()
+    factor_size = c.intermediates.resident_sizes()['_minimum_phase_factor']
+
+    c = Connectivity(fourier_coefficients, **params,
+                     intermediate_memory_budget=factor_size)
+    assert np.allclose(c.pairwise_spectral_granger_prediction(), expected,
+                       equal_nan=True)
+    assert c.intermediates.nbytes <= factor_size
+
+
+def test_memoized_measures_count_against_memory_budget():
+    fourier_coefficients, params = _get_granger_test_connectivity()
+    c = Connectivity(fourier_coefficients, **params)
+    coherency = c.coherency()
+    coherency_size = coherency.nbytes
+
+    c = Connectivity(fourier_coefficients, **params,
+                     intermediate_memory_budget=2 * coherency_size)
+    first = c.coherency(signal_pairs=([0], [1]))
+    for _ in range(2):
+        c.coherency()
+        c.imaginary_coherence()
+    assert c.intermediates.nbytes <= 2 * coherency_size
+    assert c.coherency(signal_pairs=([0], [1])) is not first
+    assert np.allclose(c.coherency(), coherency, equal_nan=True)
+
+
+def test_minimum_phase_decomposition_workers():
+    fourier_coefficients, params = _get_granger_test_connectivity()
+    expected = Connectivity(
+        fourier_coefficients, **params).pairwise_spectral_granger_prediction()
+
+    c = Connectivity(fourier_coefficients, **params, n_workers=2,
+                     chunk_size=1)
+    with patch('src.spectral.connectivity.minimum_phase_decomposition',
+               wraps=minimum_phase_decomposition) as decomposition:
+        granger = c.pairwise_spectral_granger_prediction()
+    assert decomposition.call_args.kwargs['n_workers'] == 2
+    assert decomposition.call_args.kwargs['chunk_size'] == 1
+    assert np.allclose(granger, expected, equal_nan=True)
+
+    with patch('src.spectral.connectivity.get_workers', return_value=3), \
+            patch('src.spectral.connectivity.minimum_phase_decomposition',
+                  wraps=minimum_phase_decomposition) as decomposition:
+        Connectivity(fourier_coefficients,
+                     **params).pairwise_spectral_granger_prediction()
+    assert decomposition.call_args.kwargs['n_workers'] == 3
+
+
+def test_warm_start():
+    fourier_coefficients, params = _get_granger_test_connectivity()
+    cold = Connectivity(fourier_coefficients, **params)
+    warm = Connectivity(fourier_coefficients, **params, warm_start=True)
+    signal_pairs = ([0, 1], [1, 0])
+
+    with patch('src.spectral.connectivity.minimum_phase_decomposition',
+               wraps=minimum_phase_decomposition) as decomposition:
+        granger = warm.pairwise_spectral_granger_prediction()
+        bivariate = warm.bivariate_spectral_granger_prediction(signal_pairs)
+    assert all(call.kwargs['warm_start']
+               for call in decomposition.call_args_list)
+    assert np.nanmedian(np.abs(
+        granger - cold.pairwise_spectral_granger_prediction())) < 1E-2
+    assert np.nanmedian(np.abs(
+        bivariate - cold.bivariate_spectral_granger_prediction(
+            signal_pairs))) < 1E-2
+
+
+def test_store(tmp_path):
+    fourier_coefficients, params = _get_granger_test_connectivity()
+    expected = Connectivity(
+        fourier_coefficients, **params).pairwise_spectral_granger_prediction()
+    store = str(tmp_path)
+    Connectivity(fourier_coefficients, **params,
+                 store=store).pairwise_spectral_granger_prediction()
+
+    with patch('src.spectral.connectivity.minimum_phase_decomposition',
+               side_effect=AssertionError) as decomposition:
+        granger = Connectivity(
+            fourier_coefficients, **params,
+            store=store).pairwise_spectral_granger_prediction()
+        assert not decomposition.called
+    assert np.allclose(granger, expected, equal_nan=True)
+
+    with patch('src.spectral.connectivity.minimum_phase_decomposition',
+               side_effect=AssertionError):
+        with raises(AssertionError):
+            Connectivity(fourier_coefficients, **params, store=store,
+                         expectation_type='trials'
+                         ).pairwise_spectral_granger_prediction()
+
+
+def _get_VAR_cross_spectral_matrix(n_fft_samples=256):
+    '''Cross spectral matrix of a bivariate VAR(2) process where signal 1
+    drives signal 2.'''
+    coefficients = np.array([[[0.55, 0.0], [0.6, 0.56]],
+                             [[-0.7, 0.0], [0.0, -0.75]]])
+    noise_covariance = np.array([[1.0, 0.2], [0.2, 0.5]])
+    z = np.exp(-2j * np.pi * np.arange(n_fft_samples) / n_fft_samples)
+    transfer_function = np.linalg.inv(
+        np.eye(2) - z[:, np.newaxis, np.newaxis] * coefficients[0] -
+        z[:, np.newaxis, np.newaxis] ** 2 * coefficients[1])
+    cross_spectral_matrix = np.matmul(
+        np.matmul(transfer_function, noise_covariance),
+        _conjugate_transpose(transfer_function))
+    return coefficients, noise_covariance, cross_spectral_matrix
+
+
+def test__fit_autoregressive_model():
+    coefficients, noise_covariance, cross_spectral_matrix = (
+        _get_VAR_cross_spectral_matrix())
+    autocovariance = np.fft.ifft(cross_spectral_matrix, axis=0)[:7].real
+
+    fit_coefficients, fit_noise_covariance, order = (
+        _fit_autoregressive_model(autocovariance, n_samples=1000))
+
+    assert order == 2
+    assert np.allclose(fit_coefficients[:2], coefficients)
+    assert np.allclose(fit_coefficients[2:], 0)
+    assert np.allclose(fit_noise_covariance, noise_covariance)
+
+    # The highest order solves the Yule-Walker equations
+    autocovariance[0] += 0.1 * np.eye(2)
+    fit_coefficients, _, order = _fit_autoregressive_model(
+        autocovariance, n_samples=1000, criterion=None)
+    assert order == 6
+    lags = np.arange(6)
+    block_toeplitz = np.block([
+        [autocovariance[j - i] if j >= i else autocovariance[i - j].T
+         for j in lags] for i in lags])
+    expected = np.linalg.solve(
+        block_toeplitz.T, np.hstack(autocovariance[1:]).T).T
+    assert np.allclose(np.hstack(fit_coefficients), expected)
+
+
+@mark.parametrize('expectation_type, n_trials', [
+    ('trials_tapers', 10), ('trials', 10), ('tapers', 1)])
+def test_mvar_order_criterion_sample_size(expectation_type, n_trials):
+    np.random.seed(0)
+    time_series = np.random.randn(400, 10, 2)
+    m = Multitaper(time_series, sampling_frequency=500,
+                   n_time_samples_per_window=100, n_fft_samples=256)
+    c = Connectivity.from_multitaper(m, expectation_type=expectation_type,
+                                     spectral_factorization='mvar')
+    with patch('src.spectral.connectivity._fit_autoregressive_model',
+               wraps=_fit_autoregressive_model) as fit:
+        c._autoregressive_model
+    # The zero-padding and the tapers do not add time samples
+    assert fit.call_args.args[1] == 100 * n_trials
+
+
+def test_mvar_spectral_factorization():
+    _, noise_covariance, cross_spectral_matrix = (
+        _get_VAR_cross_spectral_matrix())
+    # Two tapers whose expected cross spectral matrix is this one
+    fourier_coefficients = np.sqrt(2) * np.linalg.cholesky(
+        cross_spectral_matrix).transpose((2, 0, 1))[np.newaxis, np.newaxis]
+    wilson = Connectivity(fourier_coefficients)
+    mvar = Connectivity(fourier_coefficients, spectral_factorization='mvar')
+
+    assert np.allclose(mvar._noise_covariance, noise_covariance)
+    assert np.allclose(mvar._noise_covariance, wilson._noise_covariance,
+                       atol=1e-5)
+    assert np.allclose(mvar._transfer_function, wilson._transfer_function,
+                       atol=1e-5)
+    assert np.allclose(mvar.pairwise_spectral_granger_prediction(),
+                       wilson.pairwise_spectral_granger_prediction(),
+                       atol=1e-5, equal_nan=True)
+    assert np.allclose(mvar.partial_directed_coherence(),
+                       wilson.partial_directed_coherence(), atol=1e-5)
+
+    with raises(ValueError):
+        Connectivity(fourier_coefficients, spectral_factorization='other')
+
+
+def test__masked_linear_regression():
+    from scipy.stats.mstats import linregress
+
+    np.random.seed(0)
+    n_points, n_fits = 10, 6
+    x = np.arange(n_points, dtype=float)[:, np.newaxis]
+    y = np.random.randn(n_points, n_fits)
+    is_included = np.random.rand(n_points, n_fits) > 0.3
+    is_included[:, 0] = False  # no points
+    is_included[:, 1] = False  # two points
+    is_included[[2, 7], 1] = True
+    y[:, 2] = 3.0  # constant response
+    is_included[:, 2] = True
+
+    slope, intercept, r_value = _masked_linear_regression(
+        x, y, is_included, axis=0)
+
+    for fit_ind in range(n_fits):
+        expected = linregress(
+            x[:, 0], np.ma.masked_array(y[:, fit_ind],
+                                        mask=~is_included[:, fit_ind]))
+        expected = np.array(expected[:3], dtype=float)
+        assert np.allclose(
+            [slope[fit_ind], intercept[fit_ind], r_value[fit_ind]],
+            expected, equal_nan=True)
+    assert np.all(np.isnan([slope[0], intercept[0], r_value[0]]))
+    assert np.allclose(np.abs(r_value[1]), 1)
+
+
+@mark.parametrize('frequency_step, min_group_size', [(1, 3), (2, 1), (3, 2)])
+def test__find_largest_independent_group_along_axis(
+        frequency_step, min_group_size):
+    np.random.seed(0)
+    is_significant = np.random.rand(4, 20, 5) < 0.6
+    is_significant[0, :, 0] = False
+    is_significant[1, :, 1] = True
+
+    expected_is_significant = np.stack(
+        [np.stack([_find_largest_independent_group(
+            is_significant[time_ind, :, pair_ind], frequency_step,
+            min_group_size=min_group_size)
+            for pair_ind in range(is_significant.shape[-1])], axis=-1)
+         for time_ind in range(is_significant.shape[0])])
+
+    assert np.array_equal(
+        _find_largest_independent_group(
+            is_significant, frequency_step, min_group_size=min_group_size,
+            axis=-2),
+        expected_is_significant)
+
+
+def test_group_delay_by_band():
+    fourier_coefficients, params = _get_granger_test_connectivity()
+    c = Connectivity(fourier_coefficients, **params)
+    frequency_bands = {'low': (10, 60), 'middle': (40, 120),
+                       'high': (150, 240)}
+
+    delay, slope, r_value = c.group_delay_by_band(
+        frequency_bands, frequency_resolution=7.5)
+    phase_slope_index = c.phase_slope_index_by_band(
+        frequency_bands, frequency_resolution=7.5)
+
+    for band_ind, band in enumerate(frequency_bands.values()):
+        expected = c.group_delay(band, frequency_resolution=7.5)
+        for measure, expected_measure in zip(
+                (delay, slope, r_value), expected):
+            assert np.allclose(measure[:, band_ind], expected_measure,
+                               equal_nan=True)
+        assert np.allclose(
+            phase_slope_index[:, band_ind],
+            c.phase_slope_index(band, frequency_resolution=7.5),
+            equal_nan=True)
+
+
+def test__inner_combination_matches_all_combinations():
+    np.random.seed(0)
+    data = np.random.randn(3, 7, 2) + 1j * np.random.randn(3, 7, 2)
+    expected_combination = sum(
+        data[:, ind1].conjugate() * data[:, ind2]
+        for ind1, ind2 in combinations(range(data.shape[1]), 2))
+
+    assert np.allclose(
+        _inner_combination(data, axis=-2), expected_combination)
+
+
+@mark.parametrize('n_trials, group_sizes', [(20, (2, 3, 1)), (1, (4, 2))])
+def test_canonical_coherence(n_trials, group_sizes):
+    np.random.seed(0)
+    n_time_samples, n_tapers, n_fft_samples = 3, 3, 8
+    group_labels = np.repeat(np.arange(len(group_sizes)), group_sizes)
+    shape = (n_time_samples, n_trials, n_tapers, n_fft_samples,
+             group_labels.size)
+    fourier_coefficients = (np.random.randn(*shape) +
+                            1j * np.random.randn(*shape))
+    c = Connectivity(fourier_coefficients,
+                     frequencies=np.fft.fftfreq(n_fft_samples),
+                     time=np.arange(n_time_samples),
+                     n_fft_samples=n_fft_samples)
+
+    # Largest singular value of the cross spectra of the orthonormalized
+    # trials and tapers of each group
+    normalized_fourier_coefficients = []
+    for label in range(len(group_sizes)):
+        U, _, V_transpose = np.linalg.svd(_reshape(
+            fourier_coefficients[..., :n_fft_samples // 2,
+                                 group_labels == label]),
+            full_matrices=False)
+        normalized_fourier_coefficients.append(np.matmul(U, V_transpose))
+    expected = np.full((n_time_samples, n_fft_samples // 2,
+                        len(group_sizes), len(group_sizes)), np.nan)
+    for group1, group2 in combinations(range(len(group_sizes)), 2):
+        expected[..., group1, group2] = expected[..., group2, group1] = (
+            np.linalg.svd(_complex_inner_product(
+                normalized_fourier_coefficients[group1],
+                normalized_fourier_coefficients[group2]),
+                compute_uv=False)[..., 0] ** 2)
+
+    canonical_coherence, labels = c.canonical_coherence(group_labels)
+    assert np.allclose(labels, np.arange(len(group_sizes)))
+    assert np.allclose(canonical_coherence, expected, equal_nan=True)
+    assert np.allclose(
+        c.canonical_coherence(group_labels, memory_budget=1)[0],
+        canonical_coherence, equal_nan=True)
+
+
+def test__largest_eigenvalue():
+    np.random.seed(0)
+    matrix = np.random.randn(5, 4, 3, 3) + 1j * np.random.randn(5, 4, 3, 3)
+    matrix = _complex_inner_product(matrix, matrix)
+    matrix[0, 0] = 0
+    matrix[0, 1] = np.eye(3)
+
+    assert np.allclose(_largest_eigenvalue(matrix),
+                       np.linalg.eigvalsh(matrix)[..., -1])
+    assert np.allclose(_largest_eigenvalue(matrix, max_iterations=1),
+                       np.linalg.eigvalsh(matrix)[..., -1])
+
+
+@mark.parametrize('expectation_type', ['trials_tapers', 'trials', 'tapers'])
+def test_phase_synchrony(expectation_type):
+    np.random.seed(0)
+    n_time_samples, n_trials, n_tapers, n_fft_samples, n_signals = (
+        2, 6, 3, 8, 3)
+    shape = (n_time_samples, n_trials, n_tapers, n_fft_samples, n_signals)
+    fourier_coefficients = (np.random.randn(*shape) +
+                            1j * np.random.randn(*shape))
+    c = Connectivity(fourier_coefficients,
+                     expectation_type=expectation_type)
+    expectation_axes = {'trials_tapers': (1, 2), 'trials': 1,
+                        'tapers': 2}[expectation_type]
+    n_observations = np.prod(
+        [shape[axis] for axis in np.atleast_1d(expectation_axes)])
+
+    non_negative_coefficients = fourier_coefficients[
+        ..., :(n_fft_samples + 1) // 2, :]
+    cross_spectral_matrix = (
+        non_negative_coefficients[..., :, np.newaxis] *
+        non_negative_coefficients[..., np.newaxis, :].conjugate())
+    imaginary = cross_spectral_matrix.imag
+    phase_locking_value = np.mean(
+        cross_spectral_matrix / np.abs(cross_spectral_matrix),
+        axis=expectation_axes)
+    phase_lag_index = np.mean(np.sign(imaginary), axis=expectation_axes)
+    imaginary_sum = np.sum(imaginary, axis=expectation_axes)
+    imaginary_magnitude_sum = np.sum(np.abs(imaginary),
+                                     axis=expectation_axes)
+    squared_imaginary_sum = np.sum(imaginary ** 2, axis=expectation_axes)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        debiased_squared_weighted_phase_lag_index = (
+            (imaginary_sum ** 2 - squared_imaginary_sum) /
+            (imaginary_magnitude_sum ** 2 - squared_imaginary_sum))
+    weights = imaginary_magnitude_sum.copy()
+    weights[weights == 0] = 1
+    expected = {
+        'phase_locking_value': phase_locking_value,
+        'phase_lag_index': phase_lag_index,
+        'weighted_phase_lag_index': imaginary_sum / weights,
+        'debiased_squared_phase_lag_index': (
+            (n_observations * phase_lag_index ** 2 - 1.0) /
+            (n_observations - 1.0)),
+        'debiased_squared_weighted_phase_lag_index': (
+            debiased_squared_weighted_phase_lag_index),
+        'pairwise_phase_consistency': (
+            (np.abs(phase_locking_value * n_observations) ** 2 -
+             n_observations) / (n_observations ** 2 - n_observations)),
+    }
+
+    with patch('src.spectral.connectivity._accumulate_phase_synchrony',
+               wraps=_accumulate_phase_synchrony) as accumulate:
+        phase_synchrony = c.phase_synchrony()
+        for measure in PHASE_SYNCHRONY_MEASURES:
+            getattr(c, measure)()
+    assert accumulate.call_count == 1
+
+    signal_pairs = (np.array([0, 2, 1]), np.array([1, 0, 2]))
+    pairs = c.phase_synchrony(signal_pairs=signal_pairs)
+    for measure in PHASE_SYNCHRONY_MEASURES:
+        assert np.allclose(phase_synchrony[measure], expected[measure],
+                           equal_nan=True)
+        assert np.allclose(
+            pairs[measure],
+            expected[measure][..., signal_pairs[0], signal_pairs[1]],
+            equal_nan=True)
+
+    with raises(ValueError):
+        c.phase_synchrony(measures=['coherency'])
@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+from pytest import mark, param, raises
+
+from src.spectral import fft_backend
+from src.spectral.fft_backend import (_PLANS, clear_plans, fft, get_backend,
+                                      get_workers, ifft, next_fast_len,
+                                      rfft, set_backend)
+
+BACKENDS = ['scipy', param('pyfftw', marks=mark.skipif(
+    fft_backend.pyfftw is None, reason='pyFFTW not installed'))]
+
+
+@mark.parametrize('backend', BACKENDS)
+@mark.parametrize('n', [None, 7, 16])
+def test_transforms_match_numpy(backend, n):
+    np.random.seed(0)
+    x = np.random.randn(3, 10, 2) + 1j * np.random.randn(3, 10, 2)
+
+    assert np.allclose(fft(x, n=n, axis=-2, backend=backend),
+                       np.fft.fft(x, n=n, axis=-2))
+    assert np.allclose(ifft(x, n=n, axis=1, backend=backend),
+                       np.fft.ifft(x, n=n, axis=1))
+    assert np.allclose(rfft(x.real, n=n, axis=-2, backend=backend),
+                       np.fft.rfft(x.real, n=n, axis=-2))
+
+
+@mark.parametrize('dtype', [np.float64, np.float32])
+def test_fftpack_fallback(monkeypatch, dtype):
+    monkeypatch.setattr(fft_backend, 'scipy_fft', None)
+    np.random.seed(0)
+    x = np.random.randn(3, 10, 2).astype(dtype)
+    complex_dtype = np.result_type(x, np.complex64)
+
+    for kind, expected in [('fft', np.fft.fft(x, n=16, axis=-2)),
+                           ('ifft', np.fft.ifft(x, n=16, axis=-2)),
+                           ('rfft', np.fft.rfft(x, n=16, axis=-2))]:
+        transformed = getattr(fft_backend, kind)(
+            x, n=16, axis=-2, backend='scipy', workers=2)
+        assert transformed.dtype == complex_dtype
+        assert np.allclose(transformed, expected, atol=1e-5)
+
+
+@mark.skipif(fft_backend.pyfftw is None, reason='pyFFTW not installed')
+def test_pyfftw_reuses_plans():
+    clear_plans()
+    x = np.random.randn(4, 8)
+    first = fft(x, backend='pyfftw', workers=2)
+    second = fft(2 * x, backend='pyfftw', workers=2)
+    assert len(_PLANS) == 1
+    assert np.allclose(2 * first, second)
+
+
+def test_backend_selection(monkeypatch):
+    monkeypatch.setenv('SPECTRAL_FFT_WORKERS', '3')
+    assert get_workers() == 3
+    assert get_workers(2) == 2
+
+    monkeypatch.setenv('SPECTRAL_FFT_BACKEND', 'scipy')
+    assert get_backend() == 'scipy'
+    set_backend('scipy', workers=5)
+    assert get_workers() == 5
+    set_backend()
+    assert get_workers() == 3
+
+    with raises(ValueError):
+        set_backend('not_a_backend')
+
+
+def test_default_workers_respect_cpu_affinity(monkeypatch):
+    monkeypatch.delenv('SPECTRAL_FFT_WORKERS', raising=False)
+    monkeypatch.setattr(os, 'sched_getaffinity', lambda pid: {0, 2},
+                        raising=False)
+    assert get_workers() == 2
+    monkeypatch.delattr(os, 'sched_getaffinity')
+    assert get_workers() == 1
+
+
+@mark.parametrize('target, expected_length', [(7, 8), (30, 30), (97, 100)])
+def test_next_fast_len(target, expected_length):
+    assert next_fast_len(target) == expected_length
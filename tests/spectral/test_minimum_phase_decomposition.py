@@ -1,7 +1,11 @@
+from unittest.mock import patch
+
 import numpy as np
 from scipy.fftpack import fft, ifft
+from pytest import mark
 from scipy.signal import freqz_zpk
 
+from src.spectral import fft_backend
 from src.spectral.minimum_phase_decomposition import (_check_convergence,
                                                       _conjugate_transpose,
                                                       _get_causal_signal,
@@ -111,3 +115,117 @@ def test_minimum_phase_decomposition():
     assert np.allclose(minimum_phase_factor, expected_minimum_phase_factor)
     assert np.allclose(
         cross_spectral_matrix, expected_cross_spectral_matrix)
+
+
+def test_minimum_phase_decomposition_single_precision():
+    n_signals = 1
+    _, transfer_function = freqz_zpk(0.25, 0.50, 1.00, whole=True)
+    n_fft_samples = transfer_function.shape[0]
+    expected_minimum_phase_factor = np.zeros(
+        (1, n_fft_samples, n_signals, n_signals), dtype=np.complex64)
+    expected_minimum_phase_factor[0, :, 0, 0] = transfer_function
+    cross_spectral_matrix = np.matmul(
+        expected_minimum_phase_factor,
+        _conjugate_transpose(expected_minimum_phase_factor))
+
+    minimum_phase_factor = minimum_phase_decomposition(
+        cross_spectral_matrix)
+
+    assert minimum_phase_factor.dtype == np.complex64
+    assert np.allclose(minimum_phase_factor, expected_minimum_phase_factor,
+                       atol=1e-4)
+
+
+def test_minimum_phase_decomposition_n_iterations():
+    '''Time points that converge early stop iterating without changing
+    the factor of the others.'''
+    n_signals = 1
+    _, transfer_function = freqz_zpk(0.25, 0.50, 1.00, whole=True)
+    n_fft_samples = transfer_function.shape[0]
+    minimum_phase_factor = np.ones(
+        (3, n_fft_samples, n_signals, n_signals), dtype=np.complex128)
+    minimum_phase_factor[1, :, 0, 0] = transfer_function
+    minimum_phase_factor[2, :, 0, 0] = 2
+    cross_spectral_matrix = np.matmul(
+        minimum_phase_factor, _conjugate_transpose(minimum_phase_factor))
+
+    factor, n_iterations = minimum_phase_decomposition(
+        cross_spectral_matrix, return_n_iterations=True)
+
+    assert n_iterations.shape == (3,)
+    assert n_iterations[0] < n_iterations[1]
+    assert n_iterations[2] < n_iterations[1]
+    assert np.allclose(factor, minimum_phase_factor)
+    assert np.allclose(
+        factor[1:2], minimum_phase_decomposition(cross_spectral_matrix[1:2]))
+
+
+def test_minimum_phase_decomposition_warm_start():
+    '''A slowly changing spectrum converges in fewer iterations to the
+    same factor when started from the neighboring time point.'''
+    n_time_points, n_fft_samples = 20, 64
+    z = np.exp(-2j * np.pi * np.fft.fftfreq(n_fft_samples))
+    coupling = np.linspace(0, 0.5, n_time_points)
+    transfer_function = np.zeros(
+        (n_time_points, n_fft_samples, 2, 2), dtype=np.complex128)
+    transfer_function[..., 0, 0] = 1 / (1 - 0.6 * z)
+    transfer_function[..., 1, 1] = 1 / (1 - 0.4 * z)
+    transfer_function[..., 1, 0] = (
+        coupling[:, np.newaxis] * z * transfer_function[..., 0, 0] *
+        transfer_function[..., 1, 1])
+    cross_spectral_matrix = np.matmul(
+        transfer_function, _conjugate_transpose(transfer_function))
+
+    cold_factor, cold_n_iterations = minimum_phase_decomposition(
+        cross_spectral_matrix, return_n_iterations=True)
+    warm_factor, warm_n_iterations = minimum_phase_decomposition(
+        cross_spectral_matrix, return_n_iterations=True, warm_start=True,
+        block_size=4)
+
+    assert np.allclose(warm_factor, cold_factor, atol=1e-6)
+    assert np.all(warm_n_iterations[::4] == cold_n_iterations[::4])
+    assert warm_n_iterations.sum() < cold_n_iterations.sum()
+
+
+@mark.parametrize('n_workers, chunk_size', [(1, 3), (2, None), (3, 2)])
+@mark.parametrize('warm_start', [False, True])
+def test_minimum_phase_decomposition_in_chunks(n_workers, chunk_size,
+                                               warm_start):
+    np.random.seed(0)
+    n_time_points, n_fft_samples, n_signals = 7, 32, 3
+    fourier_coefficients = (
+        np.random.randn(n_time_points, 20, n_fft_samples, n_signals) +
+        1j * np.random.randn(n_time_points, 20, n_fft_samples, n_signals))
+    cross_spectral_matrix = np.mean(
+        fourier_coefficients[..., :, np.newaxis] *
+        fourier_coefficients[..., np.newaxis, :].conj(), axis=1)
+
+    expected = minimum_phase_decomposition(
+        cross_spectral_matrix, warm_start=warm_start, block_size=3)
+    minimum_phase_factor = minimum_phase_decomposition(
+        cross_spectral_matrix, warm_start=warm_start, block_size=3,
+        n_workers=n_workers, chunk_size=chunk_size)
+
+    assert np.array_equal(minimum_phase_factor, expected)
+
+
+@mark.parametrize('n_workers, fft_workers', [(1, 4), (2, 2), (3, 1)])
+def test_minimum_phase_decomposition_splits_fft_workers(n_workers,
+                                                        fft_workers):
+    np.random.seed(0)
+    n_time_points, n_fft_samples, n_signals = 6, 16, 2
+    fourier_coefficients = (
+        np.random.randn(n_time_points, 20, n_fft_samples, n_signals) +
+        1j * np.random.randn(n_time_points, 20, n_fft_samples, n_signals))
+    cross_spectral_matrix = np.mean(
+        fourier_coefficients[..., :, np.newaxis] *
+        fourier_coefficients[..., np.newaxis, :].conj(), axis=1)
+
+    with patch('src.spectral.minimum_phase_decomposition.get_workers',
+               return_value=4), \
+            patch('src.spectral.minimum_phase_decomposition.fft',
+                  wraps=fft_backend.fft) as fft_mock:
+        minimum_phase_decomposition(
+            cross_spectral_matrix, n_workers=n_workers, chunk_size=2)
+    assert {call.kwargs['workers'] for call in fft_mock.call_args_list} == {
+        fft_workers}
@@ -1,14 +1,19 @@
+from functools import partial
+
 import numpy as np
-from pytest import mark
-from scipy.signal import correlate
+from pytest import mark, raises
+from scipy.signal import correlate, detrend
 
 from nitime.algorithms.spectral import dpss_windows as nitime_dpss_windows
-from src.spectral.transforms import (Multitaper, _add_axes,
+from src.spectral.transforms import (Multitaper, TaperCache, _add_axes,
                                      _auto_correlation, _fix_taper_sign,
+                                     _fused_multitaper_fft,
+                                     _get_decimation_factor,
+                                     _get_frequency_index,
                                      _get_low_bias_tapers,
                                      _get_taper_eigenvalues,
                                      _multitaper_fft, _sliding_window,
-                                     dpss_windows)
+                                     dpss_windows, ragged_multitaper_fft)
 
 
 def test__add_axes():
@@ -246,13 +251,15 @@ def test__fix_taper_sign():
 
 
 @mark.parametrize(
-    'n_time_samples, time_halfbandwidth_product, n_tapers',
-    [(1000, 3, 5), (31, 6, 4), (31, 7, 4)])
+    'n_time_samples, time_halfbandwidth_product, n_tapers, method',
+    [(1000, 3, 5, 'eigh_tridiagonal'), (31, 6, 4, 'eigh_tridiagonal'),
+     (31, 7, 4, 'eigh_tridiagonal'), (1000, 3, 5, 'inverse_iteration'),
+     (31, 6, 4, 'inverse_iteration')])
 def test_dpss_windows(
-        n_time_samples, time_halfbandwidth_product, n_tapers):
+        n_time_samples, time_halfbandwidth_product, n_tapers, method):
     tapers, eigenvalues = dpss_windows(
         n_time_samples, time_halfbandwidth_product, n_tapers,
-        is_low_bias=False)
+        is_low_bias=False, is_cached=False, method=method)
     nitime_tapers, nitime_eigenvalues = nitime_dpss_windows(
         n_time_samples, time_halfbandwidth_product, n_tapers)
     assert np.allclose(np.sum(tapers ** 2, axis=1), 1.0)
@@ -300,6 +307,99 @@ def test__multitaper_fft():
         (n_windows, n_trials, n_fft_samples, n_tapers))
 
 
+@mark.parametrize('detrend_type', ['constant', 'linear'])
+@mark.parametrize('is_one_sided', [False, True])
+def test__fused_multitaper_fft(detrend_type, is_one_sided):
+    n_windows, n_trials, n_signals, n_time_samples, n_tapers = (
+        7, 3, 2, 75, 5)
+    n_fft_samples, sampling_frequency = 128, 1500
+    time_windows = (np.random.randn(
+        n_windows, n_trials, n_signals, n_time_samples) +
+        np.arange(n_time_samples))
+    tapers = np.random.randn(n_time_samples, n_tapers)
+
+    expected = _multitaper_fft(
+        tapers, detrend(time_windows, type=detrend_type), n_fft_samples,
+        sampling_frequency, is_one_sided=is_one_sided).swapaxes(2, -1)
+    # A small tile size splits the windows over several tiles
+    fourier_coefficients = _fused_multitaper_fft(
+        time_windows, tapers, n_fft_samples, sampling_frequency,
+        detrend_type=detrend_type, is_one_sided=is_one_sided,
+        tile_size=1000)
+
+    assert fourier_coefficients.flags.c_contiguous
+    assert np.allclose(fourier_coefficients, expected)
+
+
+@mark.parametrize('band_transform', ['dft', 'czt', 'fft', None])
+@mark.parametrize('n_fft_samples', [75, 512])
+def test_band_limited_fft(band_transform, n_fft_samples):
+    time_series = np.random.randn(1500, 3, 2)
+    multitaper_params = dict(
+        sampling_frequency=1500, time_halfbandwidth_product=3,
+        n_time_samples_per_window=75, n_fft_samples=n_fft_samples,
+        detrend_type='linear')
+    full = Multitaper(time_series, **multitaper_params)
+    band = Multitaper(time_series, frequencies_of_interest=[150, 250],
+                      **multitaper_params)
+    frequency_index = _get_frequency_index(n_fft_samples, 1500, [150, 250])
+    expected = full.fft()[..., frequency_index, :]
+
+    fourier_coefficients = _fused_multitaper_fft(
+        band._time_windows(), band.tapers, n_fft_samples, 1500,
+        detrend_type='linear', frequency_index=frequency_index,
+        band_transform=band_transform, tile_size=1000)
+
+    assert np.all((band.frequencies >= 150) & (band.frequencies <= 250))
+    assert np.allclose(band.frequencies, full.frequencies[frequency_index])
+    assert np.allclose(fourier_coefficients, expected)
+
+
+def test__get_frequency_index():
+    # The Nyquist frequency is left out
+    assert np.allclose(_get_frequency_index(10, 10, [3, 5]), [3, 4])
+    assert np.allclose(_get_frequency_index(11, 11, [3, 6]), [3, 4, 5])
+    with raises(ValueError):
+        _get_frequency_index(10, 10, [3.2, 3.8])
+
+
+@mark.parametrize(
+    'sampling_frequency, max_frequency_of_interest, expected_factor',
+    [(1500, 100, 6), (1500, 12, 50), (1500, 600, 1), (1500, 1000, 1)])
+def test__get_decimation_factor(sampling_frequency,
+                                max_frequency_of_interest, expected_factor):
+    assert _get_decimation_factor(
+        sampling_frequency, max_frequency_of_interest) == expected_factor
+
+
+def test_decimated_multitaper():
+    sampling_frequency, frequency = 1500, 40
+    time = np.arange(0, 10, 1 / sampling_frequency)
+    # The 400 Hz component aliases to 100 Hz without the low-pass filter
+    time_series = (np.sin(2 * np.pi * frequency * time) +
+                   np.sin(2 * np.pi * 400 * time))
+    multitaper_params = dict(
+        sampling_frequency=sampling_frequency, time_window_duration=0.5,
+        time_window_step=0.5, time_halfbandwidth_product=1)
+    full = Multitaper(time_series, **multitaper_params)
+    decimated = Multitaper(time_series, max_frequency_of_interest=100,
+                           **multitaper_params)
+
+    assert decimated.decimation_factor == 6
+    assert decimated.sampling_frequency == sampling_frequency / 6
+    assert np.allclose(decimated.time, full.time)
+    assert np.allclose(decimated.frequencies[:decimated.n_fft_samples // 2],
+                       full.frequencies[:decimated.n_fft_samples // 2])
+
+    power = np.mean(np.abs(decimated.fft()) ** 2, axis=(0, 1, 2, 4))
+    full_power = np.mean(np.abs(full.fft()) ** 2, axis=(0, 1, 2, 4))
+    frequency_index = np.flatnonzero(decimated.frequencies == frequency)
+    assert np.argmax(power) == frequency_index
+    assert np.allclose(power[frequency_index], full_power[frequency_index],
+                       rtol=1e-2)
+    assert power[decimated.frequencies == 100] < 1e-3 * power.max()
+
+
 def test_fft():
     n_time_samples, n_trials, n_signals, n_windows = 100, 10, 2, 1
     time_series = np.zeros((n_time_samples, n_trials, n_signals))
@@ -308,3 +408,138 @@ def test_fft():
         m.fft().shape,
         (n_windows, n_trials, m.tapers.shape[1], m.n_fft_samples,
          n_signals))
+
+
+@mark.parametrize(
+    'n_time_samples, time_halfbandwidth_product, n_tapers',
+    [(30, 1, 1), (1000, 3, 5), (20000, 4, 7)])
+def test_dpss_windows_methods_agree(
+        n_time_samples, time_halfbandwidth_product, n_tapers):
+    tapers, eigenvalues = dpss_windows(
+        n_time_samples, time_halfbandwidth_product, n_tapers,
+        is_low_bias=False, is_cached=False, method='eigh_tridiagonal')
+    expected_tapers, expected_eigenvalues = dpss_windows(
+        n_time_samples, time_halfbandwidth_product, n_tapers,
+        is_low_bias=False, is_cached=False, method='inverse_iteration')
+    assert np.allclose(tapers, expected_tapers)
+    assert np.allclose(eigenvalues, expected_eigenvalues)
+
+
+def test_dpss_windows_cache():
+    cache = TaperCache(maxsize=2)
+    key = (100, 3.0, 5, False)
+    compute_tapers = partial(
+        dpss_windows, 100, 3, 5, is_low_bias=False, is_cached=False)
+
+    tapers, eigenvalues = cache.get(key, compute_tapers)
+    tapers[:] = 0
+    cached_tapers, cached_eigenvalues = cache.get(key, compute_tapers)
+    expected_tapers, expected_eigenvalues = compute_tapers()
+
+    assert np.allclose(cached_tapers, expected_tapers)
+    assert np.allclose(cached_eigenvalues, expected_eigenvalues)
+    assert cache.cache_info() == (1, 0, 1, 2, 1)
+
+    cache.get((50, 3.0, 5, False), partial(
+        dpss_windows, 50, 3, 5, is_low_bias=False, is_cached=False))
+    cache.get((25, 3.0, 5, False), partial(
+        dpss_windows, 25, 3, 5, is_low_bias=False, is_cached=False))
+    assert key not in cache._cache
+    assert cache.cache_info().currsize == 2
+
+
+def test_dpss_windows_disk_cache(tmpdir):
+    key = (100, 3.0, 5, True)
+    compute_tapers = partial(
+        dpss_windows, 100, 3, 5, is_low_bias=True, is_cached=False)
+    TaperCache(directory=str(tmpdir)).get(key, compute_tapers)
+
+    cache = TaperCache(directory=str(tmpdir))
+    tapers, eigenvalues = cache.get(key, compute_tapers)
+    expected_tapers, expected_eigenvalues = compute_tapers()
+
+    assert np.allclose(tapers, expected_tapers)
+    assert np.allclose(eigenvalues, expected_eigenvalues)
+    assert cache.cache_info() == (0, 1, 0, 32, 1)
+    assert [path.basename for path in tmpdir.listdir()] == [
+        cache._get_filename(key).split('/')[-1]]
+
+
+@mark.parametrize('n_windows_per_block', [1, 3, 10, 100])
+def test_iter_fft(n_windows_per_block):
+    np.random.seed(0)
+    n_time_samples, n_trials, n_signals = 1000, 3, 2
+    time_series = np.random.randn(n_time_samples, n_trials, n_signals)
+    m = Multitaper(time_series, time_halfbandwidth_product=3,
+                   n_time_samples_per_window=100,
+                   n_time_samples_per_step=50)
+    blocks = list(m.iter_fft(n_windows_per_block=n_windows_per_block))
+
+    assert all(block.shape[0] <= n_windows_per_block for block in blocks)
+    assert np.allclose(np.concatenate(blocks), m.fft())
+
+
+def test_iter_fft_memory_budget():
+    n_time_samples, n_trials, n_signals = 1000, 3, 2
+    time_series = np.zeros((n_time_samples, n_trials, n_signals))
+    m = Multitaper(time_series, time_halfbandwidth_product=3,
+                   n_time_samples_per_window=100)
+    blocks = list(m.iter_fft(memory_budget=0))
+    assert len(blocks) == m.time.size
+    blocks = list(m.iter_fft(memory_budget=2 ** 40))
+    assert len(blocks) == 1
+
+
+@mark.parametrize('n_fft_samples', [100, 101])
+def test_one_sided_fft(n_fft_samples):
+    np.random.seed(0)
+    n_time_samples, n_trials, n_signals = 100, 10, 2
+    time_series = np.random.randn(n_time_samples, n_trials, n_signals)
+    two_sided = Multitaper(time_series, n_fft_samples=n_fft_samples)
+    one_sided = Multitaper(time_series, n_fft_samples=n_fft_samples,
+                           is_one_sided=True)
+    n_frequencies = n_fft_samples // 2 + 1
+
+    assert one_sided.frequencies.size == n_frequencies
+    assert np.allclose(one_sided.frequencies,
+                       np.abs(two_sided.frequencies[:n_frequencies]))
+    assert np.allclose(one_sided.fft(),
+                       two_sided.fft()[..., :n_frequencies, :])
+
+
+@mark.parametrize('is_one_sided', [False, True])
+def test_single_precision_fft(is_one_sided):
+    np.random.seed(0)
+    n_time_samples, n_trials, n_signals = 100, 10, 2
+    time_series = np.random.randn(n_time_samples, n_trials, n_signals)
+    m_double = Multitaper(time_series, is_one_sided=is_one_sided)
+    m_single = Multitaper(time_series, is_one_sided=is_one_sided,
+                          dtype=np.complex64)
+    fourier_coefficients = m_single.fft()
+
+    assert fourier_coefficients.dtype == np.complex64
+    assert np.allclose(fourier_coefficients, m_double.fft(), atol=1e-5)
+
+
+@mark.parametrize('multitaper_params', [
+    dict(time_halfbandwidth_product=2),
+    dict(time_halfbandwidth_product=1, time_window_duration=0.020,
+         time_window_step=0.010, detrend_type='linear'),
+])
+def test_ragged_multitaper_fft(multitaper_params):
+    n_signals = 3
+    segment_lengths = [60, 45, 60, 90, 45]
+    segment_offsets = np.cumsum([0] + segment_lengths)
+    time_series = np.random.randn(segment_offsets[-1], n_signals)
+
+    fourier_coefficients, frequencies = ragged_multitaper_fft(
+        time_series, segment_offsets, sampling_frequency=1500,
+        **multitaper_params)
+
+    assert len(fourier_coefficients) == len(segment_lengths)
+    for segment_ind, (start, end) in enumerate(
+            zip(segment_offsets[:-1], segment_offsets[1:])):
+        m = Multitaper(time_series[start:end], sampling_frequency=1500,
+                       **multitaper_params)
+        assert np.allclose(fourier_coefficients[segment_ind], m.fft())
+        assert np.allclose(frequencies[segment_ind], m.frequencies)